@@ -3,22 +3,46 @@
 提供可视化编辑书籍位置、书名和字体样式的功能
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import (Flask, Response, g, render_template, request, jsonify, send_file, send_from_directory,
+                   stream_with_context)
 from flask_cors import CORS  # 支持跨域请求（GitHub Pages 需要）
+import base64
+import hashlib
 import json
+import math
 import os
 import re
+import threading
+import time
 from book_database import BookDatabase
+import book_assets
+import compression
+import events
+import metrics
+import popularity
+import prefetch
+import preview_cache
+import profiling
+from logs import get_logger, debug_sampled
+import render_pool
+import shelves
+import static_assets
+import tiles
+from catalogue import (DB_FILE, CatalogueConflict, load_catalogue, changed_since,
+                       apply_book_update, apply_book_delete, catalogue_transaction)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = '.'
+logger = get_logger(__name__)
 
 # 启用 CORS（允许 GitHub Pages 访问 API）
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",  # 允许所有来源（生产环境可以限制为特定域名）
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "If-Match", "If-None-Match",
+                          "X-Profile", "X-Profile-Token"],
+        "expose_headers": ["ETag", "X-Catalogue-Version", "X-Profile-Id", "X-Profile-Url"]
     }
 })
 
@@ -35,6 +59,127 @@ display_settings = {
     'white_block_opacity': 0.6
 }
 
+# GET /api/books 支持返回的字段
+BOOK_FIELDS = ['position', 'shelf', 'full_name', 'points']
+# 分页时每页最多返回的书籍数
+MAX_PAGE_SIZE = 1000
+# 书架图片（/bookshelf.jpg 和预览渲染使用，可指向合成图片，见 synthetic_data.py）
+SHELF_IMAGE = os.environ.get('BOOKSHELF_IMAGE', 'bookshelf.jpg')
+# 预览输出尺寸上限的取值范围（像素）
+MIN_PREVIEW_SIZE = 64
+MAX_PREVIEW_SIZE = 8192
+# 每个推送连接（SSE）的最长时间（秒），到时后浏览器会带上 Last-Event-ID 自动重连
+EVENTS_STREAM_SECONDS = int(os.environ.get('EVENTS_STREAM_SECONDS', 55))
+# 每个 worker 同时保持的推送连接数上限（每个连接占用一个 worker 线程），
+# 默认为 gunicorn 线程数的 1/4，其余线程留给搜索、书籍列表等请求；超过时浏览器改为轮询
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS',
+                                        max(1, int(os.environ.get('GUNICORN_THREADS', 16)) // 4)))
+# 推送连接数已满时浏览器轮询 /api/events 的间隔（毫秒，页面在后台时加倍）
+EVENTS_POLL_MS = int(os.environ.get('EVENTS_POLL_MS', 2000))
+
+_event_streams = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
+
+def _profile_token():
+    """管理员令牌只从请求头读取（X-Profile-Token 或 Authorization: Bearer），查询参数会留在访问日志中"""
+    token = request.headers.get('X-Profile-Token')
+    if token:
+        return token
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer':
+        return credentials.strip()
+    return ''
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    profiling.ensure_rolling_sampler()
+    prefetch.ensure_prefetcher()
+    # 带上 X-Profile: 1（或 ?profile=1）和管理员令牌头的请求在剖析下执行
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    if flag in ('1', 'true') and profiling.token_valid(_profile_token()):
+        profiling.start_request(f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_latency(response):
+    """按路由模板（而不是具体URL）记录请求耗时，避免书名等参数造成指标数量膨胀"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(request.method, route, response.status_code,
+                                time.perf_counter() - started)
+    profile_name = profiling.finish_request()
+    if profile_name:
+        response.headers['X-Profile-Id'] = profile_name
+        response.headers['X-Profile-Url'] = f"/api/profiles/{profile_name}"
+    return response
+
+@app.after_request
+def compress_response(response):
+    """超过 COMPRESS_MIN_SIZE 的 JSON/HTML 响应按 Accept-Encoding 即时压缩（见 compression.py）"""
+    return compression.compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    # 请求异常结束、没有经过 after_request 时也要停止采样
+    profiling.finish_request()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 指标（汇总所有 gunicorn worker 和渲染进程）"""
+    body, content_type = metrics.export()
+    if body is None:
+        return jsonify({'error': '指标不可用: prometheus_client 未安装'}), 503
+    return Response(body, content_type=content_type)
+
+@app.route('/api/profiles')
+def list_profiles():
+    """已保存的单个请求剖析结果（需要管理员令牌）"""
+    if not profiling.token_valid(_profile_token()):
+        return jsonify({'error': '需要管理员令牌'}), 403
+    return jsonify({'profiles': profiling.list_profiles()})
+
+@app.route('/api/profiles/rolling')
+def rolling_profile():
+    """
+    导出处理本请求的 worker 进程最近一段时间的滚动采样（折叠栈格式）
+    参数: seconds（默认全部保留的时长）
+    """
+    if not profiling.token_valid(_profile_token()):
+        return jsonify({'error': '需要管理员令牌'}), 403
+    folded = profiling.dump_rolling(request.args.get('seconds', type=float))
+    if folded is None:
+        return jsonify({'error': '滚动采样未开启（PROFILE_ROLLING=0）'}), 404
+    response = Response(folded, mimetype='text/plain')
+    response.headers['X-Profile-Pid'] = str(os.getpid())
+    return response
+
+@app.route('/api/profiles/<name>')
+def get_profile(name):
+    """下载单个请求的剖析结果（折叠栈格式，可用 flamegraph.pl / speedscope 打开）"""
+    if not profiling.token_valid(_profile_token()):
+        return jsonify({'error': '需要管理员令牌'}), 403
+    path = profiling.profile_path(name)
+    if path is None:
+        return jsonify({'error': '剖析结果不存在'}), 404
+    return send_file(path, mimetype='text/plain')
+
+# 模板中用 asset_url('js/app.js') 引用带哈希、预先压缩的静态文件
+app.jinja_env.globals['asset_url'] = static_assets.asset_url
+
+@app.route('/assets/<path:name>')
+def serve_asset(name):
+    """带内容哈希的静态文件（内容不会变化，可以永久缓存；按 Accept-Encoding 发送预先压缩的版本）"""
+    found = static_assets.resolve(name, request.headers.get('Accept-Encoding', ''))
+    if found is None:
+        return jsonify({'error': '文件不存在'}), 404
+    path, encoding, mimetype = found
+    response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/')
 def index():
     """主页面"""
@@ -48,327 +193,510 @@ def preview_page():
 @app.route('/bookshelf.jpg')
 def serve_image():
     """提供书架图片"""
-    return send_from_directory('.', 'bookshelf.jpg')
+    shelf_image = os.path.abspath(SHELF_IMAGE)
+    return send_from_directory(os.path.dirname(shelf_image), os.path.basename(shelf_image))
+
+@app.route('/api/shelves', methods=['GET'])
+def list_shelves():
+    """书架列表（多书架配置见 shelves.py）"""
+    return jsonify({
+        'shelves': [shelf.to_dict() for shelf in shelves.registry.shelves()],
+        'default': getattr(shelves.registry.default(), 'id', None),
+        'stats': shelves.registry.stats()
+    })
+
+@app.route('/api/shelves/<shelf_id>/image')
+def serve_shelf_image(shelf_id):
+    """提供指定书架的图片"""
+    shelf = shelves.registry.get(shelf_id)
+    if shelf is None or not os.path.exists(shelf.image):
+        return jsonify({'error': '书架不存在'}), 404
+    return send_file(os.path.abspath(shelf.image))
+
+def _tiles_response(image_path):
+    """瓦片清单（tile_url 中的 {level} {col} {row} 由浏览器替换）"""
+    try:
+        manifest = tiles.ensure_pyramid(image_path)
+    except (OSError, ValueError) as e:
+        return jsonify({'error': f'无法生成瓦片: {e}'}), 500
+    response = jsonify(dict(manifest,
+                            tile_url=f"/api/tiles/{manifest['id']}/{{level}}/{{col}}_{{row}}.jpg",
+                            level_url=f"/api/tiles/{manifest['id']}/{{level}}/level.jpg"))
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/tiles', methods=['GET'])
+def bookshelf_tiles():
+    """编辑器书架图片（/bookshelf.jpg）的瓦片清单"""
+    return _tiles_response(SHELF_IMAGE)
+
+@app.route('/api/shelves/<shelf_id>/tiles', methods=['GET'])
+def shelf_tiles(shelf_id):
+    """指定书架图片的瓦片清单"""
+    shelf = shelves.registry.get(shelf_id)
+    if shelf is None or not os.path.exists(shelf.image):
+        return jsonify({'error': '书架不存在'}), 404
+    return _tiles_response(shelf.image)
+
+@app.route('/api/tiles/<pyramid_id>/<int:level>/<name>')
+def serve_tile(pyramid_id, level, name):
+    """瓦片文件（地址包含图片内容哈希，内容不会变化，可以永久缓存）"""
+    if not re.fullmatch(r'(\d+_\d+|level)\.jpg', name):
+        return jsonify({'error': '瓦片不存在'}), 404
+    path = tiles.tile_path(pyramid_id, level, name)
+    if path is None:
+        return jsonify({'error': '瓦片不存在'}), 404
+    response = send_file(os.path.abspath(path), mimetype='image/jpeg', conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/shelves/<shelf_id>/books', methods=['GET'])
+def get_shelf_books(shelf_id):
+    """指定书架的书籍（{书籍关键词: 书籍数据}，与 GET /api/books 的旧版格式相同）"""
+    shelf = shelves.registry.get(shelf_id)
+    if shelf is None:
+        return jsonify({'error': '书架不存在'}), 404
+    db, version = shelves.registry.load(shelf)
+    response = jsonify(db.books)
+    if version is not None:
+        response.headers['X-Catalogue-Version'] = str(version)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/api/books', methods=['GET'])
 def get_books():
-    """获取所有书籍"""
-    # 每次请求都重新加载模块，确保获取最新数据
-    import importlib
-    import book_database
-    importlib.reload(book_database)
+    """
+    获取书籍列表
+    查询参数（均可选）:
+      fields: 只返回指定字段，逗号分隔（position, shelf, full_name, points）
+      limit / cursor: 游标分页
+      since: 增量模式，只返回该版本之后变化的书籍
+    不带 limit/cursor/since 时返回与旧版相同的 {书籍关键词: 书籍数据} 字典
+    """
+    db, state = load_catalogue()
+    version = state['version']
+    
+    # 解析字段投影
+    fields = BOOK_FIELDS
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in BOOK_FIELDS]
+        if unknown:
+            return jsonify({'error': f'未知字段: {", ".join(unknown)}'}), 400
+    
+    keys = list(db.books.keys())
+    deleted = []
+    full_sync = False
+    
+    # 增量模式：只返回 since 之后变化的书籍
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since 参数需要是整数版本号'}), 400
+        if since > version:
+            # 客户端版本比服务器还新（例如版本文件被重置），需要完整同步
+            full_sync = True
+        else:
+            changed, deleted = changed_since(state, since)
+            changed = set(changed)
+            keys = [key for key in keys if key in changed]
+    
+    # 游标分页
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    next_cursor = None
+    if paginated:
+        try:
+            limit = min(int(request.args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit 参数需要是整数'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit 参数需要大于0'}), 400
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                after_key = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({'error': '无效的游标'}), 400
+            if after_key in db.books:
+                # 游标之后的书籍（保持数据库中的顺序）
+                order = {key: i for i, key in enumerate(db.books)}
+                keys = [key for key in keys if order[key] > order[after_key]]
+            else:
+                return jsonify({'error': '游标对应的书籍已不存在，请重新加载'}), 410
+        
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = base64.urlsafe_b64encode(keys[-1].encode('utf-8')).decode('ascii')
     
-    db = book_database.BookDatabase()
     books = {}
-    for key, info in db.books.items():
-        book_data = {
-            'position': info['position'],
-            'shelf': info['shelf'],
-            'full_name': info['full_name']
-        }
-        # 如果有四点数据，也返回
-        if 'points' in info:
-            book_data['points'] = info['points']
+    for key in keys:
+        info = db.books[key]
+        book_data = {}
+        for field in fields:
+            # 只有四点数据是可选字段
+            if field in info:
+                book_data[field] = info[field]
         books[key] = book_data
-    return jsonify(books)
+    
+    if since is None and not paginated:
+        payload = books
+    else:
+        payload = {
+            'version': version,
+            'books': books,
+            'next_cursor': next_cursor
+        }
+        if since is not None:
+            payload['since'] = since
+            payload['deleted'] = deleted
+            payload['full'] = full_sync
+    
+    response = jsonify(payload)
+    # ETag 由目录版本号和查询参数共同决定
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:8]
+    response.set_etag(f"v{version}-{query_hash}")
+    response.headers['X-Catalogue-Version'] = str(version)
+    # 允许缓存，但每次都需要向服务器验证（命中时返回304）
+    response.headers['Cache-Control'] = 'no-cache'
+    response = response.make_conditional(request)
+    metrics.count_cache('books_etag', response.status_code == 304)
+    return response
+
+def _float_args(*names):
+    """读取浮点数查询参数，缺少、格式错误或不是有限值（nan、inf）时返回 None"""
+    values = []
+    for name in names:
+        value = request.args.get(name, type=float)
+        if value is None or not math.isfinite(value):
+            return None
+        values.append(value)
+    return values
+
+def _shelf_catalogue():
+    """
+    按查询参数 shelf 加载书架（默认主书架）
+    返回: (书架, BookDatabase 实例, 目录版本号)，书架不存在时书架为 None
+    """
+    shelf_id = request.args.get('shelf')
+    shelf = shelves.registry.get(shelf_id) if shelf_id else shelves.registry.default()
+    if shelf is None:
+        return None, None, None
+    db, version = shelves.registry.load(shelf)
+    return shelf, db, version
+
+def _spatial_response(shelf, db, version, keys, **extra):
+    """空间查询结果: 命中的书籍（保持查询返回的顺序）"""
+    payload = dict(extra)
+    payload['shelf_id'] = shelf.id
+    payload['version'] = version
+    payload['books'] = [dict(db.books[key], book_key=key) for key in keys]
+    payload['count'] = len(keys)
+    response = jsonify(payload)
+    if version is not None:
+        response.headers['X-Catalogue-Version'] = str(version)
+    return response
+
+@app.route('/api/books/at', methods=['GET'])
+def books_at():
+    """
+    查找某个位置上的书籍（用于指点式交互）
+    查询参数: x, y（归一化坐标 0-1）, shelf（书架 ID，默认主书架）
+    返回的书籍按形状面积从小到大排列，第一本即最贴合的书
+    """
+    coords = _float_args('x', 'y')
+    if coords is None:
+        return jsonify({'error': '需要 x 和 y 参数（归一化坐标）'}), 400
+    x, y = coords
+    shelf, db, version = _shelf_catalogue()
+    if shelf is None:
+        return jsonify({'error': '书架不存在'}), 404
+    with metrics.span('spatial.at'):
+        keys = shelves.spatial_index(db).at(x, y)
+    return _spatial_response(shelf, db, version, keys, x=x, y=y)
+
+@app.route('/api/books/region', methods=['GET'])
+def books_in_region():
+    """
+    查找与区域重叠的书籍
+    查询参数:
+      x0, y0, x1, y1: 矩形区域（归一化坐标）
+      或 book_key: 与该书籍形状重叠的其他书籍（校准时检查位置冲突）
+      contains=1: 只返回完全位于矩形区域内的书籍
+      shelf: 书架 ID（默认主书架）
+    """
+    shelf, db, version = _shelf_catalogue()
+    if shelf is None:
+        return jsonify({'error': '书架不存在'}), 404
+    book_key = request.args.get('book_key')
+    if book_key is not None:
+        if book_key not in db.books:
+            return jsonify({'error': '书籍不存在'}), 404
+        with metrics.span('spatial.region'):
+            keys = shelves.overlapping_books(db, book_key)
+        return _spatial_response(shelf, db, version, keys, book_key=book_key)
+    
+    bounds = _float_args('x0', 'y0', 'x1', 'y1')
+    if bounds is None:
+        return jsonify({'error': '需要 x0, y0, x1, y1 参数（归一化坐标）或 book_key 参数'}), 400
+    contains = request.args.get('contains') in ('1', 'true')
+    with metrics.span('spatial.region'):
+        keys = shelves.spatial_index(db).region(*bounds, contains=contains)
+    return _spatial_response(shelf, db, version, keys, region=bounds, contains=contains)
+
+def _base_version(data=None):
+    """
+    客户端修改所基于的目录版本号（用于乐观并发控制）
+    优先读取请求数据中的 base_version，其次读取 If-Match 头（GET /api/books 返回的 ETag）
+    都没有时返回 None（不做冲突检查）
+    """
+    if isinstance(data, dict) and data.get('base_version') is not None:
+        return int(data['base_version'])
+    match = re.match(r'(?:W/)?"?v(\d+)', request.headers.get('If-Match', '').strip())
+    if match:
+        return int(match.group(1))
+    return None
+
+def _conflict_response(conflict, txn):
+    """书籍已被其他人修改时的 409 响应（附带服务器上的最新数据）"""
+    logger.info('版本冲突', extra={'book_key': conflict.book_key,
+                                'base_version': conflict.base_version,
+                                'current_version': conflict.current_version})
+    return jsonify({
+        'success': False,
+        'error': str(conflict),
+        'conflict': True,
+        'book_key': conflict.book_key,
+        'version': txn.version,
+        'book': txn.db.books.get(conflict.book_key)
+    }), 409
+
+@app.route('/api/books', methods=['PATCH'])
+def patch_books():
+    """
+    批量更新书籍信息（一次读取、一次校验、一次写入）
+    请求数据: {"changes": [{"key": ..., "points"/"position"/"full_name": ...}, {"key": ..., "delete": true}],
+              "atomic": false, "base_version": 12}
+    每一项也可以单独指定 base_version；书籍在该版本之后被修改过的项会返回冲突
+    atomic 为 true 时只要有一项失败就不保存任何更改
+    返回每一项的处理结果
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        changes, atomic = data, False
+    elif isinstance(data, dict) and isinstance(data.get('changes'), list):
+        changes, atomic = data['changes'], bool(data.get('atomic', False))
+    else:
+        return jsonify({'error': '请求数据格式错误，需要 {"changes": [...]}'}), 400
+    
+    try:
+        default_base = _base_version(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'base_version 需要是整数版本号'}), 400
+    
+    if not os.path.exists(DB_FILE):
+        return jsonify({'error': '数据库文件不存在'}), 404
+    
+    with catalogue_transaction() as txn:
+        content = txn.content
+        existing = set(txn.db.books)
+        
+        results = []
+        changed_count = 0
+        for change in changes:
+            book_key = change.get('key') if isinstance(change, dict) else None
+            if not book_key:
+                results.append({'key': book_key, 'success': False, 'error': '缺少书籍关键词 key'})
+                continue
+            if book_key not in existing:
+                results.append({'key': book_key, 'success': False, 'error': '书籍不存在'})
+                continue
+            
+            try:
+                txn.check_version(book_key, change.get('base_version', default_base))
+            except CatalogueConflict as e:
+                results.append({'key': book_key, 'success': False, 'conflict': True, 'error': str(e),
+                                'book': txn.db.books.get(book_key)})
+                continue
+            except (TypeError, ValueError):
+                results.append({'key': book_key, 'success': False, 'error': 'base_version 需要是整数版本号'})
+                continue
+            
+            if change.get('delete'):
+                content, found = apply_book_delete(content, book_key)
+                if found:
+                    existing.discard(book_key)
+                    changed_count += 1
+                    results.append({'key': book_key, 'success': True, 'changed': True, 'deleted': True})
+                else:
+                    results.append({'key': book_key, 'success': False, 'error': '书籍不存在'})
+                continue
+            
+            if 'position' not in change and 'points' not in change and 'full_name' not in change:
+                results.append({'key': book_key, 'success': False, 'error': '没有需要更新的数据'})
+                continue
+            
+            try:
+                content, flags = apply_book_update(content, book_key, change)
+            except (ValueError, TypeError, IndexError) as e:
+                results.append({'key': book_key, 'success': False, 'error': str(e)})
+                continue
+            
+            position_updated = ('position' in change or 'points' in change) and (flags['position_found'] or flags['points_found'])
+            name_updated = 'full_name' in change and flags['name_found']
+            item_changed = position_updated or name_updated
+            if item_changed:
+                changed_count += 1
+            results.append({
+                'key': book_key,
+                'success': True,
+                'changed': item_changed,
+                'position_updated': position_updated,
+                'name_updated': name_updated,
+                'points_updated': flags['points_found']
+            })
+        
+        failed = sum(1 for r in results if not r['success'])
+        if atomic and failed:
+            logger.warning('批量更新有失败项，atomic 模式下不保存任何更改',
+                           extra={'changes': len(changes), 'failed': failed})
+            status = 409 if any(r.get('conflict') for r in results) else 400
+            return jsonify({'success': False, 'saved': False, 'version': txn.version, 'results': results}), status
+        
+        file_size = None
+        if changed_count:
+            try:
+                file_size, _ = txn.commit(content)
+            except SyntaxError as e:
+                logger.error('文件语法错误', extra={'error': str(e)})
+                return jsonify({'error': f'文件语法错误: {str(e)}', 'results': results}), 500
+            # 后台重新生成位置或书名变化的书籍的高亮素材
+            book_assets.schedule(SHELF_IMAGE, {r['key']: txn.db.books[r['key']] for r in results
+                                               if r.get('changed') and r['key'] in txn.db.books})
+            logger.info('批量更新已保存', extra={'changed': changed_count, 'failed': failed,
+                                           'version': txn.version})
+        
+        return jsonify({
+            'success': failed == 0,
+            'saved': changed_count > 0,
+            'file_size': file_size,
+            'version': txn.version,
+            'results': results
+        })
 
 @app.route('/api/books/<path:book_key>', methods=['PUT', 'DELETE'])
 def update_book(book_key):
-    """更新或删除书籍信息"""
+    """
+    更新或删除书籍信息
+    可通过请求数据中的 base_version 或 If-Match 头指定客户端加载时的版本号，
+    书籍在这之后已被修改时返回 409
+    """
     # URL解码
     import urllib.parse
-    import os
     book_key = urllib.parse.unquote(book_key)
     
-    print(f"\n{'='*60}")
-    print(f"收到请求: {request.method} /api/books/{book_key}")
-    print(f"{'='*60}")
-    
     if request.method == 'DELETE':
         # 删除书籍
-        db_file = 'book_database.py'
-        if not os.path.exists(db_file):
+        if not os.path.exists(DB_FILE):
             return jsonify({'error': '数据库文件不存在'}), 404
         
-        with open(db_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 备份原文件
-        backup_file = db_file + '.backup'
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        try:
+            base_version = _base_version(request.get_json(silent=True))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'base_version 需要是整数版本号'}), 400
         
-        # 查找并删除书籍条目
-        new_lines = []
-        skip_entry = False
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            if f'"{book_key}"' in line and ':' in line and '{' in line:
-                # 找到开始，跳过整个条目
-                skip_entry = True
-                i += 1
-                continue
-            
-            if skip_entry:
-                # 检查是否到达条目结束
-                if '},' in line or '}' in line:
-                    # 检查缩进，如果缩进减少，说明条目结束
-                    if line.strip().startswith('}'):
-                        skip_entry = False
-                        # 跳过这一行（删除）
-                        i += 1
-                        continue
-                # 跳过当前行
-                i += 1
-                continue
+        with catalogue_transaction() as txn:
+            try:
+                txn.check_version(book_key, base_version)
+            except CatalogueConflict as e:
+                return _conflict_response(e, txn)
             
-            new_lines.append(line)
-            i += 1
-        
-        # 保存文件
-        with open(db_file, 'w', encoding='utf-8') as f:
-            f.writelines(new_lines)
+            # 查找并删除书籍条目，保存文件（保存前按版本备份）
+            content, _ = apply_book_delete(txn.content, book_key)
+            _, version = txn.commit(content)
         
-        return jsonify({'success': True})
+        logger.info('书籍已删除', extra={'book_key': book_key, 'version': version})
+        return jsonify({'success': True, 'version': version})
     
     # PUT 方法：更新书籍信息
     try:
         data = request.get_json()
         if data is None:
             return jsonify({'error': '请求数据格式错误，需要JSON格式'}), 400
+        base_version = _base_version(data)
     except Exception as e:
-        print(f"❌ 解析JSON失败: {e}")
+        logger.warning('解析JSON失败', extra={'book_key': book_key, 'error': str(e)})
         return jsonify({'error': f'解析请求数据失败: {str(e)}'}), 400
     
-    print(f"收到数据: {data}")
+    if debug_sampled(logger):
+        logger.debug('收到更新数据', extra={'book_key': book_key, 'data': data})
     
     # 读取book_database.py文件
-    db_file = 'book_database.py'
-    if not os.path.exists(db_file):
-        print(f"❌ 数据库文件不存在: {db_file}")
+    if not os.path.exists(DB_FILE):
+        logger.error('数据库文件不存在', extra={'path': DB_FILE})
         return jsonify({'error': '数据库文件不存在'}), 404
     
-    with open(db_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 备份原文件
-    backup_file = db_file + '.backup'
-    with open(backup_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    # 初始化更新标志
-    position_found = False
-    name_found = False
-    points_found = False
-    
-    # 更新位置（支持四点模式）
-    if 'position' in data or 'points' in data:
-        # 优先使用四点模式
-        if 'points' in data and data['points']:
-            points = data['points']
-            if len(points) != 4:
-                return jsonify({'error': '四点模式需要4个点'}), 400
-            
-            # 计算四个点的边界框（用于position字段，保持兼容性）
-            xs = [p[0] for p in points]
-            ys = [p[1] for p in points]
-            x_min, x_max = min(xs), max(xs)
-            y_min, y_max = min(ys), max(ys)
-            
-            # 转换为矩形格式（中心点+宽高）
-            center_x = (x_min + x_max) / 2
-            center_y = (y_min + y_max) / 2
-            width = x_max - x_min
-            height = y_max - y_min
-            
-            new_position = f"({center_x:.4f}, {center_y:.4f}, {width:.4f}, {height:.4f})"
-            
-            # 保存四个点的坐标（作为新字段）
-            points_str = f"[({points[0][0]:.4f}, {points[0][1]:.4f}), ({points[1][0]:.4f}, {points[1][1]:.4f}), ({points[2][0]:.4f}, {points[2][1]:.4f}), ({points[3][0]:.4f}, {points[3][1]:.4f})]"
-            
-        elif 'position' in data:
-            position = data['position']
-            if len(position) != 4:
-                return jsonify({'error': '位置数据格式错误，需要4个值 [x, y, w, h]'}), 400
-            
-            x, y, w, h = position
-            new_position = f"({x:.4f}, {y:.4f}, {w:.4f}, {h:.4f})"
-            points_str = None
-        else:
-            return jsonify({'error': '需要提供position或points数据'}), 400
-        
-        # 更精确的替换
-        lines = content.split('\n')
-        book_entry_start = -1
-        for i, line in enumerate(lines):
-            # 匹配书籍键，考虑引号和冒号
-            if f'"{book_key}"' in line and ':' in line:
-                book_entry_start = i
-                # 在接下来的几行中查找position行
-                for j in range(i, min(i+20, len(lines))):
-                    if '"position"' in lines[j]:
-                        old_line = lines[j]
-                        # 匹配各种格式：可能是 "position": (x, y, w, h) 或 "position": (x, y, w, h),
-                        pattern = r'"position":\s*\([^)]+\)'
-                        new_line = re.sub(pattern, f'"position": {new_position}', old_line)
-                        if new_line != old_line:
-                            lines[j] = new_line
-                            position_found = True
-                            print(f"✅ 更新位置: {book_key}")
-                            print(f"   旧值: {old_line.strip()}")
-                            print(f"   新值: {new_line.strip()}")
-                        else:
-                            # 即使位置值相同，如果我们在更新points，也应该标记position_found为True
-                            # 因为position字段需要存在（用于兼容性）
-                            if points_str:
-                                position_found = True
-                                print(f"ℹ️  位置值未改变，但需要保持position字段: {book_key}")
-                            else:
-                                print(f"ℹ️  位置未改变: {book_key}")
-                        
-                        # 如果有四点数据，添加或更新points字段
-                        if points_str:
-                            # 查找是否已有points字段
-                            has_points = False
-                            for k in range(j, min(j+15, len(lines))):
-                                if '"points"' in lines[k]:
-                                    # 更新现有的points字段
-                                    old_points_line = lines[k]
-                                    # 使用更简单可靠的正则表达式：匹配整个points列表（包括嵌套的括号）
-                                    # 使用非贪婪匹配，匹配到第一个完整的 ] 为止
-                                    pattern_points = r'"points":\s*\[.*?\]'
-                                    match = re.search(pattern_points, old_points_line)
-                                    if match:
-                                        # 找到匹配，替换整个points部分
-                                        new_points_line = re.sub(pattern_points, f'"points": {points_str}', old_points_line)
-                                        if new_points_line != old_points_line:
-                                            lines[k] = new_points_line
-                                            points_found = True
-                                            print(f"✅ 更新四点: {book_key}")
-                                            print(f"   旧值: {old_points_line.strip()}")
-                                            print(f"   新值: {new_points_line.strip()}")
-                                        else:
-                                            print(f"ℹ️  四点未改变（值相同）: {book_key}")
-                                            print(f"   旧值: {old_points_line.strip()}")
-                                            print(f"   新值应该是: {points_str}")
-                                    else:
-                                        print(f"⚠️  无法匹配points行: {old_points_line.strip()}")
-                                    has_points = True
-                                    break
-                            
-                            # 如果没有points字段，在position后面添加
-                            if not has_points:
-                                # 在position行后面插入points行
-                                indent = len(lines[j]) - len(lines[j].lstrip())
-                                points_line = ' ' * indent + f'"points": {points_str},'
-                                lines.insert(j + 1, points_line)
-                                points_found = True
-                                print(f"✅ 添加四点: {book_key}")
-                        break
-                break
-        
-        # 如果更新了位置或四点，更新内容
-        if position_found or points_found:
-            content = '\n'.join(lines)
-            print(f"✅ 内容已更新: position_found={position_found}, points_found={points_found}")
-        else:
-            print(f"⚠️  未找到位置行或四点数据未改变: {book_key}")
-            print(f"   调试: position_found={position_found}, points_found={points_found}, points_str={points_str if 'points_str' in locals() else 'N/A'}")
-    
-    # 更新书名
-    if 'full_name' in data:
-        full_name = data['full_name']
-        # 转义引号
-        escaped_name = full_name.replace('"', '\\"')
-        
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            # 匹配书籍键，考虑引号和冒号
-            if f'"{book_key}"' in line and ':' in line:
-                # 在接下来的几行中查找full_name行
-                for j in range(i, min(i+15, len(lines))):
-                    if '"full_name"' in lines[j]:
-                        old_line = lines[j]
-                        pattern = r'"full_name":\s*"[^"]*"'
-                        new_line = re.sub(pattern, f'"full_name": "{escaped_name}"', old_line)
-                        if new_line != old_line:
-                            lines[j] = new_line
-                            name_found = True
-                            print(f"✅ 更新书名: {book_key}")
-                            print(f"   旧值: {old_line.strip()}")
-                            print(f"   新值: {new_line.strip()}")
-                        else:
-                            print(f"ℹ️  书名未改变: {book_key}")
-                        break
-                break
-        
-        if name_found:
-            content = '\n'.join(lines)
-        else:
-            print(f"⚠️  未找到书名行: {book_key}")
+    # 检查是否有任何更改
+    if 'position' not in data and 'points' not in data and 'full_name' not in data:
+        return jsonify({'success': False, 'message': '没有需要更新的数据'})
     
-    # 保存文件
-    try:
-        # 检查是否有任何更改
-        if 'position' not in data and 'points' not in data and 'full_name' not in data:
-            print("⚠️  没有需要更新的数据")
-            return jsonify({'success': False, 'message': '没有需要更新的数据'})
-        
-        # 检查是否找到了要更新的内容
-        position_updated = ('position' in data or 'points' in data) and (position_found or points_found)
-        name_updated = 'full_name' in data and name_found
-        
-        if not position_updated and not name_updated:
-            print("⚠️  未找到要更新的内容")
-            print(f"   调试信息: position_found={position_found}, points_found={points_found}, name_found={name_found}")
-            return jsonify({'success': False, 'message': '未找到要更新的书籍或内容未改变'})
+    with catalogue_transaction() as txn:
+        try:
+            txn.check_version(book_key, base_version)
+        except CatalogueConflict as e:
+            return _conflict_response(e, txn)
         
-        # 验证文件内容是否有效
+        # 更新位置、四点和书名
         try:
-            # 尝试重新加载验证语法
-            compile(content, db_file, 'exec')
-        except SyntaxError as e:
-            print(f"❌ 文件语法错误: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({'error': f'文件语法错误: {str(e)}'}), 500
+            content, flags = apply_book_update(txn.content, book_key, data)
+        except (ValueError, TypeError, IndexError) as e:
+            return jsonify({'error': str(e)}), 400
+        position_found = flags['position_found']
+        points_found = flags['points_found']
+        name_found = flags['name_found']
         
         # 保存文件
-        with open(db_file, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        # 验证文件是否真的保存了
-        if os.path.exists(db_file):
-            file_size = os.path.getsize(db_file)
-            print(f"✅ 文件已保存: {db_file} (大小: {file_size} 字节)")
+        try:
+            # 检查是否找到了要更新的内容
+            position_updated = ('position' in data or 'points' in data) and (position_found or points_found)
+            name_updated = 'full_name' in data and name_found
             
-            # 重新加载 book_database 模块，确保下次读取时使用最新数据
-            import importlib
-            import book_database
-            importlib.reload(book_database)
-            print(f"✅ 已重新加载 book_database 模块")
+            if not position_updated and not name_updated:
+                logger.warning('未找到要更新的内容', extra={
+                    'book_key': book_key, 'position_found': position_found,
+                    'points_found': points_found, 'name_found': name_found})
+                return jsonify({'success': False, 'message': '未找到要更新的书籍或内容未改变'})
             
-            print(f"{'='*60}\n")
+            # 验证文件内容是否有效并原子写入（写入前按版本备份）
+            try:
+                file_size, version = txn.commit(content)
+            except SyntaxError as e:
+                logger.exception('文件语法错误', extra={'book_key': book_key})
+                return jsonify({'error': f'文件语法错误: {str(e)}'}), 500
+            if book_key in txn.db.books:
+                # 后台重新生成该书的高亮素材
+                book_assets.schedule(SHELF_IMAGE, {book_key: txn.db.books[book_key]})
+            
+            logger.info('书籍已更新', extra={
+                'book_key': book_key, 'version': version, 'file_size': file_size,
+                'position_updated': position_updated, 'name_updated': name_updated})
             return jsonify({
                 'success': True, 
                 'message': '书籍更新成功', 
                 'file_size': file_size,
+                'version': version,
                 'position_updated': position_updated,
                 'name_updated': name_updated,
                 'points_updated': points_found
             })
-        else:
-            print(f"❌ 文件保存后不存在: {db_file}")
-            print(f"{'='*60}\n")
-            return jsonify({'error': '文件保存失败'}), 500
-            
-    except Exception as e:
-        import traceback
-        print(f"❌ 保存文件失败: {e}")
-        traceback.print_exc()
-        print(f"{'='*60}\n")
-        return jsonify({'error': f'保存失败: {str(e)}'}), 500
+                
+        except Exception as e:
+            logger.exception('保存文件失败', extra={'book_key': book_key})
+            return jsonify({'error': f'保存失败: {str(e)}'}), 500
 
 @app.errorhandler(404)
 def not_found(error):
@@ -376,14 +704,12 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
-    import traceback
-    traceback.print_exc()
+    logger.exception('服务器内部错误')
     return jsonify({'error': '服务器内部错误'}), 500
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    import traceback
-    traceback.print_exc()
+    logger.exception('未处理的异常', extra={'path': request.path})
     return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 @app.route('/api/settings', methods=['GET', 'PUT'])
@@ -405,31 +731,48 @@ def settings():
 
 @app.route('/api/search', methods=['POST'])
 def search():
-    """搜索书籍（用于语音识别）"""
-    # 每次搜索前都重新加载book_database，确保使用最新数据
-    import importlib
-    import book_database
-    importlib.reload(book_database)
-    
+    """
+    搜索书籍（用于语音识别）
+    在所有书架中搜索（文件有变化时自动重新加载），返回最佳匹配，
+    其他书架上的匹配按匹配等级排列在 matches 中
+    """
     data = request.json
     query = data.get('query', '').strip()
     
     if not query:
         return jsonify({'success': False, 'error': '查询内容为空'}), 400
     
-    db = book_database.BookDatabase()
-    book_key, book_info = db.search_book(query)
+    matches = shelves.registry.search(query)
     
-    if book_info:
+    if matches:
+        best = matches[0]
+        book_key, book_info = best['book_key'], best['book']
         result = {
             'success': True,
             'book_key': book_key,
             'book_name': book_info['full_name'],
-            'position': book_info['position']
+            'position': book_info['position'],
+            'shelf_id': best['shelf'].id,
+            'shelf_name': best['shelf'].name,
+            # 预览页面在浏览器中渲染高亮动画时使用的书架图片
+            'image_url': best['shelf'].to_dict()['image_url']
         }
         # 如果有四点数据，也返回
         if 'points' in book_info:
             result['points'] = book_info['points']
+        result['matches'] = [{
+            'shelf_id': match['shelf'].id,
+            'book_key': match['book_key'],
+            'book_name': match['book']['full_name'],
+            'tier': match['tier']
+        } for match in matches]
+        
+        # 热门书籍的预览会在后台提前渲染（见 prefetch.py）
+        popularity.record(best['shelf'].id, book_key)
+        
+        # 通知其他跟随的投影页面
+        events.publish('highlight', dict(result, query=query, source='web',
+                                         client_id=data.get('client_id')))
         return jsonify(result)
     else:
         return jsonify({
@@ -437,38 +780,136 @@ def search():
             'error': f'未找到匹配的书籍: {query}'
         })
 
+@app.route('/api/events')
+def event_stream():
+    """
+    事件订阅
+    - 请求头 Accept: text/event-stream（EventSource）: 推送（Server-Sent Events），有新事件立即推送；
+      推送连接数达到 EVENTS_MAX_STREAMS 时返回 503，浏览器改为轮询
+    - 其他请求: 轮询，立即返回
+    查询参数:
+      types: 只订阅指定类型，逗号分隔（catalogue, highlight）
+      after: 从该事件之后开始（推送重连时浏览器使用 Last-Event-ID 头）；
+             轮询时不带表示只返回当前编号，用于开始订阅
+    轮询返回: {"events": [{id, type, data}], "last_id": 下次轮询的 after,
+               "missed": 是否有事件已丢失（需要重新同步）, "poll_ms": 建议的轮询间隔}
+    推送时事件已丢失会发送 missed 事件
+    """
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        after = int(after) if after else None
+    except ValueError:
+        return jsonify({'error': 'after 需要是整数'}), 400
+    types = None
+    if request.args.get('types'):
+        types = {t.strip() for t in request.args['types'].split(',') if t.strip()}
+    
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        if not _event_streams.acquire(blocking=False):
+            return jsonify({'error': '推送连接数已满，请改用轮询', 'poll_ms': EVENTS_POLL_MS}), 503
+        
+        def generate():
+            # 断开后 3 秒重连
+            yield 'retry: 3000\n\n'
+            for event in events.follow(after, types=types, duration=EVENTS_STREAM_SECONDS):
+                if event is None:
+                    # 心跳注释，保持连接
+                    yield ': keepalive\n\n'
+                    continue
+                payload = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+        
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+        })
+        # 连接结束（包括客户端断开）后释放名额
+        response.call_on_close(_event_streams.release)
+        return response
+    
+    found, last_id, missed = events.read_since(after, types=types)
+    response = jsonify({
+        'events': [{'id': e['id'], 'type': e['type'], 'data': e['data']} for e in found],
+        'last_id': last_id,
+        'missed': missed,
+        'poll_ms': EVENTS_POLL_MS
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/api/preview', methods=['POST'])
 def preview():
     """预览效果（生成高亮图片）"""
-    # 每次预览前都重新加载book_database，确保使用最新数据
-    import importlib
-    import book_database
-    importlib.reload(book_database)
-    
-    from projector_simple import ProjectorSimple
-    
     data = request.json
     book_key = data.get('book_key')
-    image_path = data.get('image_path', 'bookshelf.jpg')
+    shelf_id = data.get('shelf_id')
+    if shelf_id:
+        # 其他书架：使用该书架的图片和书籍（文件有变化时自动重新加载）
+        shelf = shelves.registry.get(shelf_id)
+        if shelf is None:
+            return jsonify({'error': '书架不存在'}), 404
+        db, _ = shelves.registry.load(shelf)
+        image_path = shelf.image
+    else:
+        # 文件有变化时自动重新加载，确保使用最新数据
+        db, _ = load_catalogue()
+        image_path = data.get('image_path', 'bookshelf.jpg')
+        if image_path == 'bookshelf.jpg':
+            # 页面上显示的书架图片（/bookshelf.jpg）
+            image_path = SHELF_IMAGE
     
     if not os.path.exists(image_path):
         return jsonify({'error': '图片文件不存在'}), 404
     
-    db = book_database.BookDatabase()
     if book_key not in db.books:
         return jsonify({'error': '书籍不存在'}), 404
     
     book_info = db.books[book_key]
     
-    # 生成预览（优先使用四点定位）
-    projector = ProjectorSimple(image_path=image_path, output_dir='./projector_output')
-    points = book_info.get('points')  # 获取四点数据（如果存在）
-    if points and len(points) == 4:
-        # 使用四点定位
-        projector.highlight_book(book_info['position'], book_info['full_name'], points=points)
-    else:
-        # 使用矩形定位（兼容旧格式）
-        projector.highlight_book(book_info['position'], book_info['full_name'])
+    # 输出尺寸上限（如页面显示尺寸），比原图小时在缩小的底图上渲染
+    output_size = None
+    if data.get('max_width') or data.get('max_height'):
+        try:
+            output_size = tuple(min(MAX_PREVIEW_SIZE, max(MIN_PREVIEW_SIZE, int(data[name])))
+                                if data.get(name) else None for name in ('max_width', 'max_height'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_width/max_height 需要是整数'}), 400
+    
+    # 对齐到预先生成素材的尺寸（见 book_assets.py）
+    if output_size is not None and None not in output_size:
+        output_size = book_assets.snap_size(output_size)
+    
+    # 同一本书的预览已渲染过（或已被后台预取）时直接使用缓存，见 preview_cache.py
+    cache_key = preview_cache.cache_key(image_path, output_size, book_info)
+    artifact = preview_cache.lookup(cache_key)
+    
+    # 生成预览（在渲染进程池中执行，优先使用四点定位）
+    try:
+        # 包含排队等待时间
+        with metrics.span('preview.render'):
+            if artifact is None:
+                artifact = render_pool.run(render_pool.render_preview, image_path, './projector_output',
+                                           cache_key, book_info['position'], book_info['full_name'],
+                                           points=book_info.get('points'), output_size=output_size)
+            if artifact is None:
+                # 无法生成GIF动画（如未安装 Pillow）时生成静态图片
+                render_pool.run(render_pool.render_highlight, image_path, './projector_output',
+                                book_info['position'], book_info['full_name'],
+                                points=book_info.get('points'), output_size=output_size)
+    except render_pool.RenderPoolBusy as e:
+        response = jsonify({'error': f'服务器繁忙，请稍后重试: {e}'})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    except render_pool.RenderTimeout as e:
+        return jsonify({'error': f'生成预览超时: {e}'}), 504
+    
+    if artifact is not None:
+        preview_cache.maybe_gc()
+        # 内容寻址的地址（内容不变），浏览器和 CDN 可以长期缓存
+        return jsonify({
+            'success': True,
+            'preview_url': f"/previews/{artifact}"
+        })
     
     # 返回预览URL（优先返回GIF，因为预览页面直接显示GIF）
     gif_path = os.path.join('projector_output', 'highlight.gif')
@@ -494,14 +935,36 @@ def preview():
             else:
                 return jsonify({'error': '预览文件未生成'}), 500
 
+@app.route('/api/prefetch', methods=['GET'])
+def prefetch_stats():
+    """后台预取状态（本 worker 的预取线程、热门书籍、渲染队列）"""
+    return jsonify({'prefetch': prefetch.stats(), 'render_pool': render_pool.stats()})
+
+@app.route('/previews/<name>')
+def serve_preview_artifact(name):
+    """
+    提供内容寻址的预览动画（文件名是内容哈希，内容永远不变）
+    浏览器和 CDN 可以永久缓存，重复查看同一本书不需要再访问服务器
+    """
+    path = preview_cache.artifact_path(name)
+    if path is None:
+        return jsonify({'error': '预览不存在'}), 404
+    response = send_file(os.path.abspath(path), mimetype='image/gif', etag=name.split('.')[0],
+                         conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/projector_output/<filename>')
 def serve_preview(filename):
-    """提供预览文件"""
-    return send_from_directory('projector_output', filename)
+    """提供预览文件（固定文件名、内容会被覆盖，浏览器每次都需要重新验证）"""
+    response = send_from_directory('projector_output', filename)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 if __name__ == '__main__':
     # 从环境变量获取端口，默认5001（本地开发）或5000（生产环境）
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    render_pool.prewarm()
     app.run(debug=debug, host='0.0.0.0', port=port)
 
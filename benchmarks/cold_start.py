@@ -0,0 +1,186 @@
+"""
+冷启动耗时报告
+每个入口在全新的子进程中启动，记录导入耗时、第一次请求耗时和已加载的重量级模块
+（OpenCV/NumPy/PIL/语音/Tkinter），用于检查只做搜索的路径没有加载图像和音频库
+
+入口:
+- app: Flask 应用（gunicorn / 本地开发），第一次请求为 /api/books 和 /api/search
+- vercel: Serverless 入口（api/index.py），第一次请求同上
+- main: 命令行程序，创建 BookSearchSystem（简单模式）后执行第一次搜索
+- render_worker: 渲染进程的启动（导入 projector_simple，见 render_pool._warm_up），作为对照
+
+用法:
+    python benchmarks/cold_start.py                      # 全部入口，每个运行 3 次取中位数
+    python benchmarks/cold_start.py --entries app,vercel --repeat 5
+    python benchmarks/cold_start.py --check              # 只做搜索的入口加载了重量级模块时退出码为 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRIES = ['app', 'vercel', 'main', 'render_worker']
+# 只做搜索的入口（--check 检查这些入口不加载重量级模块）
+SEARCH_ONLY_ENTRIES = {'app', 'vercel', 'main'}
+HEAVY_MODULES = ['cv2', 'numpy', 'PIL', 'speech_recognition', 'pyaudio', 'pyttsx3', 'tkinter']
+SEARCH_QUERY = 'harry potter'
+
+
+def _heavy_loaded():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def _first_requests(app):
+    """第一次请求: 书籍列表和搜索"""
+    client = app.test_client()
+    start = time.perf_counter()
+    client.get('/api/books')
+    books_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    client.post('/api/search', json={'query': SEARCH_QUERY})
+    return {'first_books': books_seconds, 'first_search': time.perf_counter() - start}
+
+
+def _child(entry):
+    """在子进程中启动一个入口并输出计时（JSON）"""
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(ROOT_DIR)
+    # 不启动后台预取，计时只包含入口本身
+    os.environ.setdefault('PREFETCH', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    result = {}
+    # 进度输出到 stderr，stdout 只输出 JSON
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        start = time.perf_counter()
+        if entry == 'app':
+            import app as module
+            result['import'] = time.perf_counter() - start
+            result['heavy_after_import'] = _heavy_loaded()
+            result.update(_first_requests(module.app))
+        elif entry == 'vercel':
+            import importlib.util
+            spec = importlib.util.spec_from_file_location('vercel_index', os.path.join(ROOT_DIR, 'api', 'index.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            result['import'] = time.perf_counter() - start
+            result['heavy_after_import'] = _heavy_loaded()
+            result.update(_first_requests(module.application))
+        elif entry == 'main':
+            import main as module
+            result['import'] = time.perf_counter() - start
+            result['heavy_after_import'] = _heavy_loaded()
+            start = time.perf_counter()
+            system = module.BookSearchSystem(image_path='bookshelf.jpg', use_simple_mode=True)
+            result['init'] = time.perf_counter() - start
+            start = time.perf_counter()
+            system.book_database.search_book(SEARCH_QUERY)
+            result['first_search'] = time.perf_counter() - start
+            # 后台加载的投影显示完成后的总时间
+            start = time.perf_counter()
+            system.projector
+            result['projector_ready'] = time.perf_counter() - start
+        elif entry == 'render_worker':
+            import projector_simple  # noqa: F401
+            result['import'] = time.perf_counter() - start
+            result['heavy_after_import'] = _heavy_loaded()
+        else:
+            raise ValueError(f"未知入口: {entry}")
+        result['heavy_at_exit'] = _heavy_loaded()
+    finally:
+        sys.stdout = stdout
+    print(json.dumps(result))
+
+
+def run_entry(entry):
+    """在全新的子进程中运行一个入口（包含解释器启动时间）"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', entry],
+                          cwd=ROOT_DIR, capture_output=True, text=True, timeout=300)
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{entry} 启动失败:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process'] = total
+    return result
+
+
+def summarize(samples):
+    """多次运行的中位数（秒）；模块列表取最后一次"""
+    summary = {}
+    for field, value in samples[-1].items():
+        if isinstance(value, list):
+            summary[field] = value
+        else:
+            summary[field] = statistics.median(sample[field] for sample in samples)
+    summary['repeat'] = len(samples)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='各入口的冷启动耗时报告')
+    parser.add_argument('--entries', default=','.join(ENTRIES),
+                        help=f"要测试的入口，逗号分隔（{','.join(ENTRIES)}）")
+    parser.add_argument('--repeat', type=int, default=3, help='每个入口运行的次数（默认 3）')
+    parser.add_argument('--output', help='结果 JSON 文件路径（默认输出到标准输出）')
+    parser.add_argument('--check', action='store_true',
+                        help='只做搜索的入口在导入后加载了重量级模块时退出码为 1')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child)
+        return
+
+    entries = [e.strip() for e in args.entries.split(',') if e.strip()]
+    unknown = set(entries) - set(ENTRIES)
+    if unknown:
+        parser.error(f"未知入口: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for entry in entries:
+        print(f"▶ {entry}", file=sys.stderr)
+        samples = [run_entry(entry) for _ in range(max(1, args.repeat))]
+        results[entry] = summary = summarize(samples)
+        timings = '  '.join(f"{field} {value * 1000:.0f} ms" for field, value in summary.items()
+                            if isinstance(value, float))
+        print(f"  {timings}", file=sys.stderr)
+        print(f"  重量级模块: 导入后 {summary.get('heavy_after_import') or '无'}，"
+              f"结束时 {summary.get('heavy_at_exit') or '无'}", file=sys.stderr)
+
+    violations = [entry for entry in entries
+                  if entry in SEARCH_ONLY_ENTRIES and results[entry].get('heavy_after_import')]
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat
+        },
+        'results': results,
+        'violations': violations
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"\n✅ 结果已保存: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.check and violations:
+        print(f"\n❌ 只做搜索的入口加载了重量级模块: {', '.join(violations)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
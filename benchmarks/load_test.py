@@ -0,0 +1,369 @@
+"""
+压力测试
+按指定的到达率（泊松分布）向 API 发送请求，模拟多台语音终端和编辑页面同时使用，
+输出不同到达率下的吞吐量/延迟曲线和错误率
+
+工作负载（每行一个 JSON 的 trace 文件，也可以由本脚本生成）:
+    {"at": 0.00, "op": "search", "query": "find the lean impact book"}
+    {"at": 1.73, "op": "preview", "book_key": "lean impact"}
+    {"at": 2.10, "op": "books"}
+    {"at": 4.85, "op": "update", "book_key": "lean impact", "position": [0.39, 0.36, 0.04, 0.21]}
+
+合成负载由两类会话组成（会话按泊松过程到达，会话内的步骤之间有随机思考时间）:
+- 语音终端: search →（思考）→ preview（按 --preview-ratio 比例）
+- 编辑页面: books →（思考）→ update（按 --write-ratio 比例）
+
+用法:
+    # 启动本地 gunicorn（使用临时合成目录，不修改仓库中的 book_database.py）并测试多个到达率
+    python benchmarks/load_test.py --spawn-gunicorn --books 2000 --rates 2,5,10,20 --duration 30
+
+    # 测试已经运行的服务
+    python benchmarks/load_test.py --url http://127.0.0.1:5001 --rates 5
+
+    # 保存合成负载，之后按 2 倍速重放
+    python benchmarks/load_test.py --url http://127.0.0.1:5001 --rates 5 --record trace.jsonl
+    python benchmarks/load_test.py --url http://127.0.0.1:5001 --trace trace.jsonl --speeds 1,2
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from synthetic_data import generate_catalogue, generate_queries, generate_shelf_image, write_database  # noqa: E402
+
+# 单个请求的超时时间（秒）
+REQUEST_TIMEOUT = 60
+OPS = ['search', 'preview', 'books', 'update']
+
+
+# ---------- 工作负载 ----------
+
+def generate_trace(books, rate, duration, think=2.0, preview_ratio=0.5, write_ratio=0.05, seed=1):
+    """
+    生成合成负载
+    rate: 每秒到达的会话数（泊松过程）
+    think: 会话内步骤之间的平均思考时间（秒，指数分布）
+    返回: 按时间排序的请求列表
+    """
+    rng = random.Random(seed)
+    queries = generate_queries(books, count=1000, seed=seed)
+    keys = list(books)
+    trace = []
+    at = rng.expovariate(rate)
+    while at < duration:
+        if rng.random() < write_ratio:
+            # 编辑页面：加载书籍列表后修改一本书的位置
+            key = rng.choice(keys)
+            cx, cy, w, h = books[key]['position']
+            position = [round(cx + rng.uniform(-0.002, 0.002), 4), cy, w, h]
+            trace.append({'at': round(at, 3), 'op': 'books'})
+            trace.append({'at': round(at + rng.expovariate(1 / think), 3), 'op': 'update',
+                          'book_key': key, 'position': position})
+        else:
+            # 语音终端：搜索，找到后预览
+            _, query = rng.choice(queries)
+            trace.append({'at': round(at, 3), 'op': 'search', 'query': query})
+            if rng.random() < preview_ratio:
+                key = query if query in books else rng.choice(keys)
+                trace.append({'at': round(at + rng.expovariate(1 / think), 3), 'op': 'preview', 'book_key': key})
+        at += rng.expovariate(rate)
+    trace.sort(key=lambda item: item['at'])
+    return trace
+
+
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        trace = [json.loads(line) for line in f if line.strip()]
+    trace.sort(key=lambda item: item['at'])
+    return trace
+
+
+def save_trace(path, trace):
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in trace:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+# ---------- 请求 ----------
+
+class Client:
+    """每个线程一个 keep-alive 连接"""
+    def __init__(self, url):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+                self._local.conn = conn
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError, socket.timeout, OSError):
+                # 服务端关闭了空闲连接时重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+def send(client, item):
+    """发送 trace 中的一个请求，返回 HTTP 状态码"""
+    op = item['op']
+    if op == 'search':
+        status, _ = client.request('POST', '/api/search', {'query': item['query']})
+    elif op == 'preview':
+        status, _ = client.request('POST', '/api/preview', {'book_key': item['book_key']})
+    elif op == 'books':
+        status, _ = client.request('GET', '/api/books')
+    elif op == 'update':
+        path = '/api/books/' + urllib.parse.quote(item['book_key'])
+        status, _ = client.request('PUT', path, {'position': item['position']})
+    else:
+        raise ValueError(f"未知操作: {op}")
+    return status
+
+
+def run_trace(client, trace, speed=1.0, concurrency=256):
+    """
+    按 trace 中的时间发送请求（开环：不等待上一个请求完成）
+    延迟从计划发送时间算起，包含客户端排队时间，避免协调遗漏（coordinated omission）
+    返回: (结果列表, 实际用时)
+    """
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(item, scheduled):
+        try:
+            status = send(client, item)
+            error = None
+        except Exception as e:
+            status, error = None, type(e).__name__
+        latency = time.perf_counter() - scheduled
+        with results_lock:
+            results.append({'op': item['op'], 'status': status, 'latency': latency, 'error': error})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for item in trace:
+            scheduled = started + item['at'] / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(worker, item, scheduled)
+    return results, time.perf_counter() - started
+
+
+# ---------- 统计 ----------
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summarize(results, elapsed, offered_rate):
+    """汇总一次运行的吞吐量、延迟和错误率"""
+    def stats(items):
+        latencies = sorted(r['latency'] for r in items)
+        ok = [r for r in items if r['status'] is not None and r['status'] < 500]
+        return {
+            'count': len(items),
+            'throughput': len(ok) / elapsed if elapsed else 0,
+            'p50': _percentile(latencies, 0.50),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'mean': statistics.fmean(latencies) if latencies else None,
+            'error_rate': 1 - len(ok) / len(items) if items else 0,
+            'busy_503': sum(1 for r in items if r['status'] == 503),
+            'timeouts_504': sum(1 for r in items if r['status'] == 504),
+            'client_errors': sum(1 for r in items if r['error'])
+        }
+
+    summary = {'offered_rate': offered_rate, 'elapsed': elapsed, 'total': stats(results), 'ops': {}}
+    for op in OPS:
+        items = [r for r in results if r['op'] == op]
+        if items:
+            summary['ops'][op] = stats(items)
+    return summary
+
+
+def print_curve(curve):
+    print(f"\n{'到达率':>8} {'请求/秒':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'错误率':>7} {'503':>5}",
+          file=sys.stderr)
+    for point in curve:
+        total = point['total']
+        ms = lambda v: f"{v * 1000:9.1f}" if v is not None else f"{'-':>9}"
+        print(f"{point['offered_rate']:>8} {total['throughput']:9.1f} {ms(total['p50'])} {ms(total['p95'])} "
+              f"{ms(total['p99'])} {total['error_rate']:7.1%} {total['busy_503']:5d}", file=sys.stderr)
+        for op, op_stats in point['ops'].items():
+            print(f"{'':>8}   {op:<7} p50 {ms(op_stats['p50']).strip()}ms  p99 {ms(op_stats['p99']).strip()}ms  "
+                  f"错误率 {op_stats['error_rate']:.1%}  ({op_stats['count']} 次)", file=sys.stderr)
+
+
+# ---------- 本地 gunicorn ----------
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_gunicorn(work_dir, books, resolution, workers=None):
+    """
+    使用临时合成目录启动 gunicorn（与生产环境相同的 gunicorn_config.py）
+    返回: (进程, URL)
+    """
+    database = os.path.join(work_dir, 'book_database.py')
+    image = os.path.join(work_dir, 'bookshelf.jpg')
+    catalogue = generate_catalogue(books)
+    write_database(database, catalogue)
+    generate_shelf_image(image, resolution[0], resolution[1], catalogue)
+
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), BOOK_DATABASE_FILE=database, BOOKSHELF_IMAGE=image,
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(work_dir, 'metrics'))
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    process = subprocess.Popen(['gunicorn', '-c', 'gunicorn_config.py', 'app:app'], cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}"
+    client = Client(url)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn 启动失败（退出码 {process.returncode}）")
+        try:
+            if client.request('GET', '/api/settings')[0] == 200:
+                return process, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn 启动超时')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='书籍搜索系统压力测试')
+    parser.add_argument('--url', default='http://127.0.0.1:5001', help='被测服务地址')
+    parser.add_argument('--spawn-gunicorn', action='store_true',
+                        help='使用临时合成目录启动本地 gunicorn 进行测试（忽略 --url）')
+    parser.add_argument('--workers', type=int, help='gunicorn worker 数量（--spawn-gunicorn 时有效）')
+    parser.add_argument('--books', type=int, default=2000, help='合成目录的书籍数量（--spawn-gunicorn 时有效）')
+    parser.add_argument('--resolution', default='1920x1080', help='合成书架图片分辨率（--spawn-gunicorn 时有效）')
+    parser.add_argument('--rates', default='2,5,10', help='会话到达率（每秒），逗号分隔，依次测试')
+    parser.add_argument('--duration', type=float, default=30, help='每个到达率的测试时长（秒）')
+    parser.add_argument('--think', type=float, default=2.0, help='平均思考时间（秒）')
+    parser.add_argument('--preview-ratio', type=float, default=0.5, help='语音终端搜索后请求预览的比例')
+    parser.add_argument('--write-ratio', type=float, default=0.05, help='编辑会话（读取+修改）的比例')
+    parser.add_argument('--trace', help='重放 trace 文件（不生成合成负载）')
+    parser.add_argument('--speeds', default='1', help='重放速度倍数，逗号分隔（--trace 时有效）')
+    parser.add_argument('--record', help='把生成的合成负载保存为 trace 文件（多个到达率时保存最后一个）')
+    parser.add_argument('--concurrency', type=int, default=256, help='客户端最大并发连接数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--output', help='结果 JSON 文件路径（默认输出到标准输出）')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='booksearch_load_')
+    process = None
+    try:
+        url = args.url
+        if args.spawn_gunicorn:
+            from synthetic_data import parse_resolution
+            print(f"▶ 启动 gunicorn（合成目录 {args.books} 本书）...", file=sys.stderr)
+            process, url = spawn_gunicorn(work_dir, args.books, parse_resolution(args.resolution), args.workers)
+            print(f"   {url}", file=sys.stderr)
+        client = Client(url)
+
+        runs = []
+        if args.trace:
+            trace = load_trace(args.trace)
+            trace_duration = trace[-1]['at'] if trace else 0
+            for speed in (float(s) for s in args.speeds.split(',')):
+                rate = len(trace) / trace_duration * speed if trace_duration else 0
+                runs.append((f"{speed}x", round(rate, 2), trace, speed))
+        else:
+            status, data = client.request('GET', '/api/books')
+            if status != 200:
+                raise RuntimeError(f"无法读取书籍列表（HTTP {status}）")
+            books = json.loads(data)
+            for rate in (float(r) for r in args.rates.split(',')):
+                trace = generate_trace(books, rate, args.duration, think=args.think,
+                                       preview_ratio=args.preview_ratio, write_ratio=args.write_ratio,
+                                       seed=args.seed)
+                runs.append((f"{rate}/s", rate, trace, 1.0))
+            if args.record and runs:
+                save_trace(args.record, runs[-1][2])
+                print(f"✅ 负载已保存: {args.record}", file=sys.stderr)
+
+        curve = []
+        for label, rate, trace, speed in runs:
+            print(f"\n▶ {label}: {len(trace)} 个请求", file=sys.stderr)
+            results, elapsed = run_trace(client, trace, speed=speed, concurrency=args.concurrency)
+            point = summarize(results, elapsed, rate)
+            point['label'] = label
+            curve.append(point)
+            print(f"   {point['total']['throughput']:.1f} 请求/秒, p99 "
+                  f"{(point['total']['p99'] or 0) * 1000:.1f} ms, 错误率 {point['total']['error_rate']:.1%}",
+                  file=sys.stderr)
+        print_curve(curve)
+
+        report = {
+            'meta': {
+                'url': url,
+                'spawned': args.spawn_gunicorn,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'duration': args.duration,
+                'think': args.think,
+                'preview_ratio': args.preview_ratio,
+                'write_ratio': args.write_ratio,
+                'trace': args.trace
+            },
+            'curve': curve
+        }
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+            print(f"\n✅ 结果已保存: {args.output}", file=sys.stderr)
+        else:
+            print(text)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
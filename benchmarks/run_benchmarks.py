@@ -0,0 +1,280 @@
+"""
+性能基准测试
+覆盖搜索、渲染、GIF 编码和 API 四类场景，结果输出为 JSON，
+可与基线结果对比，任何一项的中位数耗时超过基线一定比例即视为性能回退（退出码 1）
+
+场景:
+- search: 100 / 1万 / 100万 本书的合成目录（synthetic_data.py），
+  带噪声的查询（多余的停用词、大小写、拼写错误、缺词、无关词）
+- render: 不同分辨率的书架图片，矩形定位 vs 四点定位（ProjectorSimple.highlight_book 完整流程）
+- gif: 单独测试 GIF 编码（10帧）
+- api: Flask test client 调用主要接口（使用 BOOK_DATABASE_FILE 指定的数据库的副本，默认 book_database.py；
+  不启动后台预取，热度、事件和预览缓存写到临时目录）
+
+用法:
+    python benchmarks/run_benchmarks.py                       # 运行全部场景
+    python benchmarks/run_benchmarks.py --quick               # 缩小规模（跳过100万本书和4K渲染）
+    python benchmarks/run_benchmarks.py --scenarios search,api
+    python benchmarks/run_benchmarks.py --output benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# 基准测试时不输出普通日志，避免终端写入影响计时
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# 渲染在当前进程中执行，计时不包含进程间传输
+os.environ.setdefault('RENDER_POOL_MODE', 'thread')
+
+from synthetic_data import generate_catalogue, generate_queries, generate_shelf_image  # noqa: E402
+
+SCENARIOS = ['search', 'render', 'gif', 'api']
+SEARCH_SIZES = [100, 10_000, 1_000_000]
+QUICK_SEARCH_SIZES = [100, 10_000]
+RENDER_RESOLUTIONS = [(1280, 720), (1920, 1080), (3840, 2160)]
+QUICK_RENDER_RESOLUTIONS = [(1280, 720)]
+
+# 渲染和 GIF 场景的书架图片上绘制的书籍数
+SHELF_IMAGE_BOOKS = 60
+
+
+def _shelf_image(work_dir, width, height):
+    """生成（或复用）指定分辨率的合成书架图片"""
+    image_path = os.path.join(work_dir, f"shelf_{width}x{height}.jpg")
+    if not os.path.exists(image_path):
+        generate_shelf_image(image_path, width, height, generate_catalogue(SHELF_IMAGE_BOOKS))
+    return image_path
+
+
+def measure(func, repeat, warmup=1):
+    """多次运行取统计值（秒）"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'median': statistics.median(samples),
+        'min': samples[0],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'mean': statistics.fmean(samples),
+        'repeat': repeat
+    }
+
+
+def bench_search(quick):
+    from book_database import BookDatabase
+
+    results = {}
+    for size in (QUICK_SEARCH_SIZES if quick else SEARCH_SIZES):
+        db = BookDatabase()
+        db.books = generate_catalogue(size)
+        queries = generate_queries(db.books)
+        by_kind = {}
+        for kind, query in queries:
+            by_kind.setdefault(kind, []).append(query)
+        repeat = 20 if size <= 10_000 else 3
+        for kind, kind_queries in by_kind.items():
+            def run():
+                for query in kind_queries:
+                    db.search_book(query)
+            stats = measure(run, repeat)
+            # 换算为单次查询耗时
+            for field in ('median', 'min', 'p95', 'mean'):
+                stats[field] /= len(kind_queries)
+            results[f"search.{size}.{kind}"] = stats
+            print(f"  search {size:>9} {kind:<13} {stats['median'] * 1e6:10.1f} µs/查询")
+    return results
+
+
+def bench_render(quick, work_dir):
+    from projector_simple import ProjectorSimple
+
+    results = {}
+    rect = (0.5, 0.6, 0.03, 0.2)
+    points = [(0.48, 0.5), (0.52, 0.5), (0.53, 0.7), (0.49, 0.7)]
+    for width, height in (QUICK_RENDER_RESOLUTIONS if quick else RENDER_RESOLUTIONS):
+        image_path = _shelf_image(work_dir, width, height)
+        output_dir = os.path.join(work_dir, f"render_{width}x{height}")
+        projector = ProjectorSimple(image_path=image_path, output_dir=output_dir)
+        for mode in ('rect', 'points'):
+            if mode == 'rect':
+                run = lambda: projector.highlight_book(rect, "BENCHMARK BOOK TITLE")
+            else:
+                run = lambda: projector.highlight_book(rect, "BENCHMARK BOOK TITLE", points=points)
+            stats = measure(run, repeat=3)
+            results[f"render.{width}x{height}.{mode}"] = stats
+            print(f"  render {width}x{height:<5} {mode:<7} {stats['median'] * 1000:10.1f} ms")
+    return results
+
+
+def bench_gif(quick, work_dir):
+    import cv2
+    from PIL import Image
+
+    results = {}
+    for width, height in (QUICK_RENDER_RESOLUTIONS if quick else RENDER_RESOLUTIONS):
+        image_path = _shelf_image(work_dir, width, height)
+        base = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+        # 与高亮动画相似：背景不变，只有局部亮度变化
+        frames = []
+        for i in range(10):
+            frame = base.copy()
+            frame[height // 3:height // 2, width // 3:width // 2] = 128 + i * 10
+            frames.append(Image.fromarray(frame))
+        gif_path = os.path.join(work_dir, f"bench_{width}x{height}.gif")
+
+        def run():
+            frames[0].save(gif_path, save_all=True, append_images=frames[1:],
+                           duration=100, loop=0, optimize=True)
+        stats = measure(run, repeat=3)
+        results[f"gif.{width}x{height}"] = stats
+        print(f"  gif    {width}x{height:<5}         {stats['median'] * 1000:10.1f} ms")
+    return results
+
+
+def bench_api(quick, work_dir):
+    os.chdir(ROOT_DIR)
+    # 不启动后台预取，计时不受后台渲染影响
+    os.environ['PREFETCH'] = '0'
+    # 数据库副本、热度、事件和预览缓存都写到临时目录，不修改仓库中的文件
+    db_file = os.environ.get('BOOK_DATABASE_FILE', 'book_database.py')
+    db_copy = os.path.join(work_dir, os.path.basename(db_file))
+    shutil.copy2(db_file, db_copy)
+    os.environ['BOOK_DATABASE_FILE'] = db_copy
+    os.environ['POPULARITY_FILE'] = os.path.join(work_dir, 'popularity.json')
+    os.environ['EVENTS_FILE'] = os.path.join(work_dir, 'events.log')
+    os.environ['PREVIEW_CACHE_DIR'] = os.path.join(work_dir, 'preview_cache')
+    from app import app
+
+    client = app.test_client()
+    books = client.get('/api/books').get_json()
+    key = next(iter(books))
+    etag = client.get('/api/books').headers.get('ETag')
+
+    cases = {
+        'books': lambda: client.get('/api/books'),
+        'books_304': lambda: client.get('/api/books', headers={'If-None-Match': etag}),
+        'books_page': lambda: client.get('/api/books?limit=20&fields=position'),
+        'search_hit': lambda: client.post('/api/search', json={'query': key}),
+        'search_miss': lambda: client.post('/api/search', json={'query': 'zzqx unknown title'}),
+        'settings': lambda: client.get('/api/settings')
+    }
+    results = {}
+    for name, run in cases.items():
+        stats = measure(run, repeat=50 if quick else 200, warmup=5)
+        results[f"api.{name}"] = stats
+        print(f"  api    {name:<20} {stats['median'] * 1000:10.3f} ms")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线对比，返回回退的项目列表"""
+    regressions = []
+    for name, stats in sorted(results.items()):
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        ratio = stats['median'] / base['median'] if base['median'] else 1.0
+        stats['baseline_median'] = base['median']
+        stats['ratio'] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='书籍搜索系统性能基准测试')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"要运行的场景，逗号分隔（{','.join(SCENARIOS)}）")
+    parser.add_argument('--quick', action='store_true', help='缩小规模，适合快速检查')
+    parser.add_argument('--output', help='结果 JSON 文件路径（默认输出到标准输出）')
+    parser.add_argument('--baseline', help='基线结果 JSON 文件')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='允许的性能下降比例（默认 0.2，即慢 20%% 以上视为回退）')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    work_dir = tempfile.mkdtemp(prefix='booksearch_bench_')
+    results = {}
+    try:
+        for scenario in scenarios:
+            print(f"\n▶ {scenario}", file=sys.stderr)
+            # 进度输出到 stderr，stdout 只输出 JSON
+            stdout, sys.stdout = sys.stdout, sys.stderr
+            try:
+                if scenario == 'search':
+                    results.update(bench_search(args.quick))
+                elif scenario == 'render':
+                    results.update(bench_render(args.quick, work_dir))
+                elif scenario == 'gif':
+                    results.update(bench_gif(args.quick, work_dir))
+                elif scenario == 'api':
+                    results.update(bench_api(args.quick, work_dir))
+            finally:
+                sys.stdout = stdout
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': args.quick,
+            'threshold': args.threshold
+        },
+        'results': results,
+        'regressions': [name for name, _ in regressions]
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"\n✅ 结果已保存: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if regressions:
+        print(f"\n❌ 性能回退（超过基线 {args.threshold:.0%}）:", file=sys.stderr)
+        for name, ratio in regressions:
+            print(f"   {name}: {ratio:.2f}x", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
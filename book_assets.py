@@ -0,0 +1,217 @@
+"""
+书籍高亮素材库
+每本书的高亮素材（书籍形状、每一帧的光晕、书名框）只与书籍位置、书名和输出尺寸有关，
+书籍编辑后在后台预先生成并保存到磁盘，搜索命中时只需合成和编码（见 ProjectorSimple.compose）
+
+- 素材按 (书架图片, 输出尺寸, 位置, 四点, 书名) 的哈希保存为压缩的 .npz 文件，
+  位置或书名变化后哈希不同，旧文件不会再被使用，超过 ASSET_MAX_FILES 时删除最旧的文件
+- 通过 PUT/PATCH /api/books 或 PositionCalibrator.save_to_file 修改书籍后，
+  自动为 ASSET_SIZES 中的每个输出尺寸生成素材；搜索时没有素材则当场生成并保存
+- 生成素材在渲染进程池中执行（render_pool.precompile_assets），不占用请求线程
+
+目录结构:
+    ASSET_DIR/<哈希前2位>/<哈希>.npz
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from logs import get_logger
+
+ASSET_DIR = os.environ.get('ASSET_DIR', 'book_assets')
+# 预先生成素材的输出尺寸（宽x高，逗号分隔），预览请求会对齐到这些尺寸
+ASSET_SIZES = [tuple(int(v) for v in size.lower().split('x'))
+               for size in os.environ.get('ASSET_SIZES', '1280x720,1920x1080').split(',') if size.strip()]
+# 素材文件数上限
+ASSET_MAX_FILES = int(os.environ.get('ASSET_MAX_FILES', 20000))
+# 素材格式版本（渲染效果变化时递增，旧文件不再使用）
+ASSET_VERSION = 1
+
+logger = get_logger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _image_stamp(image_path):
+    try:
+        st = os.stat(image_path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def asset_key(image_path, size, position, book_name="", points=None):
+    """
+    素材哈希（书架图片替换、书籍位置或书名变化时都会改变）
+    size: 输出尺寸，None 表示原图尺寸
+    """
+    payload = json.dumps([
+        ASSET_VERSION,
+        os.path.abspath(image_path),
+        _image_stamp(image_path),
+        list(size) if size else None,
+        [round(float(v), 6) for v in position] if position else None,
+        [[round(float(v), 6) for v in p] for p in points] if points and len(points) == 4 else None,
+        book_name or ""
+    ], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _asset_path(key):
+    return os.path.join(ASSET_DIR, key[:2], key + '.npz')
+
+
+def load(key):
+    """读取素材，不存在或损坏时返回 None"""
+    import numpy as np
+
+    path = _asset_path(key)
+    try:
+        with np.load(path) as data:
+            meta = data['meta'].tolist()
+            title = data['title'] if 'title' in data.files else None
+            assets = {
+                'size': (meta[0], meta[1]),
+                'bbox': tuple(meta[2:6]),
+                'four_point': bool(meta[6]),
+                'roi': tuple(meta[7:11]),
+                'mask': data['mask'],
+                'glow': data['glow'],
+                'title': title,
+                'title_origin': tuple(meta[11:13]) if title is not None else None
+            }
+    except FileNotFoundError:
+        metrics.count_cache('book_assets', False)
+        return None
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        logger.warning('素材文件损坏，重新生成', extra={'path': path, 'error': str(e)})
+        metrics.count_cache('book_assets', False)
+        return None
+    metrics.count_cache('book_assets', True)
+    return assets
+
+
+def save(key, assets):
+    """保存素材（先写临时文件再改名，读取方不会看到写到一半的文件）"""
+    import numpy as np
+
+    path = _asset_path(key)
+    title_origin = assets['title_origin'] or (0, 0)
+    meta = np.array(list(assets['size']) + list(assets['bbox']) + [int(assets['four_point'])]
+                    + list(assets['roi']) + list(title_origin), np.int64)
+    arrays = {'meta': meta, 'mask': assets['mask'], 'glow': assets['glow']}
+    if assets['title'] is not None:
+        arrays['title'] = assets['title']
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning('素材保存失败', extra={'path': path, 'error': str(e)})
+
+
+def prune(max_files=None):
+    """文件数超过上限时删除最旧的素材，返回删除的文件数"""
+    max_files = ASSET_MAX_FILES if max_files is None else max_files
+    files = []
+    for root, _, names in os.walk(ASSET_DIR):
+        for name in names:
+            if name.endswith('.npz'):
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+    removed = 0
+    if len(files) > max_files:
+        files.sort()
+        for _, path in files[:len(files) - max_files]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def precompile(image_path, books, projector=None, sizes=None):
+    """
+    为书籍生成 ASSET_SIZES 中每个输出尺寸的素材（已有的跳过）
+    books: {book_key: book_info}（BookDatabase.books 格式）
+    返回: 新生成的素材数
+    """
+    if projector is None:
+        from projector_simple import ProjectorSimple
+        projector = ProjectorSimple(image_path)
+    if projector.original_image is None:
+        return 0
+
+    built = 0
+    with metrics.span('assets.precompile'):
+        for size in sizes or ASSET_SIZES:
+            dimensions = projector.output_dimensions(size)
+            for book_key, info in books.items():
+                position = info.get('position')
+                points = info.get('points')
+                if not position and not (points and len(points) == 4):
+                    continue
+                book_name = info.get('full_name', book_key)
+                key = asset_key(projector.image_path, dimensions, position, book_name, points)
+                if os.path.exists(_asset_path(key)):
+                    continue
+                save(key, projector.build_assets(position, book_name, points, size))
+                built += 1
+    if built:
+        logger.info('书籍素材已生成', extra={'image': image_path, 'books': len(books), 'assets': built})
+        prune()
+    return built
+
+
+def _precompile_job(image_path, output_dir, books):
+    import render_pool
+
+    try:
+        render_pool.run(render_pool.precompile_assets, image_path, output_dir, books)
+    except (render_pool.RenderPoolBusy, render_pool.RenderTimeout) as e:
+        # 下次搜索时会当场生成
+        logger.warning('素材预生成跳过', extra={'image': image_path, 'books': len(books), 'error': str(e)})
+    except Exception:
+        logger.exception('素材预生成失败', extra={'image': image_path, 'books': len(books)})
+
+
+def schedule(image_path, books, output_dir='./projector_output'):
+    """在后台生成书籍素材（不阻塞调用方）"""
+    global _executor
+    if not books:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='book-assets')
+    _executor.submit(_precompile_job, image_path, output_dir, dict(books))
+
+
+def snap_size(output_size):
+    """
+    预览输出尺寸对齐到能容纳它的最小 ASSET_SIZES 尺寸（提高素材命中率）
+    没有能容纳的尺寸时原样返回
+    """
+    if output_size is None:
+        return None
+    width, height = output_size
+    fits = [size for size in ASSET_SIZES if size[0] >= width and size[1] >= height]
+    if not fits:
+        return output_size
+    return min(fits, key=lambda size: size[0] * size[1])
@@ -151,6 +151,16 @@ class BookDatabase:
         query: 用户输入的查询字符串
         返回: (book_key, book_info) 或 None
         """
+        _, key, info = self.rank_book(query)
+        return key, info
+    
+    def rank_book(self, query):
+        """
+        搜索书籍并返回匹配等级（多个书架合并结果时用于排序）
+        等级: 1 精确匹配, 2 清理后精确匹配, 3 查询词全部在书名关键词中,
+              4 至少2个词匹配书名关键词, 5 至少2个词匹配完整书名, 6 单个关键词匹配
+        返回: (等级, book_key, book_info)，未找到时为 (None, None, None)
+        """
         query_lower = query.lower().strip()
         
         # 移除常见的干扰词
@@ -160,11 +170,11 @@ class BookDatabase:
         
         # 1. 精确匹配（最高优先级）
         if query_lower in self.books:
-            return query_lower, self.books[query_lower]
+            return 1, query_lower, self.books[query_lower]
         
         # 2. 清理后的精确匹配
         if query_clean and query_clean in self.books:
-            return query_clean, self.books[query_clean]
+            return 2, query_clean, self.books[query_clean]
         
         # 3. 检查关键词是否完全匹配书名关键词
         if query_words:
@@ -172,7 +182,7 @@ class BookDatabase:
                 key_words = key.split()
                 # 如果所有查询词都在书名关键词中
                 if all(word in key_words for word in query_words):
-                    return key, info
+                    return 3, key, info
         
         # 4. 检查查询是否包含在书名关键词中（至少2个词匹配）
         if len(query_words) >= 2:
@@ -180,7 +190,7 @@ class BookDatabase:
                 key_words = key.split()
                 matched_words = sum(1 for word in query_words if word in key_words)
                 if matched_words >= 2:  # 至少2个词匹配
-                    return key, info
+                    return 4, key, info
         
         # 5. 检查完整书名（至少2个词匹配）
         if len(query_words) >= 2:
@@ -188,7 +198,7 @@ class BookDatabase:
                 full_name_lower = info["full_name"].lower()
                 matched_words = sum(1 for word in query_words if word in full_name_lower)
                 if matched_words >= 2:  # 至少2个词匹配
-                    return key, info
+                    return 5, key, info
         
         # 6. 单个关键词匹配（仅当查询只有一个词时）
         if len(query_words) == 1:
@@ -197,9 +207,9 @@ class BookDatabase:
             if len(query_word) >= 4:
                 for key, info in self.books.items():
                     if query_word in key or query_word in info["full_name"].lower():
-                        return key, info
+                        return 6, key, info
         
-        return None, None
+        return None, None, None
     
     def get_all_books(self):
         """获取所有书籍列表"""
@@ -212,4 +222,3 @@ class BookDatabase:
             "shelf": shelf,
             "full_name": full_name
         }
-
@@ -5,11 +5,13 @@
 """
 
 import cv2
-import numpy as np
 import json
+import math
 import os
 import sys
+import book_assets
 from book_database import BookDatabase
+from catalogue import DB_FILE, catalogue_transaction
 
 class PositionCalibrator:
     def __init__(self, image_path, book_key=None):
@@ -28,6 +30,10 @@ class PositionCalibrator:
             raise ValueError(f"无法加载图片: {image_path}")
         
         self.display_image = self.original_image.copy()
+        self.static_layer = None
+        self._pending_rects = []
+        self._dynamic_rects = []
+        self._redraw = True
         self.width = self.original_image.shape[1]
         self.height = self.original_image.shape[0]
         
@@ -180,7 +186,7 @@ class PositionCalibrator:
                 print(f"点 {len(self.rotation_points)}: ({x}, {y})")
                 if len(self.rotation_points) >= 4:
                     print("✅ 已收集4个角点，可以按 's' 保存")
-                self.update_display()
+                self.request_redraw()
         else:
             # 普通模式：拖拽选择矩形
             if event == cv2.EVENT_LBUTTONDOWN:
@@ -188,12 +194,12 @@ class PositionCalibrator:
                 self.start_point = (x, y)
                 self.end_point = (x, y)
                 print(f"开始选择: ({x}, {y})")
-                self.update_display()
+                self.request_redraw()
             
             elif event == cv2.EVENT_MOUSEMOVE:
                 if self.drawing:
                     self.end_point = (x, y)
-                    self.update_display()
+                    self.request_redraw()
             
             elif event == cv2.EVENT_LBUTTONUP:
                 self.drawing = False
@@ -204,56 +210,138 @@ class PositionCalibrator:
                     x2, y2 = self.end_point
                     pos = self.normalize_position(x1, y1, x2, y2)
                     print(f"归一化坐标: {pos}")
-                self.update_display()
+                self.request_redraw()
     
-    def update_display(self):
-        """更新显示"""
-        # 从原始图片开始
-        self.display_image = self.original_image.copy()
-        
+    # ---------- 分层绘制 ----------
+    # 静态层: 原图 + 除当前书籍以外的所有书籍框，只在切换书籍时局部更新
+    # 动态层: 当前书籍、选择框、角点和文字，每次只恢复并重画上一帧和这一帧涉及的区域
+    # 缩放后的窗口图片也只更新变化的区域（大图每帧整体缩放是主要开销）
+    
+    def _clip_rect(self, x1, y1, x2, y2):
+        """裁剪到图片范围内，返回 (x1, y1, x2, y2)（不含 x2/y2），完全在图片外时返回 None"""
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(self.width, int(math.ceil(x2))), min(self.height, int(math.ceil(y2)))
+        if x1 >= x2 or y1 >= y2:
+            return None
+        return (x1, y1, x2, y2)
+    
+    def _book_rect(self, position):
+        """书籍框的像素坐标 (x1, y1, x2, y2)"""
+        px, py, pw, ph = self.normalized_to_pixel(position)
+        return (px - pw // 2, py - ph // 2, px + pw // 2, py + ph // 2)
+    
+    def _text_bounds(self, text, origin, scale, thickness):
+        (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        return (origin[0] - 1, origin[1] - th - 1, origin[0] + tw + 1, origin[1] + baseline + 1)
+    
+    def _static_bounds(self, key, info):
+        """静态层中一本书占用的区域（框 + 上方的书名）"""
+        x1, y1, x2, y2 = self._book_rect(info['position'])
+        tx1, ty1, tx2, ty2 = self._text_bounds(key, (x1, y1 - 10), 0.5, 1)
+        return (min(x1, tx1) - 2, min(y1, ty1) - 2, max(x2, tx2) + 2, max(y2, ty2) + 2)
+    
+    def _draw_static_book(self, key, info, target=None, offset=(0, 0)):
+        """在静态层（或其中一个区域 target，左上角为 offset）上画出一本书"""
+        target = self.static_layer if target is None else target
+        x1, y1, x2, y2 = self._book_rect(info['position'])
+        x1, y1, x2, y2 = x1 - offset[0], y1 - offset[1], x2 - offset[0], y2 - offset[1]
+        cv2.rectangle(target, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        # 显示书名
+        cv2.putText(target, key, (x1, y1 - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    
+    def _build_layers(self):
+        """创建静态层和缩放后的窗口图片（启动时执行一次）"""
+        self.static_layer = self.original_image.copy()
         # 显示所有已校准的书籍位置（绿色）
-        all_books = self.db.get_all_books()
-        for key, info in all_books.items():
+        for key, info in self.db.get_all_books().items():
             if key != self.current_book:
-                px, py, pw, ph = self.normalized_to_pixel(info['position'])
-                x1 = px - pw // 2
-                y1 = py - ph // 2
-                x2 = px + pw // 2
-                y2 = py + ph // 2
-                cv2.rectangle(self.display_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                # 显示书名
-                cv2.putText(self.display_image, key, (x1, y1 - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                self._draw_static_book(key, info)
+        self.display_image = self.static_layer.copy()
+        self._dynamic_rects = []
+        
+        # 调整窗口大小以适应屏幕
+        max_width = 1920
+        max_height = 1080
+        self.display_scale = min(max_width / self.width, max_height / self.height, 1.0)
+        if self.display_scale < 1.0:
+            self._scaled_image = cv2.resize(
+                self.display_image,
+                (int(self.width * self.display_scale), int(self.height * self.display_scale)),
+                interpolation=cv2.INTER_AREA)
+        else:
+            self._scaled_image = self.display_image
+    
+    def _refresh_static(self, rect):
+        """
+        重画静态层中的一个区域（恢复原图，再按原来的顺序画出与该区域相交的书籍）
+        只在区域内绘制，区域外书籍之间的覆盖关系保持不变
+        """
+        rect = self._clip_rect(*rect)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        region = self.static_layer[y1:y2, x1:x2]
+        region[:] = self.original_image[y1:y2, x1:x2]
+        for key, info in self.db.get_all_books().items():
+            if key == self.current_book:
+                continue
+            bx1, by1, bx2, by2 = self._static_bounds(key, info)
+            if bx1 < x2 and x1 < bx2 and by1 < y2 and y1 < by2:
+                self._draw_static_book(key, info, region, (x1, y1))
+        self._pending_rects.append(rect)
+    
+    def set_current_book(self, book_key):
+        """切换当前书籍：原来的书回到静态层，新的书从静态层移到动态层"""
+        previous = self.current_book
+        self.current_book = book_key
+        if self.static_layer is None:
+            return
+        all_books = self.db.get_all_books()
+        for key in (previous, book_key):
+            if key in all_books:
+                self._refresh_static(self._static_bounds(key, all_books[key]))
+        self.request_redraw()
+    
+    def request_redraw(self):
+        """标记需要重画（在主循环中处理，多个鼠标事件合并为一次重画）"""
+        self._redraw = True
+    
+    def _draw_dynamic(self):
+        """在显示图片上画出动态层，返回涉及的区域列表"""
+        img = self.display_image
+        rects = []
+        all_books = self.db.get_all_books()
         
         # 显示当前选中的书籍位置（蓝色，如果已存在）
         if self.current_book and self.current_book in all_books:
-            px, py, pw, ph = self.normalized_to_pixel(all_books[self.current_book]['position'])
-            x1 = px - pw // 2
-            y1 = py - ph // 2
-            x2 = px + pw // 2
-            y2 = py + ph // 2
-            cv2.rectangle(self.display_image, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            x1, y1, x2, y2 = self._book_rect(all_books[self.current_book]['position'])
+            cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            rects.append((x1 - 2, y1 - 2, x2 + 2, y2 + 2))
         
         # 显示当前正在绘制的选择框（红色）
         if self.rotation_mode:
             # 旋转矩形模式：显示4个角点
             if len(self.rotation_points) > 0:
                 for i, pt in enumerate(self.rotation_points):
-                    cv2.circle(self.display_image, pt, 5, (0, 0, 255), -1)
-                    cv2.putText(self.display_image, str(i+1), (pt[0]+10, pt[1]), 
+                    cv2.circle(img, pt, 5, (0, 0, 255), -1)
+                    cv2.putText(img, str(i+1), (pt[0]+10, pt[1]), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-                # 如果有点，绘制连线
+                    rects.append(self._text_bounds(str(i+1), (pt[0]+10, pt[1]), 0.5, 2))
+                # 如果有点，绘制连线（4个点时即为完整的四边形）
                 if len(self.rotation_points) >= 2:
                     for i in range(len(self.rotation_points)):
                         pt1 = self.rotation_points[i]
                         pt2 = self.rotation_points[(i+1) % len(self.rotation_points)]
-                        cv2.line(self.display_image, pt1, pt2, (0, 0, 255), 2)
-                # 如果4个点都有了，绘制完整矩形
-                if len(self.rotation_points) == 4:
-                    pts = np.array(self.rotation_points, np.int32)
-                    cv2.polylines(self.display_image, [pts], True, (0, 0, 255), 2)
+                        cv2.line(img, pt1, pt2, (0, 0, 255), 2)
+                xs = [p[0] for p in self.rotation_points]
+                ys = [p[1] for p in self.rotation_points]
+                rects.append((min(xs) - 6, min(ys) - 6, max(xs) + 6, max(ys) + 6))
         elif self.start_point and self.end_point:
-            cv2.rectangle(self.display_image, self.start_point, self.end_point, (0, 0, 255), 2)
+            cv2.rectangle(img, self.start_point, self.end_point, (0, 0, 255), 2)
+            xs = (self.start_point[0], self.end_point[0])
+            ys = (self.start_point[1], self.end_point[1])
+            rects.append((min(xs) - 2, min(ys) - 2, max(xs) + 2, max(ys) + 2))
         
         # 显示当前书籍信息
         if self.current_book:
@@ -262,32 +350,54 @@ class PositionCalibrator:
             if book_info:
                 pos = book_info['position']
                 info_text += f" | 位置: ({pos[0]:.3f}, {pos[1]:.3f}, {pos[2]:.3f}, {pos[3]:.3f})"
-            cv2.putText(self.display_image, info_text, (10, 30),
+            cv2.putText(img, info_text, (10, 30),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            rects.append(self._text_bounds(info_text, (10, 30), 0.7, 2))
         
         # 显示操作提示
         if self.rotation_mode:
             mode_text = f"旋转模式 | 已选点: {len(self.rotation_points)}/4 | 's': Save | 't': 切换模式 | 'r': 重置 | 'q': Quit"
         else:
             mode_text = "普通模式 | Click & Drag: Select | 's': Save | 't': 旋转模式 | 'n': Next | 'q': Quit"
-        cv2.putText(self.display_image, mode_text,
+        cv2.putText(img, mode_text,
                    (10, self.height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        
-        # 调整窗口大小以适应屏幕
-        max_width = 1920
-        max_height = 1080
-        scale = min(max_width / self.width, max_height / self.height, 1.0)
-        self.display_scale = scale
-        
-        if scale < 1.0:
-            display_width = int(self.width * scale)
-            display_height = int(self.height * scale)
-            display_img = cv2.resize(self.display_image, (display_width, display_height))
-        else:
-            display_img = self.display_image
-            self.display_scale = 1.0
-        
-        cv2.imshow('Book Position Calibrator', display_img)
+        rects.append(self._text_bounds(mode_text, (10, self.height - 20), 0.5, 1))
+        return [r for r in (self._clip_rect(*rect) for rect in rects) if r is not None]
+    
+    def _update_scaled(self, rect):
+        """把显示图片的一个区域缩放到窗口图片中"""
+        if self._scaled_image is self.display_image:
+            return
+        scale = self.display_scale
+        sh, sw = self._scaled_image.shape[:2]
+        x1, y1, x2, y2 = rect
+        sx1, sy1 = int(x1 * scale), int(y1 * scale)
+        sx2, sy2 = min(sw, int(math.ceil(x2 * scale)) + 1), min(sh, int(math.ceil(y2 * scale)) + 1)
+        if sx1 >= sx2 or sy1 >= sy2:
+            return
+        # 与目标区域对齐的源区域
+        fx1, fy1 = int(sx1 / scale), int(sy1 / scale)
+        fx2, fy2 = min(self.width, int(math.ceil(sx2 / scale))), min(self.height, int(math.ceil(sy2 / scale)))
+        self._scaled_image[sy1:sy2, sx1:sx2] = cv2.resize(
+            self.display_image[fy1:fy2, fx1:fx2], (sx2 - sx1, sy2 - sy1), interpolation=cv2.INTER_AREA)
+    
+    def update_display(self):
+        """更新显示（只重画变化的区域）"""
+        self._redraw = False
+        if self.static_layer is None:
+            self._build_layers()
+        
+        # 恢复上一帧动态层和静态层变化的区域
+        dirty = self._dynamic_rects + self._pending_rects
+        self._pending_rects = []
+        for x1, y1, x2, y2 in dirty:
+            self.display_image[y1:y2, x1:x2] = self.static_layer[y1:y2, x1:x2]
+        
+        self._dynamic_rects = self._draw_dynamic()
+        for rect in dirty + self._dynamic_rects:
+            self._update_scaled(rect)
+        
+        cv2.imshow('Book Position Calibrator', self._scaled_image)
         # 确保窗口在前台显示
         try:
             cv2.setWindowProperty('Book Position Calibrator', cv2.WND_PROP_TOPMOST, 1)
@@ -392,7 +502,7 @@ class PositionCalibrator:
         
         # 从第一本书开始
         book_index = 0
-        self.current_book = self.books_to_calibrate[book_index]
+        self.set_current_book(self.books_to_calibrate[book_index])
         
         print(f"\n当前书籍: {self.current_book}")
         print("请点击并拖拽选择书籍位置...")
@@ -404,7 +514,7 @@ class PositionCalibrator:
         # 确保窗口显示（多次尝试）
         for _ in range(5):
             cv2.waitKey(100)
-            cv2.imshow(window_name, self.display_image)
+            cv2.imshow(window_name, self._scaled_image)
         
         # 保存初始预览图片
         preview_path = os.path.join(os.path.dirname(self.image_path), 'calibration_preview.jpg')
@@ -412,8 +522,9 @@ class PositionCalibrator:
         print(f"📸 预览图片已保存: {preview_path}")
         
         while True:
-            # 持续更新显示
-            self.update_display()
+            # 只在鼠标事件之后重画（按键处理中会直接重画）
+            if self._redraw:
+                self.update_display()
             
             key = cv2.waitKey(30) & 0xFF  # 增加等待时间，确保窗口响应
             
@@ -456,7 +567,7 @@ class PositionCalibrator:
                 # 下一个书籍
                 if self.save_position():
                     book_index = (book_index + 1) % len(self.books_to_calibrate)
-                    self.current_book = self.books_to_calibrate[book_index]
+                    self.set_current_book(self.books_to_calibrate[book_index])
                     self.start_point = None
                     self.end_point = None
                     print(f"\n当前书籍: {self.current_book}")
@@ -466,7 +577,7 @@ class PositionCalibrator:
                 # 上一个书籍
                 if self.save_position():
                     book_index = (book_index - 1) % len(self.books_to_calibrate)
-                    self.current_book = self.books_to_calibrate[book_index]
+                    self.set_current_book(self.books_to_calibrate[book_index])
                     self.start_point = None
                     self.end_point = None
                     print(f"\n当前书籍: {self.current_book}")
@@ -496,15 +607,13 @@ class PositionCalibrator:
                     print("\n🔄 切换到普通矩形模式")
                     self.rotation_points = []
                 self.update_display()
-            
-            self.update_display()
         
         cv2.destroyAllWindows()
         print("✅ 校准完成！")
     
     def save_to_file(self):
         """保存到文件（自动更新book_database.py）"""
-        db_file = "book_database.py"
+        db_file = DB_FILE
         if not os.path.exists(db_file):
             print(f"❌ 找不到文件: {db_file}")
             return
@@ -513,72 +622,76 @@ class PositionCalibrator:
         print("正在保存校准后的位置到文件...")
         print("="*60)
         
-        # 读取文件
-        with open(db_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 备份原文件
-        backup_file = db_file + ".backup"
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-        print(f"📝 已备份原文件到: {backup_file}")
-        
-        # 更新每个校准的书籍位置
-        import re
-        updated_count = 0
-        all_books = self.db.get_all_books()
-        
-        # 只保存实际修改过的书籍
-        books_to_save = self.modified_books if self.modified_books else self.books_to_calibrate
-        
-        if not books_to_save:
-            print("⚠️  没有修改任何书籍位置")
-            return
-        
-        print(f"\n📝 准备保存 {len(books_to_save)} 本书籍的位置:")
-        for book_key in books_to_save:
-            print(f"   - {book_key}")
-        
-        for book_key in books_to_save:
-            if book_key not in all_books:
-                print(f"⚠️  跳过: {book_key}（不在数据库中）")
-                continue
+        with catalogue_transaction() as txn:
+            # 读取文件（持有目录写锁，写入前会按版本号自动备份）
+            lines = txn.content.splitlines(keepends=True)
             
-            position = all_books[book_key]['position']
-            x, y, w, h = position
-            new_position = f"({x:.4f}, {y:.4f}, {w:.4f}, {h:.4f})"
+            # 更新每个校准的书籍位置
+            import re
+            updated_count = 0
+            updated_keys = []
+            all_books = self.db.get_all_books()
             
-            # 查找并替换位置
-            found = False
-            for i, line in enumerate(lines):
-                if f'"{book_key}"' in line and ':' in line and '{' in line:
-                    # 在接下来的几行中查找position行
-                    for j in range(i, min(i+10, len(lines))):
-                        if '"position"' in lines[j]:
-                            old_line = lines[j]
-                            pattern = r'"position":\s*\([^)]+\)'
-                            new_line = re.sub(pattern, f'"position": {new_position}', old_line)
-                            if new_line != old_line:
-                                lines[j] = new_line
-                                updated_count += 1
-                                found = True
-                                print(f"✅ 更新: {book_key} -> {new_position}")
-                            else:
-                                print(f"ℹ️  跳过: {book_key}（位置未改变）")
-                            break
-                    break
+            # 只保存实际修改过的书籍
+            books_to_save = self.modified_books if self.modified_books else self.books_to_calibrate
             
-            if not found:
-                print(f"⚠️  未找到: {book_key}，可能需要手动更新")
-        
-        # 保存更新后的文件
-        if updated_count > 0:
-            with open(db_file, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-            print(f"\n✅ 已更新 {updated_count} 本书籍的位置到 {db_file}")
-            print("   请重启主程序以使用新位置")
-        else:
-            print("⚠️  没有更新任何书籍位置")
+            if not books_to_save:
+                print("⚠️  没有修改任何书籍位置")
+                return
+            
+            print(f"\n📝 准备保存 {len(books_to_save)} 本书籍的位置:")
+            for book_key in books_to_save:
+                print(f"   - {book_key}")
+            
+            for book_key in books_to_save:
+                if book_key not in all_books:
+                    print(f"⚠️  跳过: {book_key}（不在数据库中）")
+                    continue
+                
+                position = all_books[book_key]['position']
+                x, y, w, h = position
+                new_position = f"({x:.4f}, {y:.4f}, {w:.4f}, {h:.4f})"
+                
+                # 查找并替换位置
+                found = False
+                for i, line in enumerate(lines):
+                    if f'"{book_key}"' in line and ':' in line and '{' in line:
+                        # 在接下来的几行中查找position行
+                        for j in range(i, min(i+10, len(lines))):
+                            if '"position"' in lines[j]:
+                                old_line = lines[j]
+                                pattern = r'"position":\s*\([^)]+\)'
+                                new_line = re.sub(pattern, f'"position": {new_position}', old_line)
+                                if new_line != old_line:
+                                    lines[j] = new_line
+                                    updated_count += 1
+                                    updated_keys.append(book_key)
+                                    found = True
+                                    print(f"✅ 更新: {book_key} -> {new_position}")
+                                else:
+                                    print(f"ℹ️  跳过: {book_key}（位置未改变）")
+                                break
+                        break
+                
+                if not found:
+                    print(f"⚠️  未找到: {book_key}，可能需要手动更新")
+            
+            # 保存更新后的文件
+            if updated_count > 0:
+                _, version = txn.commit(''.join(lines))
+                print(f"\n✅ 已更新 {updated_count} 本书籍的位置到 {db_file} (版本 {version})")
+                print("   请重启主程序以使用新位置")
+            else:
+                print("⚠️  没有更新任何书籍位置")
+                return
+        
+        # 重新生成位置变化的书籍的高亮素材（搜索时只需合成）
+        try:
+            built = book_assets.precompile(self.image_path, {key: txn.db.books[key] for key in updated_keys
+                                                             if key in txn.db.books})
+            print(f"✅ 已生成 {built} 个高亮素材")
+        except Exception as e:
+            print(f"⚠️  高亮素材生成失败（搜索时会重新生成）: {e}")
 
 def main():
     """主函数"""
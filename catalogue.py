@@ -0,0 +1,540 @@
+"""
+书籍目录模块
+负责加载 book_database.py 并维护目录版本号：
+- 整个目录有一个递增的版本号（用于 ETag / If-None-Match）
+- 每本书记录最后一次变更时的版本号（用于增量同步和乐观并发控制）
+
+所有写操作都通过 catalogue_transaction() 进行：
+- 使用文件锁，多个 gunicorn worker 之间互斥
+- 先写临时文件再原子重命名，读取方永远不会看到写了一半的文件
+- 每次写入前按版本号保存备份
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+import events
+import metrics
+from logs import get_logger, debug_sampled
+
+# 文件锁（Windows 上不可用时退化为进程内锁）
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# 数据库文件（可通过 BOOK_DATABASE_FILE 指向合成目录等其他文件，见 synthetic_data.py）
+DB_FILE = os.environ.get('BOOK_DATABASE_FILE', 'book_database.py')
+# 版本文件、锁文件和备份目录跟随数据库文件
+_DB_BASE = os.path.splitext(DB_FILE)[0]
+_DB_NAME = os.path.basename(_DB_BASE)
+VERSIONS_FILE = _DB_BASE + '.versions.json'
+LOCK_FILE = DB_FILE + '.lock'
+BACKUP_DIR = _DB_BASE + '_backups'
+# 保留最近多少个版本的备份
+BACKUP_KEEP = 20
+
+# 进程内的锁状态（支持同一线程重入）
+logger = get_logger(__name__)
+
+_local = threading.local()
+_thread_lock = threading.RLock()
+
+# 已加载目录的缓存（文件未变化时不再重新执行 book_database.py）
+_cache = {
+    'fingerprint': None,
+    'db': None,
+    'state': None
+}
+
+
+class CatalogueConflict(Exception):
+    """书籍在客户端加载之后已被其他人修改"""
+    def __init__(self, book_key, base_version, current_version):
+        super().__init__(f"书籍 '{book_key}' 已在版本 {current_version} 被修改（客户端版本: {base_version}）")
+        self.book_key = book_key
+        self.base_version = base_version
+        self.current_version = current_version
+
+
+@contextmanager
+def catalogue_lock():
+    """
+    目录写锁（跨进程互斥，同一线程可重入）
+    """
+    depth = getattr(_local, 'depth', 0)
+    if depth > 0:
+        _local.depth = depth + 1
+        try:
+            yield
+        finally:
+            _local.depth -= 1
+        return
+    
+    with _thread_lock:
+        lock_fd = None
+        if FCNTL_AVAILABLE:
+            lock_fd = open(LOCK_FILE, 'a')
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        _local.depth = 1
+        try:
+            yield
+        finally:
+            _local.depth = 0
+            if lock_fd is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+                lock_fd.close()
+
+
+def _atomic_write(path, content):
+    """先写同目录下的临时文件，fsync 后原子重命名"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_file = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def _fingerprint(path):
+    """文件指纹：修改时间（纳秒）+ 文件大小"""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def book_digest(info):
+    """计算单本书数据的摘要，用于判断内容是否变化"""
+    payload = json.dumps(info, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def load_database(path):
+    """
+    直接执行数据库文件并返回 BookDatabase 实例
+    不使用 importlib.reload，避免同一秒内多次写入时读到过期的 .pyc 缓存
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    namespace = {'__name__': 'book_database', '__file__': os.path.abspath(path)}
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace['BookDatabase']()
+
+
+def _read_state():
+    if not os.path.exists(VERSIONS_FILE):
+        return {}
+    try:
+        with open(VERSIONS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # 版本文件损坏时从头开始计数
+        return {}
+
+
+def _write_state(state):
+    """原子写入版本文件"""
+    _atomic_write(VERSIONS_FILE, json.dumps(state, ensure_ascii=False))
+
+
+def sync_versions(books, fingerprint, persist=True):
+    """
+    将目录内容与版本文件对比，有变化的书籍分配新的版本号
+    无论书籍是通过 API、校准工具还是手工修改的，都能被检测到
+    persist: 是否写入版本文件（为 False 时只在内存中计算，用于只读文件系统）
+    返回: (版本状态字典, 变化的书籍关键词列表, 删除的书籍关键词列表)
+    persist 为 True 时调用方需要持有 catalogue_lock()
+    """
+    state = _read_state()
+    if state and state.get('fingerprint') == fingerprint:
+        return state, [], []
+
+    old_books = state.get('books', {})
+    deleted = state.get('deleted', {})
+    digests = {key: book_digest(info) for key, info in books.items()}
+
+    changed = [key for key, digest in digests.items()
+               if old_books.get(key, {}).get('digest') != digest]
+    removed = [key for key in old_books if key not in digests]
+
+    version = state.get('version', 0)
+    if changed or removed or not state:
+        version += 1
+
+    changed_set = set(changed)
+    new_books = {}
+    for key, digest in digests.items():
+        if key in changed_set:
+            new_books[key] = {'digest': digest, 'version': version}
+        else:
+            new_books[key] = old_books[key]
+        deleted.pop(key, None)
+    for key in removed:
+        deleted[key] = version
+
+    state = {
+        'version': version,
+        'fingerprint': fingerprint,
+        'books': new_books,
+        'deleted': deleted
+    }
+    if persist:
+        _write_state(state)
+    return state, changed, removed
+
+
+def load_catalogue():
+    """
+    加载书籍目录
+    读取不加锁: 版本文件已经与数据库文件一致时直接使用；
+    只有数据库文件变化后第一个发现的进程加锁分配新版本号并发布事件
+    返回: (BookDatabase 实例, 版本状态字典)
+    """
+    fingerprint = _fingerprint(DB_FILE)
+    hit = _cache['db'] is not None and _cache['fingerprint'] == fingerprint
+    metrics.count_cache('catalogue', hit)
+    if hit:
+        return _cache['db'], _cache['state']
+
+    changed = removed = []
+    with metrics.span('catalogue.reload'):
+        db = load_database(DB_FILE)
+        state = _read_state()
+        # 读取期间文件被替换时，按加锁的方式重新加载
+        stale = state.get('fingerprint') != fingerprint or _fingerprint(DB_FILE) != fingerprint
+        if stale:
+            try:
+                with catalogue_lock():
+                    current = _fingerprint(DB_FILE)
+                    if current != fingerprint:
+                        fingerprint = current
+                        db = load_database(DB_FILE)
+                    state, changed, removed = sync_versions(db.books, fingerprint)
+            except OSError as e:
+                # 只读文件系统（如 Vercel）: 在内存中计算版本号，不写版本文件、不发布事件
+                logger.warning('无法更新目录版本文件，使用内存中的版本号',
+                               extra={'path': VERSIONS_FILE, 'error': str(e)})
+                fingerprint = _fingerprint(DB_FILE)
+                db = load_database(DB_FILE)
+                state, changed, removed = sync_versions(db.books, fingerprint, persist=False)
+                changed = removed = []
+        _cache.update({'db': db, 'state': state, 'fingerprint': fingerprint})
+    if changed or removed:
+        # 只有发现变化并分配新版本号的进程会发布事件
+        events.publish('catalogue', {
+            'version': state['version'],
+            'books': {key: db.books[key] for key in changed},
+            'deleted': removed
+        })
+    return db, state
+
+
+def changed_since(state, since):
+    """
+    返回某个版本之后发生变化的书籍
+    返回: (变化的书籍关键词列表, 已删除的书籍关键词列表)
+    """
+    changed = [key for key, meta in state.get('books', {}).items()
+               if meta['version'] > since]
+    deleted = [key for key, version in state.get('deleted', {}).items()
+               if version > since]
+    return changed, deleted
+
+
+def _is_entry_line(line, book_key):
+    """
+    是否为该书籍条目的起始行（"书名关键词": {）
+    只匹配行首的键，避免其他书的 full_name 恰好等于该关键词时误匹配
+    """
+    return line.lstrip().startswith(f'"{book_key}":') and '{' in line
+
+
+def apply_book_delete(content, book_key):
+    """
+    从数据库文件内容中删除一本书的条目
+    返回: (新内容, 是否找到该书籍)
+    """
+    lines = content.splitlines(keepends=True)
+    new_lines = []
+    skip_entry = False
+    found = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _is_entry_line(line, book_key):
+            # 找到开始，跳过整个条目
+            skip_entry = True
+            found = True
+            i += 1
+            continue
+        
+        if skip_entry:
+            # 检查是否到达条目结束
+            if '},' in line or '}' in line:
+                # 检查缩进，如果缩进减少，说明条目结束
+                if line.strip().startswith('}'):
+                    skip_entry = False
+                    # 跳过这一行（删除）
+                    i += 1
+                    continue
+            # 跳过当前行
+            i += 1
+            continue
+        
+        new_lines.append(line)
+        i += 1
+    
+    return ''.join(new_lines), found
+
+
+@metrics.span('catalogue.patch')
+def apply_book_update(content, book_key, data):
+    """
+    在数据库文件内容上应用单本书的更新（位置、四点、书名）
+    data: 与 PUT /api/books/<key> 相同的请求数据
+    返回: (新内容, 结果字典)
+    结果字典: position_found / points_found / name_found
+    数据格式错误时抛出 ValueError
+    """
+    position_found = False
+    name_found = False
+    points_found = False
+    # 修改前后的完整行只在采样命中时输出
+    verbose = debug_sampled(logger)
+    
+    # 更新位置（支持四点模式）
+    if 'position' in data or 'points' in data:
+        # 优先使用四点模式
+        if 'points' in data and data['points']:
+            points = data['points']
+            if len(points) != 4:
+                raise ValueError('四点模式需要4个点')
+            
+            # 计算四个点的边界框（用于position字段，保持兼容性）
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            x_min, x_max = min(xs), max(xs)
+            y_min, y_max = min(ys), max(ys)
+            
+            # 转换为矩形格式（中心点+宽高）
+            center_x = (x_min + x_max) / 2
+            center_y = (y_min + y_max) / 2
+            width = x_max - x_min
+            height = y_max - y_min
+            
+            new_position = f"({center_x:.4f}, {center_y:.4f}, {width:.4f}, {height:.4f})"
+            
+            # 保存四个点的坐标（作为新字段）
+            points_str = f"[({points[0][0]:.4f}, {points[0][1]:.4f}), ({points[1][0]:.4f}, {points[1][1]:.4f}), ({points[2][0]:.4f}, {points[2][1]:.4f}), ({points[3][0]:.4f}, {points[3][1]:.4f})]"
+            
+        elif 'position' in data:
+            position = data['position']
+            if len(position) != 4:
+                raise ValueError('位置数据格式错误，需要4个值 [x, y, w, h]')
+            
+            x, y, w, h = position
+            new_position = f"({x:.4f}, {y:.4f}, {w:.4f}, {h:.4f})"
+            points_str = None
+        else:
+            raise ValueError('需要提供position或points数据')
+        
+        # 更精确的替换
+        lines = content.split('\n')
+        for i, line in enumerate(lines):
+            # 匹配书籍键，考虑引号和冒号
+            if _is_entry_line(line, book_key):
+                # 在接下来的几行中查找position行
+                for j in range(i, min(i+20, len(lines))):
+                    if '"position"' in lines[j]:
+                        old_line = lines[j]
+                        # 匹配各种格式：可能是 "position": (x, y, w, h) 或 "position": (x, y, w, h),
+                        pattern = r'"position":\s*\([^)]+\)'
+                        new_line = re.sub(pattern, f'"position": {new_position}', old_line)
+                        if new_line != old_line:
+                            lines[j] = new_line
+                            position_found = True
+                            if verbose:
+                                logger.debug('更新位置', extra={'book_key': book_key,
+                                                              'old': old_line.strip(), 'new': new_line.strip()})
+                        else:
+                            # 即使位置值相同，如果我们在更新points，也应该标记position_found为True
+                            # 因为position字段需要存在（用于兼容性）
+                            if points_str:
+                                position_found = True
+                            if verbose:
+                                logger.debug('位置未改变', extra={'book_key': book_key})
+                        
+                        # 如果有四点数据，添加或更新points字段
+                        if points_str:
+                            # 查找是否已有points字段
+                            has_points = False
+                            for k in range(j, min(j+15, len(lines))):
+                                if '"points"' in lines[k]:
+                                    # 更新现有的points字段
+                                    old_points_line = lines[k]
+                                    # 使用更简单可靠的正则表达式：匹配整个points列表（包括嵌套的括号）
+                                    # 使用非贪婪匹配，匹配到第一个完整的 ] 为止
+                                    pattern_points = r'"points":\s*\[.*?\]'
+                                    match = re.search(pattern_points, old_points_line)
+                                    if match:
+                                        # 找到匹配，替换整个points部分
+                                        new_points_line = re.sub(pattern_points, f'"points": {points_str}', old_points_line)
+                                        if new_points_line != old_points_line:
+                                            lines[k] = new_points_line
+                                            points_found = True
+                                            if verbose:
+                                                logger.debug('更新四点', extra={
+                                                    'book_key': book_key,
+                                                    'old': old_points_line.strip(),
+                                                    'new': new_points_line.strip()
+                                                })
+                                        elif verbose:
+                                            logger.debug('四点未改变（值相同）', extra={'book_key': book_key})
+                                    else:
+                                        logger.warning('无法匹配points行', extra={
+                                            'book_key': book_key, 'line': old_points_line.strip()})
+                                    has_points = True
+                                    break
+                            
+                            # 如果没有points字段，在position后面添加
+                            if not has_points:
+                                # 在position行后面插入points行
+                                indent = len(lines[j]) - len(lines[j].lstrip())
+                                points_line = ' ' * indent + f'"points": {points_str},'
+                                lines.insert(j + 1, points_line)
+                                points_found = True
+                                if verbose:
+                                    logger.debug('添加四点', extra={'book_key': book_key, 'new': points_line.strip()})
+                        break
+                break
+        
+        # 如果更新了位置或四点，更新内容
+        if position_found or points_found:
+            content = '\n'.join(lines)
+        elif verbose:
+            logger.debug('未找到位置行或四点数据未改变', extra={'book_key': book_key, 'points': points_str})
+    
+    # 更新书名
+    if 'full_name' in data:
+        full_name = data['full_name']
+        # 转义引号
+        escaped_name = full_name.replace('"', '\\"')
+        
+        lines = content.split('\n')
+        for i, line in enumerate(lines):
+            # 匹配书籍键，考虑引号和冒号
+            if _is_entry_line(line, book_key):
+                # 在接下来的几行中查找full_name行
+                for j in range(i, min(i+15, len(lines))):
+                    if '"full_name"' in lines[j]:
+                        old_line = lines[j]
+                        pattern = r'"full_name":\s*"[^"]*"'
+                        new_line = re.sub(pattern, f'"full_name": "{escaped_name}"', old_line)
+                        if new_line != old_line:
+                            lines[j] = new_line
+                            name_found = True
+                            if verbose:
+                                logger.debug('更新书名', extra={'book_key': book_key,
+                                                              'old': old_line.strip(), 'new': new_line.strip()})
+                        elif verbose:
+                            logger.debug('书名未改变', extra={'book_key': book_key})
+                        break
+                break
+        
+        if name_found:
+            content = '\n'.join(lines)
+        else:
+            logger.warning('未找到书名行', extra={'book_key': book_key})
+    
+    return content, {
+        'position_found': position_found,
+        'points_found': points_found,
+        'name_found': name_found
+    }
+
+
+class CatalogueTransaction:
+    """
+    一次目录写事务（由 catalogue_transaction() 创建，持有写锁）
+    content: 当前数据库文件内容
+    db / state: 当前目录和版本状态
+    """
+    def __init__(self):
+        self.db, self.state = load_catalogue()
+        with open(DB_FILE, 'r', encoding='utf-8') as f:
+            self.content = f.read()
+    
+    @property
+    def version(self):
+        return self.state['version']
+    
+    def book_version(self, book_key):
+        """书籍最后一次变更的版本号（已删除的书籍返回删除时的版本号）"""
+        meta = self.state.get('books', {}).get(book_key)
+        if meta:
+            return meta['version']
+        return self.state.get('deleted', {}).get(book_key, 0)
+    
+    def check_version(self, book_key, base_version):
+        """
+        乐观并发检查：客户端基于 base_version 修改书籍，
+        如果书籍在这之后已被修改，抛出 CatalogueConflict
+        base_version 为 None 时不检查（兼容旧客户端）
+        """
+        if base_version is None:
+            return
+        current = self.book_version(book_key)
+        if current > int(base_version):
+            raise CatalogueConflict(book_key, base_version, current)
+    
+    def commit(self, content):
+        """
+        校验语法、备份当前版本、原子写入
+        语法错误时抛出 SyntaxError，文件保持不变
+        返回: (写入后的文件大小, 新的目录版本号)
+        """
+        with metrics.span('catalogue.commit'):
+            compile(content, DB_FILE, 'exec')
+            
+            # 按版本号备份当前文件
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            backup_file = os.path.join(BACKUP_DIR, f"{_DB_NAME}.v{self.version}.py")
+            shutil.copy2(DB_FILE, backup_file)
+            _prune_backups()
+            
+            _atomic_write(DB_FILE, content)
+        self.content = content
+        self.db, self.state = load_catalogue()
+        return os.path.getsize(DB_FILE), self.version
+
+
+def _prune_backups():
+    """只保留最近 BACKUP_KEEP 个版本的备份"""
+    backups = []
+    for name in os.listdir(BACKUP_DIR):
+        match = re.match(re.escape(_DB_NAME) + r'\.v(\d+)\.py$', name)
+        if match:
+            backups.append((int(match.group(1)), name))
+    backups.sort()
+    for _, name in backups[:-BACKUP_KEEP]:
+        os.remove(os.path.join(BACKUP_DIR, name))
+
+
+@contextmanager
+def catalogue_transaction():
+    """
+    开始一次目录写事务
+    用法:
+        with catalogue_transaction() as txn:
+            txn.check_version(key, base_version)
+            content, _ = apply_book_update(txn.content, key, data)
+            txn.commit(content)
+    """
+    with catalogue_lock():
+        yield CatalogueTransaction()
@@ -0,0 +1,105 @@
+"""
+HTTP 压缩
+- 动态响应（JSON、HTML 等）超过 COMPRESS_MIN_SIZE 字节时按浏览器的 Accept-Encoding 即时压缩（br / gzip）
+- 静态文件在构建时预先压缩（见 static_assets.py），请求时直接发送压缩好的文件
+- 未安装 brotli 时只使用 gzip
+
+压缩后的响应 ETag 改为弱 ETag（与 nginx 相同），If-None-Match 仍然可以命中，
+If-Match（见 app._base_version）也能识别
+"""
+
+import gzip
+import os
+
+import metrics
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# 小于该大小（字节）的响应不压缩（压缩节省的传输时间不如压缩本身的开销）
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# 即时压缩的级别（gzip 1-9 / brotli 0-11），静态文件构建时使用最高级别
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+# 即时压缩的响应类型
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css',
+                      'application/javascript', 'text/javascript', 'image/svg+xml'}
+
+
+def available_encodings():
+    """服务器支持的编码（优先级从高到低）"""
+    return ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """
+    按 Accept-Encoding 选择编码（q=0 表示不接受），都不接受时返回 None
+    available: 可选的编码（优先级从高到低），默认为服务器支持的全部编码
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    for coding in available or available_encodings():
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(data, encoding, best=False):
+    """
+    压缩数据
+    best: 为 True 时使用最高压缩级别（构建静态文件时使用）
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0: 相同内容压缩结果相同
+        return gzip.compress(data, compresslevel=9 if best else COMPRESS_LEVEL, mtime=0)
+    raise ValueError(f"不支持的编码: {encoding}")
+
+
+def compress_response(response, accept_encoding):
+    """
+    即时压缩 Flask 响应（在 after_request 中调用）
+    跳过: 文件响应（send_file）、流式响应（SSE）、已压缩的响应、小于 COMPRESS_MIN_SIZE 的响应
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    # 响应内容随 Accept-Encoding 变化，缓存需要分别保存
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    with metrics.span('response.compress'):
+        body = compress(data, encoding)
+    if len(body) >= len(data):
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,251 @@
+"""
+事件推送模块
+通过一个只追加的事件日志文件在多个进程之间广播事件：
+- gunicorn 的多个 worker
+- 语音识别主程序（main.py）
+浏览器通过 /api/events 订阅:
+- 推送（Server-Sent Events，follow）: 连接期间检查日志尾部，有新事件立即推送；
+  每个 worker 同时保持的推送连接数有上限（见 app.EVENTS_MAX_STREAMS），避免占满 worker 线程
+- 轮询（read_since）: 推送连接数已满或浏览器不支持 EventSource 时的退路，每次请求立即返回
+每个进程缓存已解析的日志尾部，检查新事件只需要 stat 文件和读取新增的部分
+
+事件编号保存在单独的计数文件中（EVENTS_FILE.seq），日志截断或单条事件很大时编号也不会回退
+
+事件类型:
+- catalogue: 目录版本号变化，附带变化的书籍数据和被删除的书籍；
+  数据超过 MAX_EVENT_BYTES 时只附带版本号和书籍关键词（truncated: true），客户端用 since 增量拉取
+- highlight: 找到书籍（网页搜索或语音识别），附带书籍位置
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from logs import get_logger
+
+# 文件锁（Windows 上不可用时退化为进程内锁）
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+EVENTS_FILE = os.environ.get('EVENTS_FILE', os.path.join('projector_output', 'events.log'))
+LOCK_FILE = EVENTS_FILE + '.lock'
+SEQ_FILE = EVENTS_FILE + '.seq'
+# 日志文件超过该大小时截断，只保留最近 KEEP_EVENTS 条事件
+MAX_BYTES = 1024 * 1024
+KEEP_EVENTS = 500
+# 推送连接检查新事件的间隔（秒）
+POLL_INTERVAL = 0.25
+# 单条事件数据的上限（字节），超过时只保留摘要
+MAX_EVENT_BYTES = 16 * 1024
+
+logger = get_logger(__name__)
+
+_thread_lock = threading.Lock()
+
+# 本进程已读取的日志尾部: 文件 inode、已读取的字节数、未读完的半行、最近的事件
+_tail_lock = threading.Lock()
+_tail = {'inode': None, 'offset': 0, 'pending': b'',
+         'events': collections.deque(maxlen=KEEP_EVENTS)}
+
+
+@contextmanager
+def _events_lock():
+    """事件日志写锁（跨进程互斥）"""
+    with _thread_lock:
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+        with open(LOCK_FILE, 'a') as lock_fd:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+
+def _scan_last_id(path):
+    """日志中最大的事件编号（计数文件不存在或损坏时使用）"""
+    last_id = 0
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    last_id = max(last_id, int(json.loads(line)['id']))
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return last_id
+
+
+def last_event_id():
+    """当前最新的事件编号（没有事件时为0）"""
+    try:
+        with open(SEQ_FILE, 'r', encoding='ascii') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return _scan_last_id(EVENTS_FILE)
+
+
+def _write_seq(event_id):
+    """原子写入计数文件"""
+    tmp_file = f"{SEQ_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='ascii') as f:
+        f.write(str(event_id))
+    os.replace(tmp_file, SEQ_FILE)
+
+
+def _summarize(data):
+    """
+    过大的事件数据只保留摘要: 标量字段（如版本号）和书籍关键词
+    订阅方收到 truncated 为 true 的事件后自行拉取完整数据
+    """
+    summary = {key: value for key, value in data.items()
+               if not isinstance(value, (dict, list, tuple))}
+    summary['truncated'] = True
+    if isinstance(data.get('books'), dict):
+        summary['changed'] = list(data['books'])
+    if isinstance(data.get('deleted'), (list, tuple)):
+        summary['deleted'] = list(data['deleted'])
+    if len(json.dumps(summary, ensure_ascii=False).encode('utf-8')) > MAX_EVENT_BYTES:
+        # 关键词列表本身也太大时只保留标量字段
+        summary.pop('changed', None)
+        summary.pop('deleted', None)
+    return summary
+
+
+def _truncate():
+    """保留最近 KEEP_EVENTS 条事件，原子替换日志文件"""
+    with open(EVENTS_FILE, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    tmp_file = f"{EVENTS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.writelines(lines[-KEEP_EVENTS:])
+    os.replace(tmp_file, EVENTS_FILE)
+
+
+def publish(event_type, data):
+    """
+    发布事件
+    event_type: 事件类型（catalogue / highlight）
+    data: 可 JSON 序列化的事件数据
+    返回: 事件编号；写入失败时返回 None（事件推送不影响主流程）
+    """
+    try:
+        if (isinstance(data, dict)
+                and len(json.dumps(data, ensure_ascii=False).encode('utf-8')) > MAX_EVENT_BYTES):
+            data = _summarize(data)
+        os.makedirs(os.path.dirname(EVENTS_FILE), exist_ok=True)
+        with _events_lock():
+            event = {
+                'id': last_event_id() + 1,
+                'type': event_type,
+                'time': time.time(),
+                'data': data
+            }
+            # 先更新计数再写日志: 写日志失败时只会跳过一个编号，不会重复
+            _write_seq(event['id'])
+            with open(EVENTS_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            if os.path.getsize(EVENTS_FILE) > MAX_BYTES:
+                _truncate()
+        return event['id']
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning('发布事件失败', extra={'event_type': event_type, 'error': str(e)})
+        return None
+
+
+def _refresh_tail():
+    """读取日志中新增的事件（日志被截断替换后从头读取）"""
+    try:
+        st = os.stat(EVENTS_FILE)
+    except FileNotFoundError:
+        return
+    if st.st_ino != _tail['inode'] or st.st_size < _tail['offset']:
+        _tail.update({'inode': st.st_ino, 'offset': 0, 'pending': b''})
+        _tail['events'].clear()
+    if st.st_size <= _tail['offset']:
+        return
+    with open(EVENTS_FILE, 'rb') as f:
+        f.seek(_tail['offset'])
+        chunk = f.read(st.st_size - _tail['offset'])
+    _tail['offset'] += len(chunk)
+    *lines, _tail['pending'] = (_tail['pending'] + chunk).split(b'\n')
+    events = _tail['events']
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        # 截断后重新读取时跳过已有的事件
+        if events and event['id'] <= events[-1]['id']:
+            continue
+        events.append(event)
+
+
+def read_since(after_id=None, types=None, limit=100):
+    """
+    读取某个编号之后的事件（不等待）
+    after_id: 返回编号大于它的事件；None 表示只获取当前位置（从之后的新事件开始订阅）
+    types: 只返回这些类型的事件（None 表示全部）
+    limit: 最多返回的事件数
+    返回: (事件列表, 下次轮询使用的编号, 是否有事件已丢失)
+    有事件丢失时（日志已截断或被重置）订阅方需要重新同步（如目录用 since 增量拉取）
+    """
+    with _tail_lock:
+        _refresh_tail()
+        retained = list(_tail['events'])
+    latest = retained[-1]['id'] if retained else 0
+    if after_id is None:
+        return [], latest, False
+    if after_id > latest:
+        # 日志被删除后编号重新开始
+        return [], latest, True
+    # 日志只保留最近 KEEP_EVENTS 条，更早的事件已无法返回
+    missed = after_id < latest and retained[0]['id'] > after_id + 1
+    cursor = latest
+    result = []
+    for event in retained:
+        if event['id'] <= after_id:
+            continue
+        if len(result) >= limit:
+            cursor = result[-1]['id']
+            break
+        if not types or event['type'] in types:
+            result.append(event)
+    return result, cursor, missed
+
+
+def follow(after_id=None, types=None, duration=None, heartbeat=15.0):
+    """
+    订阅事件（生成器，用于推送连接）
+    after_id: 从该编号之后开始推送；None 表示只推送之后的新事件
+    types: 只推送这些类型的事件（None 表示全部）
+    duration: 最长订阅时间（秒），到时后结束，由客户端自动重连
+    heartbeat: 没有事件时每隔多少秒产生一次 None，用于保持连接
+    产生: 事件字典；有事件已丢失（需要重新同步）时产生 {'type': 'missed', 'id': 编号}
+    """
+    if after_id is None:
+        _, after_id, _ = read_since(None)
+    started = time.monotonic()
+    last_yield = started
+    while duration is None or time.monotonic() - started < duration:
+        found, cursor, missed = read_since(after_id, types=types)
+        if missed:
+            last_yield = time.monotonic()
+            yield {'type': 'missed', 'id': cursor, 'data': {}}
+        for event in found:
+            last_yield = time.monotonic()
+            yield event
+        after_id = cursor
+        if time.monotonic() - last_yield >= heartbeat:
+            last_yield = time.monotonic()
+            yield None
+        time.sleep(POLL_INTERVAL)
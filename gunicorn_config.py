@@ -1,24 +1,67 @@
 """
 Gunicorn configuration file for production deployment
 """
+import glob
 import multiprocessing
 import os
+import tempfile
 
 # Server socket
 bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# 使用线程 worker：搜索、书籍列表、设置等 I/O 轻量请求由线程并发处理，
+# 耗时的预览渲染交给每个 worker 内的渲染进程池（见 render_pool.py），
+# 因此 worker 数量不需要按 CPU 数翻倍
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
 worker_connections = 1000
 timeout = 120  # 2 minutes timeout
 keepalive = 5
 
+# 渲染进程池在 worker 之间平分 CPU
+os.environ.setdefault('RENDER_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+
+# Prometheus 多进程模式：每个 worker 和渲染进程把指标写入同一目录，/metrics 汇总
+# （必须在 worker 导入 prometheus_client 之前设置）
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'booksearch_metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    """master 启动时清空上一次运行遗留的指标文件"""
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+
+def post_worker_init(worker):
+    """
+    worker 启动后（不等第一个请求）:
+    - 在后台启动渲染进程（见 render_pool.prewarm）
+    - 开始后台预取热门书籍（见 prefetch.py）
+    """
+    import prefetch
+    import render_pool
+    render_pool.prewarm()
+    prefetch.ensure_prefetcher()
+
+
+def child_exit(server, worker):
+    """worker 退出后清理其实时指标（如渲染队列长度）"""
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
 # Logging
-accesslog = "-"  # Log to stdout
+# 访问日志默认关闭（请求耗时已由 /metrics 记录），需要时设置 GUNICORN_ACCESSLOG=- 输出到 stdout
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
 errorlog = "-"   # Log to stderr
-loglevel = "info"
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
 
 # Process naming
 proc_name = "booksearch"
@@ -34,4 +77,3 @@ tmp_upload_dir = None
 # SSL (if needed)
 keyfile = None
 certfile = None
-
@@ -0,0 +1,189 @@
+"""
+日志模块
+替代请求路径中的 print：分级、结构化（JSON）、异步输出
+
+- 请求线程只把日志记录放入内存队列（QueueHandler），由后台线程（QueueListener）统一写出，
+  终端或管道写入变慢时不会阻塞请求；队列满时丢弃日志而不是等待
+- 后台线程批量写入，队列清空时才 flush 一次
+- 调试信息（修改前后的完整行、坐标转换过程等）按比例采样输出，
+  调用方用 debug_sampled() 判断本次请求是否输出，未采样时不会构造调试字符串
+
+环境变量:
+- LOG_LEVEL: 日志级别（默认 INFO）
+- LOG_FORMAT: json（默认，每行一个 JSON 对象）/ text（便于本地阅读）
+- LOG_DEBUG_SAMPLE: LOG_LEVEL=DEBUG 时调试信息的采样率 0-1（默认 0.1，设为 1 输出全部）
+- LOG_QUEUE_SIZE: 日志队列长度（默认 10000）
+
+用法:
+    from logs import get_logger, debug_sampled
+
+    logger = get_logger(__name__)
+    logger.info('书籍已更新', extra={'book_key': key, 'version': version})
+    if debug_sampled(logger):
+        logger.debug('旧值和新值', extra={'old': old_line, 'new': new_line})
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_DEBUG_SAMPLE = float(os.environ.get('LOG_DEBUG_SAMPLE', 0.1))
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+# 本项目所有日志记录器的上级（不影响 werkzeug / gunicorn 自己的日志）
+ROOT_LOGGER = 'booksearch'
+
+# LogRecord 的内置属性，其余属性视为 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _extra_fields(record):
+    return {key: value for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and not key.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 字段原样保留"""
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """本地开发用的单行文本格式: 时间 级别 模块: 消息 key=value ..."""
+    def format(self, record):
+        timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        text = f"{timestamp} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = _extra_fields(record)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            text += '\n' + record.exc_text
+        return text
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """放入队列时不等待；队列满时丢弃并计数"""
+    dropped = 0
+
+    def prepare(self, record):
+        # 在请求线程中格式化消息和异常（参数对象之后可能被修改），
+        # 但保留 extra 字段，由输出线程的 Formatter 结构化输出
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QueueHandler.dropped += 1
+
+
+class _BufferedStreamHandler(logging.StreamHandler):
+    """只写入不 flush，由 _QueueListener 在队列清空时统一 flush"""
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """初始化日志输出（每个进程一次，get_logger 会自动调用）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        stream_handler = _BufferedStreamHandler(sys.stdout)
+        stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root.addHandler(_QueueHandler(log_queue))
+        _listener = _QueueListener(log_queue, stream_handler)
+        _listener.start()
+
+
+def shutdown_logging():
+    """写出队列中剩余的日志（进程退出时自动调用）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.flush()
+            _listener = None
+
+
+def _after_fork():
+    # 子进程中没有父进程的输出线程，需要重新创建
+    global _listener, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        setup_logging()
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_logger(name):
+    """获取模块日志记录器（名称会挂在 booksearch 下）"""
+    setup_logging()
+    if name == '__main__':
+        name = os.path.splitext(os.path.basename(sys.argv[0] or 'main'))[0]
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def debug_sampled(logger):
+    """本次是否输出调试信息（DEBUG 级别已开启且命中采样）"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return LOG_DEBUG_SAMPLE >= 1 or random.random() < LOG_DEBUG_SAMPLE
+
+
+def dropped_count():
+    """队列满时丢弃的日志条数"""
+    return _QueueHandler.dropped
@@ -3,32 +3,23 @@
 整合语音识别、书籍搜索和投影仪高亮功能
 """
 
+import concurrent.futures
 import sys
 import threading
 import time
 import os
-from voice_recognition import VoiceRecognizer
-from book_database import BookDatabase
-from projector_highlight import ProjectorHighlight
 
-# 尝试导入Tkinter版本
-try:
-    from projector_tkinter import ProjectorTkinter
-    TKINTER_AVAILABLE = True
-except ImportError:
-    TKINTER_AVAILABLE = False
-    ProjectorTkinter = None
+# 命令行程序默认输出便于阅读的文本日志（需要在导入 logs 之前设置）
+os.environ.setdefault('LOG_FORMAT', 'text')
+
+import events
+from logs import get_logger, debug_sampled
+from book_database import BookDatabase
 
-# 尝试导入OpenCV版本（可选）
-try:
-    from projector_image import ProjectorImage  # pyright: ignore[reportMissingImports]
-    PROJECTOR_IMAGE_AVAILABLE = True
-except ImportError:
-    PROJECTOR_IMAGE_AVAILABLE = False
-    ProjectorImage = None
+# 语音（speech_recognition/pyaudio/pyttsx3）和投影显示（OpenCV/NumPy/PIL/Tkinter）模块较重，
+# 在真正使用时才导入: 文字输入测试模式不加载音频库，搜索书籍不需要等待 OpenCV 加载完成
 
-# 导入简单模式（保存图片文件）
-from projector_simple import ProjectorSimple
+logger = get_logger(__name__)
 
 class BookSearchSystem:
     def __init__(self, image_path=None, use_simple_mode=True):
@@ -39,9 +30,13 @@ class BookSearchSystem:
         """
         print("正在初始化书籍搜索系统...")
         
-        # 初始化各个模块
-        # 使用英文语音识别（因为书籍名称是英文）
-        self.voice_recognizer = VoiceRecognizer(language='en-US')
+        # 语音识别器在第一次使用时创建（创建时需要打开麦克风并校准环境噪音）
+        self._voice_recognizer = None
+        self._voice_lock = threading.Lock()
+        # 投影显示: 简单模式在后台线程中加载（导入 OpenCV、读取书架图片），不阻塞启动
+        self._projector = None
+        self._projector_loader = None
+        self._loader_executor = None
         
         # 重新加载book_database模块，确保读取最新数据
         import book_database
@@ -65,16 +60,20 @@ class BookSearchSystem:
             if use_simple_mode:
                 # 使用简单模式（推荐）：保存图片文件
                 print("   使用简单模式：保存高亮图片到文件")
-                self.projector = ProjectorSimple(image_path=image_path)
+                self._load_simple_projector(image_path)
                 self.use_image_mode = True
                 self.use_tkinter = False
                 self.use_simple_mode = True
             else:
                 # 尝试GUI模式
+                try:
+                    from projector_tkinter import ProjectorTkinter, TKINTER_AVAILABLE
+                except ImportError:
+                    TKINTER_AVAILABLE = False
                 if TKINTER_AVAILABLE:
                     try:
                         print("   尝试使用Tkinter显示（GUI模式）...")
-                        self.projector = ProjectorTkinter(image_path=image_path, width=1920, height=1080)
+                        self._projector = ProjectorTkinter(image_path=image_path, width=1920, height=1080)
                         self.use_image_mode = True
                         self.use_tkinter = True
                         self.use_simple_mode = False
@@ -82,20 +81,21 @@ class BookSearchSystem:
                     except Exception as e:
                         print(f"⚠️  Tkinter初始化失败: {e}")
                         print("   降级到简单模式...")
-                        self.projector = ProjectorSimple(image_path=image_path)
+                        self._load_simple_projector(image_path)
                         self.use_image_mode = True
                         self.use_tkinter = False
                         self.use_simple_mode = True
                 else:
                     # 使用简单模式（推荐）
-                    self.projector = ProjectorSimple(image_path=image_path)
+                    self._load_simple_projector(image_path)
                     self.use_image_mode = True
                     self.use_tkinter = False
                     self.use_simple_mode = True
         else:
             print("🖥️  使用普通显示模式")
             # 默认不全屏，避免阻塞界面（如需全屏，设置 fullscreen=True）
-            self.projector = ProjectorHighlight(width=1920, height=1080, fullscreen=False)
+            from projector_highlight import ProjectorHighlight
+            self._projector = ProjectorHighlight(width=1920, height=1080, fullscreen=False)
             self.use_image_mode = False
             self.use_tkinter = False
             self.use_simple_mode = False
@@ -106,55 +106,83 @@ class BookSearchSystem:
         
         print("系统初始化完成！")
     
+    def _load_simple_projector(self, image_path):
+        """在后台线程中创建简单模式的投影显示（第一次使用 self.projector 时等待加载完成）"""
+        def load():
+            from projector_simple import ProjectorSimple
+            return ProjectorSimple(image_path=image_path)
+        
+        self._loader_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='projector-loader')
+        self._projector_loader = self._loader_executor.submit(load)
+    
+    @property
+    def projector(self):
+        """投影显示（后台加载中时等待加载完成；多个线程可以同时等待同一个加载结果）"""
+        if self._projector_loader is not None:
+            return self._projector_loader.result()
+        return self._projector
+    
+    @property
+    def voice_recognizer(self):
+        """语音识别器（第一次使用时创建，语音线程和主线程同时使用时只创建一次）"""
+        with self._voice_lock:
+            if self._voice_recognizer is None:
+                from voice_recognition import VoiceRecognizer
+                # 使用英文语音识别（因为书籍名称是英文）
+                self._voice_recognizer = VoiceRecognizer(language='en-US')
+            return self._voice_recognizer
+    
     def on_voice_recognized(self, text):
         """语音识别回调函数"""
-        print(f"\n识别到语音: {text}")
+        logger.info('识别到语音', extra={'text': text})
         
         # 每次搜索前都重新加载book_database，确保使用最新数据
         import importlib
         import book_database
         importlib.reload(book_database)
         self.book_database = book_database.BookDatabase()
-        print("✅ 已重新加载书籍数据库")
         
         # 搜索书籍
         book_key, book_info = self.book_database.search_book(text)
         
         if book_info:
-            print(f"✅ 找到书籍: {book_info['full_name']}")
-            print(f"   匹配关键词: {book_key}")
             shelf_name = "上排" if book_info['shelf'] == 0 else "下排"
-            print(f"📍 位置: {shelf_name}, 坐标: {book_info['position']}")
-            print(f"   从数据库读取的位置: {self.book_database.books.get(book_key, {}).get('position', '未找到')}")
+            logger.info('找到书籍', extra={'book_key': book_key, 'book_name': book_info['full_name'],
+                                         'shelf': shelf_name, 'position': book_info['position']})
+            
+            # 通知跟随这台语音终端的投影页面
+            event = {
+                'book_key': book_key,
+                'book_name': book_info['full_name'],
+                'position': book_info['position'],
+                'query': text,
+                'source': 'voice'
+            }
+            if 'points' in book_info:
+                event['points'] = book_info['points']
+            events.publish('highlight', event)
             
             # 语音反馈
             self.voice_recognizer.speak(f"Found book: {book_info['full_name']}")
             
             # 高亮显示（生成GIF动画并在浏览器中打开）
-            print(f"   使用位置坐标: {book_info['position']}")
-            print(f"   图片路径: {self.projector.image_path if hasattr(self.projector, 'image_path') else 'N/A'}")
-            print(f"   正在生成GIF动画...")
+            if debug_sampled(logger):
+                logger.debug('生成GIF动画', extra={
+                    'book_key': book_key, 'points': book_info.get('points'),
+                    'image_path': getattr(self.projector, 'image_path', None)})
             try:
                 self.projector.highlight_book(
                     book_info['position'],
                     book_info['full_name'],
                     points=book_info.get('points')  # 传递四点数据
                 )
-                print(f"   ✅ GIF动画已生成并在浏览器中打开")
-            except Exception as e:
-                print(f"   ❌ 生成GIF动画时出错: {e}")
-                import traceback
-                traceback.print_exc()
+            except Exception:
+                logger.exception('生成GIF动画时出错', extra={'book_key': book_key})
         else:
-            print("❌ 未找到匹配的书籍")
-            print(f"   识别到的文本: '{text}'")
-            print("   提示: 尝试使用更完整或更准确的书名")
-            print("\n   可用的书籍关键词示例:")
             all_books = self.book_database.get_all_books()
-            for i, key in enumerate(list(all_books.keys())[:5], 1):
-                print(f"   {i}. {key}")
-            if len(all_books) > 5:
-                print(f"   ... 还有 {len(all_books) - 5} 本书")
+            logger.info('未找到匹配的书籍（尝试使用更完整或更准确的书名）', extra={
+                'text': text, 'examples': list(all_books.keys())[:5], 'total_books': len(all_books)})
             # 语音反馈
             self.voice_recognizer.speak("Sorry, book not found")
     
@@ -207,8 +235,14 @@ class BookSearchSystem:
         """停止系统"""
         self.running = False
         self.stop_event.set()
+        self._shutdown_loader()
         print("系统已关闭")
     
+    def _shutdown_loader(self):
+        """关闭投影显示的加载线程（还没加载完时不再等待）"""
+        if self._loader_executor is not None:
+            self._loader_executor.shutdown(wait=False, cancel_futures=True)
+    
     def interactive_mode(self):
         """交互模式：手动输入书名进行测试"""
         print("\n进入交互测试模式")
@@ -263,6 +297,7 @@ class BookSearchSystem:
                     break
         finally:
             self.stop_event.set()
+            self._shutdown_loader()
             if self.use_tkinter and self.projector:
                 self.projector._close_window()
             print("退出交互模式")
@@ -0,0 +1,167 @@
+"""
+性能指标模块
+记录每个路由的请求耗时、关键步骤（搜索、渲染、编码、写入等）的耗时和缓存命中情况，
+由 /metrics 接口以 Prometheus 文本格式导出
+
+多进程说明:
+- 设置了 PROMETHEUS_MULTIPROC_DIR 时（gunicorn_config.py 会自动设置），
+  每个进程（gunicorn worker、渲染进程）把指标写入该目录，
+  /metrics 汇总所有进程的数据，因此请求落在哪个 worker 上都能看到完整指标
+- 未安装 prometheus_client 时所有记录操作为空操作，不影响主流程
+
+用法:
+    from metrics import span
+
+    with span('highlight.encode'):
+        ...
+
+    @span('search')
+    def search_book(self, query):
+        ...
+"""
+
+import functools
+import glob
+import os
+import time
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                                   Counter, Gauge, Histogram, generate_latest)
+    from prometheus_client import multiprocess
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+# 多进程指标目录（需要在导入 prometheus_client 之前设置环境变量）
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# 请求耗时分桶（秒）
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 步骤耗时分桶（秒），比请求更细，覆盖亚毫秒级的搜索
+SPAN_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _NoopMetric:
+    """prometheus_client 不可用时的占位指标"""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    REQUEST_LATENCY = Histogram(
+        'booksearch_request_duration_seconds',
+        'HTTP 请求耗时（按路由）',
+        ['method', 'route', 'status'],
+        buckets=REQUEST_BUCKETS
+    )
+    SPAN_LATENCY = Histogram(
+        'booksearch_span_duration_seconds',
+        '关键步骤耗时（搜索、渲染、编码、写入等）',
+        ['span'],
+        buckets=SPAN_BUCKETS
+    )
+    CACHE_REQUESTS = Counter(
+        'booksearch_cache_requests_total',
+        '缓存访问次数（按缓存名称和命中结果）',
+        ['cache', 'result']
+    )
+    RENDER_IN_FLIGHT = Gauge(
+        'booksearch_render_in_flight',
+        '执行中和排队中的渲染任务数',
+        multiprocess_mode='livesum'
+    )
+else:
+    REQUEST_LATENCY = SPAN_LATENCY = CACHE_REQUESTS = RENDER_IN_FLIGHT = _NoopMetric()
+
+
+def observe_request(method, route, status, seconds):
+    """记录一次 HTTP 请求的耗时"""
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_span(name, seconds):
+    """记录一个步骤的耗时"""
+    SPAN_LATENCY.labels(name).observe(seconds)
+
+
+def count_cache(cache, hit):
+    """记录一次缓存访问（hit: 是否命中）"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+class span:
+    """
+    计时步骤，可作为上下文管理器或装饰器使用
+    name: 步骤名称，用点号分层（如 highlight.glow）
+    """
+    def __init__(self, name):
+        self.name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_span(self.name, time.perf_counter() - self._started)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # 每次调用使用新的计时对象，保证多线程和递归调用时互不干扰
+            with span(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def export():
+    """
+    导出所有指标
+    返回: (响应内容, Content-Type)；prometheus_client 不可用时返回 (None, None)
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return None, None
+    if MULTIPROC_DIR:
+        # 汇总所有进程写入的指标文件
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """进程退出后清理其实时指标（gunicorn child_exit 钩子调用）"""
+    if PROMETHEUS_AVAILABLE and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def render_in_flight_total():
+    """
+    所有进程（gunicorn worker）的渲染任务数之和
+    未启用多进程指标时返回 None（调用方使用本进程的计数）
+    """
+    if not PROMETHEUS_AVAILABLE or not MULTIPROC_DIR:
+        return None
+    # 只读取实时汇总类型的 Gauge 文件（不解析其他指标）
+    files = glob.glob(os.path.join(MULTIPROC_DIR, 'gauge_livesum_*.db'))
+    try:
+        merged = multiprocess.MultiProcessCollector.merge(files, accumulate=False)
+    except (OSError, ValueError):
+        return None
+    for metric in merged:
+        if metric.name == 'booksearch_render_in_flight':
+            return int(sum(sample.value for sample in metric.samples))
+    return 0
@@ -0,0 +1,144 @@
+"""
+书籍热度统计
+记录 /api/search 命中的书籍，按时间衰减累计热度（半衰期 POPULARITY_HALF_LIFE_HOURS），
+后台预取（prefetch.py）按热度提前渲染热门书籍的预览动画
+
+- 每个进程先在内存中累计，最多每 POPULARITY_FLUSH_SECONDS 秒合并写入 POPULARITY_FILE 一次
+  （加文件锁，多个 gunicorn worker 的计数合并在一起），重启和重新部署后热度仍然保留
+- 只保留热度最高的 POPULARITY_MAX_ENTRIES 本书
+
+文件格式:
+    {"updated": 1700000000.0, "scores": [["main", "书籍关键词", 12.5], ...]}
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from logs import get_logger
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+POPULARITY_FILE = os.environ.get('POPULARITY_FILE', 'popularity.json')
+# 热度半衰期（小时）
+POPULARITY_HALF_LIFE_HOURS = float(os.environ.get('POPULARITY_HALF_LIFE_HOURS', 72))
+# 内存中的计数写入文件的间隔（秒）
+POPULARITY_FLUSH_SECONDS = float(os.environ.get('POPULARITY_FLUSH_SECONDS', 30))
+# 最多保留的书籍数
+POPULARITY_MAX_ENTRIES = int(os.environ.get('POPULARITY_MAX_ENTRIES', 1000))
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+# 尚未写入文件的计数: (shelf_id, book_key) -> 次数
+_pending = {}
+_last_flush = time.time()
+# 文件内容缓存: (mtime_ns, {(shelf_id, book_key): 热度})
+_cached = (None, {})
+
+
+def _decay(elapsed):
+    """经过 elapsed 秒后热度保留的比例"""
+    if POPULARITY_HALF_LIFE_HOURS <= 0:
+        return 1.0
+    return 0.5 ** (max(0.0, elapsed) / (POPULARITY_HALF_LIFE_HOURS * 3600))
+
+
+def _read():
+    """读取文件，返回 (更新时间, {(shelf_id, book_key): 热度})"""
+    try:
+        with open(POPULARITY_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        scores = {(shelf_id, book_key): float(score) for shelf_id, book_key, score in data.get('scores', [])}
+        return float(data.get('updated', time.time())), scores
+    except FileNotFoundError:
+        return time.time(), {}
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning('热度文件无法读取，重新统计', extra={'path': POPULARITY_FILE, 'error': str(e)})
+        return time.time(), {}
+
+
+def record(shelf_id, book_key):
+    """记录一次搜索命中"""
+    key = (shelf_id, book_key)
+    with _lock:
+        _pending[key] = _pending.get(key, 0) + 1
+        due = time.time() - _last_flush >= POPULARITY_FLUSH_SECONDS
+    if due:
+        flush()
+
+
+def flush():
+    """把内存中的计数合并写入文件（按经过的时间衰减已有热度）"""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.time()
+    if not pending:
+        return
+
+    lock_fd = None
+    try:
+        if FCNTL_AVAILABLE:
+            lock_fd = open(POPULARITY_FILE + '.lock', 'a')
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        updated, scores = _read()
+        now = time.time()
+        factor = _decay(now - updated)
+        scores = {key: score * factor for key, score in scores.items()}
+        for key, count in pending.items():
+            scores[key] = scores.get(key, 0.0) + count
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:POPULARITY_MAX_ENTRIES]
+
+        directory = os.path.dirname(os.path.abspath(POPULARITY_FILE))
+        fd, tmp_path = tempfile.mkstemp(prefix='.popularity-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'updated': now,
+                           'scores': [[shelf_id, book_key, round(score, 4)]
+                                      for (shelf_id, book_key), score in ranked]},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, POPULARITY_FILE)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning('热度文件写入失败', extra={'path': POPULARITY_FILE, 'error': str(e)})
+        # 放回内存，下次再写
+        with _lock:
+            for key, count in pending.items():
+                _pending[key] = _pending.get(key, 0) + count
+    finally:
+        if lock_fd is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            lock_fd.close()
+
+
+def top(limit=10):
+    """
+    热度最高的书籍（包含尚未写入文件的计数）
+    返回: [(shelf_id, book_key, 热度), ...]
+    """
+    global _cached
+    try:
+        mtime = os.stat(POPULARITY_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime != _cached[0]:
+        updated, scores = _read()
+        # 统一衰减到当前时间，与内存中的新计数相加
+        factor = _decay(time.time() - updated)
+        _cached = (mtime, {key: score * factor for key, score in scores.items()})
+    scores = dict(_cached[1])
+    with _lock:
+        for key, count in _pending.items():
+            scores[key] = scores.get(key, 0.0) + count
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(shelf_id, book_key, score) for (shelf_id, book_key), score in ranked]
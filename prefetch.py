@@ -0,0 +1,183 @@
+"""
+预览动画后台预取
+按搜索热度（popularity.py）提前渲染热门书籍的预览动画并放入预览缓存（preview_cache.py），
+重新部署或缓存淘汰后，热门书籍的第一次预览也不需要等待渲染
+
+- 启动后和空闲时（每 PREFETCH_INTERVAL 秒）检查热度最高的 PREFETCH_TOP_N 本书，
+  为 ASSET_SIZES 中的每个输出尺寸渲染缺少的预览
+- 让出前台请求: 任何一个 worker 的渲染队列中有任务（render_pool.in_flight_all() > 0，
+  通过多进程指标汇总）时等待，一次只提交一个预取任务
+- CPU 预算: 预取渲染占用的时间不超过 PREFETCH_CPU_BUDGET（渲染 t 秒后至少休息 t*(1-b)/b 秒）
+- 多个 gunicorn worker 中只有拿到 PREFETCH_LOCK_FILE 文件锁的一个执行预取
+"""
+
+import os
+import threading
+import time
+
+import book_assets
+import metrics
+import popularity
+import preview_cache
+import render_pool
+import shelves
+from logs import get_logger
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+PREFETCH_ENABLED = os.environ.get('PREFETCH', '1').lower() not in ('0', 'false', 'no')
+# 预取热度最高的多少本书
+PREFETCH_TOP_N = int(os.environ.get('PREFETCH_TOP_N', 20))
+# 两轮预取之间的间隔（秒）
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', 60))
+# 启动后等待多久开始第一轮（秒），避开启动时的请求高峰
+PREFETCH_START_DELAY = float(os.environ.get('PREFETCH_START_DELAY', 5))
+# 预取渲染最多占用的时间比例（0-1）
+PREFETCH_CPU_BUDGET = min(1.0, max(0.01, float(os.environ.get('PREFETCH_CPU_BUDGET', 0.25))))
+PREFETCH_LOCK_FILE = os.environ.get('PREFETCH_LOCK_FILE', 'prefetch.lock')
+# 等待前台请求结束时的检查间隔（秒）
+IDLE_POLL_SECONDS = 0.5
+
+logger = get_logger(__name__)
+
+
+class Prefetcher:
+    """后台预取线程"""
+    def __init__(self, output_dir='./projector_output'):
+        self.output_dir = output_dir
+        self.rendered = 0
+        self.render_seconds = 0.0
+        self.last_run = None
+        self._lock_fd = None
+        self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _acquire_leader(self):
+        """尝试成为执行预取的进程（持有文件锁直到进程退出）"""
+        if self._lock_fd is not None or not FCNTL_AVAILABLE:
+            return True
+        lock_fd = open(PREFETCH_LOCK_FILE, 'a')
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_fd.close()
+            return False
+        self._lock_fd = lock_fd
+        return True
+
+    def _run(self):
+        time.sleep(PREFETCH_START_DELAY)
+        while True:
+            try:
+                if self._acquire_leader():
+                    self.run_once()
+                else:
+                    # 其他 worker 负责预取，这里只把热度计数写入文件
+                    popularity.flush()
+            except Exception:
+                logger.exception('预取失败')
+            time.sleep(PREFETCH_INTERVAL)
+
+    def _wait_idle(self, deadline):
+        """等待所有 worker 的渲染队列空闲，超过 deadline 仍然繁忙时返回 False（放弃本轮）"""
+        while render_pool.in_flight_all() > 0:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(IDLE_POLL_SECONDS)
+        return True
+
+    @staticmethod
+    def _resolve(shelf_id, book_key):
+        """书籍所在书架的图片和书籍信息，书架或书籍已不存在时返回 None"""
+        shelf = shelves.registry.get(shelf_id)
+        if shelf is None or not os.path.exists(shelf.image):
+            return None
+        try:
+            db, _ = shelves.registry.load(shelf)
+        except (OSError, SyntaxError, KeyError, ValueError):
+            return None
+        info = db.books.get(book_key)
+        if info is None or 'position' not in info:
+            return None
+        return shelf.image, info
+
+    def run_once(self):
+        """预取一轮，返回渲染的预览数"""
+        popularity.flush()
+        self.last_run = time.time()
+        deadline = time.monotonic() + PREFETCH_INTERVAL
+        rendered = 0
+        for shelf_id, book_key, _ in popularity.top(PREFETCH_TOP_N):
+            target = self._resolve(shelf_id, book_key)
+            if target is None:
+                continue
+            image_path, info = target
+            for size in book_assets.ASSET_SIZES:
+                key = preview_cache.cache_key(image_path, size, info)
+                if preview_cache.lookup(key, record=False):
+                    continue
+                if not self._wait_idle(deadline):
+                    logger.info('渲染队列繁忙，本轮预取结束', extra={'rendered': rendered})
+                    return rendered
+                started = time.monotonic()
+                try:
+                    with metrics.span('prefetch.render'):
+                        render_pool.run(render_pool.render_preview, image_path, self.output_dir,
+                                        key, info['position'], info['full_name'],
+                                        points=info.get('points'), output_size=size)
+                except (render_pool.RenderPoolBusy, render_pool.RenderTimeout) as e:
+                    logger.info('预取让出渲染队列', extra={'book_key': book_key, 'error': str(e)})
+                    return rendered
+                elapsed = time.monotonic() - started
+                rendered += 1
+                self.rendered += 1
+                self.render_seconds += elapsed
+                # 按 CPU 预算休息
+                time.sleep(elapsed * (1 - PREFETCH_CPU_BUDGET) / PREFETCH_CPU_BUDGET)
+        if rendered:
+            logger.info('预取完成', extra={'rendered': rendered, 'top_n': PREFETCH_TOP_N})
+        preview_cache.maybe_gc()
+        return rendered
+
+    def stats(self):
+        return {
+            'leader': self._lock_fd is not None,
+            'rendered': self.rendered,
+            'render_seconds': round(self.render_seconds, 3),
+            'last_run': self.last_run,
+            'top_n': PREFETCH_TOP_N,
+            'cpu_budget': PREFETCH_CPU_BUDGET
+        }
+
+
+_prefetcher = None
+_prefetcher_pid = None
+_prefetcher_lock = threading.Lock()
+
+
+def ensure_prefetcher():
+    """在当前进程中启动预取线程（每个 gunicorn worker 一个，只有一个执行预取）"""
+    global _prefetcher, _prefetcher_pid
+    if not PREFETCH_ENABLED or _prefetcher_pid == os.getpid():
+        return _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher_pid != os.getpid():
+            _prefetcher = Prefetcher().start()
+            _prefetcher_pid = os.getpid()
+    return _prefetcher
+
+
+def stats():
+    """本进程预取线程的状态"""
+    if _prefetcher is None or _prefetcher_pid != os.getpid():
+        return {'enabled': PREFETCH_ENABLED, 'running': False}
+    return dict(_prefetcher.stats(), enabled=True, running=True,
+                popular=[{'shelf_id': shelf_id, 'book_key': book_key, 'score': round(score, 3)}
+                         for shelf_id, book_key, score in popularity.top(PREFETCH_TOP_N)])
@@ -0,0 +1,192 @@
+"""
+预览动画缓存（内容寻址）
+/api/preview 生成的高亮 GIF 以文件内容的哈希命名，通过 /previews/<内容哈希>.gif 提供，
+同一地址的内容永远不变，可以设置 Cache-Control: immutable，由浏览器或 CDN 长期缓存；
+不同用户同时预览不同书籍时各自得到自己的地址，不会互相覆盖
+
+- 渲染哈希: 按 (书架图片, 输出尺寸, 位置, 四点, 书名) 计算，记录在 refs/ 中，指向渲染结果的内容哈希；
+  同一本书再次预览时直接返回已有地址，不再渲染。书籍位置、书名或书架图片变化后渲染哈希不同，自动重新渲染
+- 渲染在渲染进程池中执行（render_pool.render_preview），写入 tmp/ 后计算内容哈希并改名到 objects/
+- 后台预取（prefetch.py）按搜索热度提前渲染热门书籍
+- 垃圾回收（gc）: refs 超过 PREVIEW_CACHE_FILES 个时删除最久未使用的；
+  objects 中没有被任何 ref 指向、且超过 PREVIEW_GC_GRACE 秒未使用的文件被删除
+  （宽限期内已经打开的页面仍然可以加载）
+
+目录结构:
+    PREVIEW_CACHE_DIR/objects/<内容哈希>.gif
+    PREVIEW_CACHE_DIR/refs/<渲染哈希>          （内容为 objects 中的文件名）
+    PREVIEW_CACHE_DIR/tmp/                     （渲染中的临时文件）
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+
+import metrics
+from book_assets import asset_key
+from logs import get_logger
+
+PREVIEW_CACHE_DIR = os.environ.get('PREVIEW_CACHE_DIR', 'preview_cache')
+# 渲染哈希（refs）数上限
+PREVIEW_CACHE_FILES = int(os.environ.get('PREVIEW_CACHE_FILES', 2000))
+# 没有被引用的预览文件保留多久（秒）
+PREVIEW_GC_GRACE = float(os.environ.get('PREVIEW_GC_GRACE', 86400))
+# 两次垃圾回收之间的最短间隔（秒）
+PREVIEW_GC_INTERVAL = float(os.environ.get('PREVIEW_GC_INTERVAL', 300))
+
+OBJECTS_DIR = os.path.join(PREVIEW_CACHE_DIR, 'objects')
+REFS_DIR = os.path.join(PREVIEW_CACHE_DIR, 'refs')
+TMP_DIR = os.path.join(PREVIEW_CACHE_DIR, 'tmp')
+
+# 预览文件名: 内容哈希（SHA-256 前 32 位）+ 扩展名
+_ARTIFACT_NAME = re.compile(r'[0-9a-f]{32}\.gif')
+
+logger = get_logger(__name__)
+
+_gc_lock = threading.Lock()
+_last_gc = 0.0
+
+
+def cache_key(image_path, output_size, book_info):
+    """预览的渲染哈希（output_size 为 None 表示原图尺寸）"""
+    return asset_key(image_path, output_size, book_info['position'], book_info['full_name'],
+                     book_info.get('points'))
+
+
+def staging_path(key):
+    """渲染进程写入的临时文件路径"""
+    return os.path.join(TMP_DIR, f"{key}.{os.getpid()}.{threading.get_ident()}.gif")
+
+
+def artifact_path(name):
+    """预览文件路径；文件名不合法或文件不存在时返回 None"""
+    if not _ARTIFACT_NAME.fullmatch(name or ''):
+        return None
+    path = os.path.join(OBJECTS_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _write_ref(key, name):
+    os.makedirs(REFS_DIR, exist_ok=True)
+    ref_path = os.path.join(REFS_DIR, key)
+    tmp_path = f"{ref_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='ascii') as f:
+        f.write(name)
+    os.replace(tmp_path, ref_path)
+
+
+def publish(key, rendered_path):
+    """
+    把渲染好的临时文件按内容哈希放入 objects/，并记录渲染哈希指向它
+    返回: 预览文件名
+    """
+    digest = hashlib.sha256()
+    with open(rendered_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    name = digest.hexdigest()[:32] + '.gif'
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    path = os.path.join(OBJECTS_DIR, name)
+    if os.path.exists(path):
+        # 内容相同的文件已存在（其他书籍或尺寸渲染出相同结果）
+        os.remove(rendered_path)
+        os.utime(path)
+    else:
+        os.replace(rendered_path, path)
+    _write_ref(key, name)
+    return name
+
+
+def lookup(key, record=True):
+    """已缓存时返回预览文件名（并更新使用时间），否则返回 None"""
+    ref_path = os.path.join(REFS_DIR, key)
+    name = None
+    try:
+        with open(ref_path, 'r', encoding='ascii') as f:
+            name = f.read().strip()
+    except OSError:
+        pass
+    path = artifact_path(name) if name else None
+    if record:
+        metrics.count_cache('preview', path is not None)
+    if path is None:
+        return None
+    try:
+        # 使用时间用于淘汰最久未使用的缓存
+        os.utime(ref_path)
+        os.utime(path)
+    except OSError:
+        pass
+    return name
+
+
+def _entries(directory):
+    """目录中的文件: [(修改时间, 文件名, 路径)]"""
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            entries.append((os.path.getmtime(path), name, path))
+        except OSError:
+            pass
+    return entries
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def gc(max_refs=None, grace=None):
+    """
+    垃圾回收: 删除最久未使用的渲染哈希、没有被引用且超过宽限期的预览文件和遗留的临时文件
+    返回: {'refs': 删除的渲染哈希数, 'objects': 删除的预览文件数, 'tmp': 删除的临时文件数}
+    """
+    max_refs = PREVIEW_CACHE_FILES if max_refs is None else max_refs
+    grace = PREVIEW_GC_GRACE if grace is None else grace
+    removed = {'refs': 0, 'objects': 0, 'tmp': 0}
+    cutoff = time.time() - grace
+
+    with metrics.span('preview.gc'):
+        refs = sorted(_entries(REFS_DIR))
+        for _, _, path in refs[:max(0, len(refs) - max_refs)]:
+            removed['refs'] += _remove(path)
+
+        referenced = set()
+        for _, _, path in _entries(REFS_DIR):
+            try:
+                with open(path, 'r', encoding='ascii') as f:
+                    referenced.add(f.read().strip())
+            except (OSError, UnicodeDecodeError):
+                pass
+        for mtime, name, path in _entries(OBJECTS_DIR):
+            if name not in referenced and mtime < cutoff:
+                removed['objects'] += _remove(path)
+
+        # 渲染进程异常退出时遗留的临时文件
+        for mtime, _, path in _entries(TMP_DIR):
+            if mtime < cutoff:
+                removed['tmp'] += _remove(path)
+
+    if any(removed.values()):
+        logger.info('预览缓存已清理', extra=dict(removed, max_refs=max_refs, grace=grace))
+    return removed
+
+
+def maybe_gc():
+    """距上次垃圾回收超过 PREVIEW_GC_INTERVAL 秒时执行一次（在调用线程中执行）"""
+    global _last_gc
+    with _gc_lock:
+        if time.time() - _last_gc < PREVIEW_GC_INTERVAL:
+            return None
+        _last_gc = time.time()
+    return gc()
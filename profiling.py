@@ -0,0 +1,247 @@
+"""
+性能剖析模块
+生产环境中某个请求变慢时，不需要重新部署就能看到时间花在哪里
+
+- 单个请求剖析: 请求带上 X-Profile: 1 头（或 ?profile=1）和管理员令牌头（X-Profile-Token 或 Authorization: Bearer）时，
+  采样该请求线程的调用栈；预览渲染在渲染进程中同样被采样，合并到同一份结果（前缀 render_process）
+- 常驻滚动采样: 每个进程中有一个低频采样线程，保留最近一段时间所有线程的调用栈统计，可随时导出
+- 输出为折叠栈格式（folded stacks，每行 "frame;frame;frame 次数"），
+  可直接用 flamegraph.pl、speedscope 等工具生成火焰图
+
+环境变量:
+- PROFILE_ADMIN_TOKEN: 管理员令牌，未设置时剖析功能关闭
+- PROFILE_DIR: 单个请求剖析结果的保存目录（默认系统临时目录下的 booksearch_profiles）
+- PROFILE_INTERVAL: 单个请求剖析的采样间隔（秒，默认 0.001）
+- PROFILE_ROLLING: 是否开启常驻滚动采样（默认 1）
+- PROFILE_ROLLING_INTERVAL: 滚动采样间隔（秒，默认 0.05）
+- PROFILE_ROLLING_SECONDS: 滚动采样保留的时长（秒，默认 300）
+"""
+
+import collections
+import hmac
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'booksearch_profiles'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+PROFILE_ROLLING = os.environ.get('PROFILE_ROLLING', '1') == '1'
+PROFILE_ROLLING_INTERVAL = float(os.environ.get('PROFILE_ROLLING_INTERVAL', 0.05))
+PROFILE_ROLLING_SECONDS = int(os.environ.get('PROFILE_ROLLING_SECONDS', 300))
+# 最多保存多少份单个请求的剖析结果
+PROFILE_KEEP = 50
+# 调用栈最大深度
+MAX_DEPTH = 128
+
+
+def token_valid(token):
+    """检查管理员令牌（未配置令牌时一律拒绝）"""
+    if not PROFILE_ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8'))
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _folded_stack(frame):
+    """把调用栈转换为折叠格式（从最外层到最内层，用分号连接）"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def format_folded(counts):
+    """{栈: 次数} -> 折叠栈文本"""
+    return ''.join(f"{stack} {count}\n" for stack, count in
+                   sorted(counts.items(), key=lambda item: -item[1]))
+
+
+class ThreadSampler:
+    """在后台线程中按固定间隔采样指定线程的调用栈"""
+    def __init__(self, thread_id, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or PROFILE_INTERVAL
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[_folded_stack(frame)] += 1
+                self.samples += 1
+
+
+def run_profiled(func, args, kwargs, interval=None):
+    """
+    在剖析下执行函数（在渲染进程中调用）
+    返回: (函数返回值, {栈: 次数})
+    """
+    sampler = ThreadSampler(threading.get_ident(), interval).start()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        counts = sampler.stop()
+    return result, dict(counts)
+
+
+# ---------- 单个请求剖析 ----------
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """一次请求的剖析（由 start_request 创建）"""
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.sampler = ThreadSampler(threading.get_ident()).start()
+        self.extra = collections.Counter()
+
+    def merge(self, counts, prefix):
+        """合并其他线程或进程中的采样结果（如渲染进程）"""
+        for stack, count in counts.items():
+            self.extra[f"{prefix};{stack}"] += count
+
+    def finish(self):
+        """停止采样并保存，返回保存的文件名"""
+        counts = self.sampler.stop()
+        counts.update(self.extra)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.label).strip('_') or 'request'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{self.id}.folded"
+        header = (f"# {self.label} 耗时 {self.sampler.elapsed * 1000:.1f} ms, "
+                  f"采样间隔 {self.sampler.interval * 1000:g} ms, {self.sampler.samples} 个样本\n")
+        with open(os.path.join(PROFILE_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(header + format_folded(counts))
+        _prune_profiles()
+        return name
+
+
+def _prune_profiles():
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith('.folded'))
+    for name in names[:-PROFILE_KEEP]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def start_request(label):
+    """开始剖析当前线程正在处理的请求"""
+    _local.profile = RequestProfile(label)
+    return _local.profile
+
+
+def finish_request():
+    """结束当前请求的剖析，返回保存的文件名（没有在剖析时返回 None）"""
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return None
+    _local.profile = None
+    return profile.finish()
+
+
+def current():
+    """当前线程正在进行的请求剖析（没有时返回 None）"""
+    return getattr(_local, 'profile', None)
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith('.folded')), reverse=True)
+
+
+def profile_path(name):
+    """剖析结果文件路径（文件名不合法或不存在时返回 None）"""
+    if not re.fullmatch(r'[A-Za-z0-9_.-]+\.folded', name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ---------- 常驻滚动采样 ----------
+
+class RollingSampler:
+    """
+    低频采样本进程中所有线程（不含自身），按秒聚合，只保留最近 PROFILE_ROLLING_SECONDS 秒
+    """
+    def __init__(self, interval=None, seconds=None):
+        self.interval = interval or PROFILE_ROLLING_INTERVAL
+        self.buckets = collections.deque(maxlen=seconds or PROFILE_ROLLING_SECONDS)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='profile-rolling', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            second = int(time.time())
+            frames = sys._current_frames()
+            with self._lock:
+                if not self.buckets or self.buckets[-1][0] != second:
+                    self.buckets.append((second, collections.Counter()))
+                counts = self.buckets[-1][1]
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        counts[_folded_stack(frame)] += 1
+
+    def dump(self, seconds=None):
+        """最近 seconds 秒的采样结果（折叠栈文本）"""
+        since = time.time() - seconds if seconds else 0
+        total = collections.Counter()
+        with self._lock:
+            for second, counts in self.buckets:
+                if second >= since:
+                    total.update(counts)
+        return format_folded(total)
+
+
+_rolling = None
+_rolling_pid = None
+_rolling_lock = threading.Lock()
+
+
+def ensure_rolling_sampler():
+    """在当前进程中启动滚动采样（每个 gunicorn worker 一个，fork 后重新启动）"""
+    global _rolling, _rolling_pid
+    if not PROFILE_ROLLING or _rolling_pid == os.getpid():
+        return _rolling
+    with _rolling_lock:
+        if _rolling_pid != os.getpid():
+            _rolling = RollingSampler().start()
+            _rolling_pid = os.getpid()
+    return _rolling
+
+
+def dump_rolling(seconds=None):
+    """导出本进程的滚动采样结果；未开启时返回 None"""
+    sampler = ensure_rolling_sampler()
+    return sampler.dump(seconds) if sampler else None
@@ -3,11 +3,25 @@
 用户可以用任何图片查看器打开并全屏显示
 """
 
+import collections
 import cv2
 import numpy as np
 import os
 from typing import Tuple
 
+import book_assets
+import metrics
+import tiles
+from logs import get_logger, debug_sampled
+from metrics import span
+
+logger = get_logger(__name__)
+
+# 每个实例缓存多少种输出尺寸的缩小底图
+BASE_CACHE_SIZE = 4
+# GIF 动画帧数
+NUM_FRAMES = 10
+
 class ProjectorSimple:
     def __init__(self, image_path: str, output_dir="./projector_output"):
         """
@@ -26,11 +40,11 @@ class ProjectorSimple:
         
         # 加载原始图片
         self.original_image = None
+        # 缩小后的底图: (宽, 高) -> 图片，按最近使用排序
+        self._bases = collections.OrderedDict()
         self.load_image(image_path)
         
-        print(f"✅ 简单投影模式已初始化")
-        print(f"   高亮图片将保存到: {output_dir}/highlight.jpg")
-        print(f"   可以用任何图片查看器打开并全屏显示")
+        logger.debug('简单投影模式已初始化', extra={'output_dir': output_dir})
     
     def load_image(self, image_path: str):
         """加载图片"""
@@ -39,46 +53,72 @@ class ProjectorSimple:
             if img is None:
                 raise ValueError(f"无法读取图片: {image_path}")
             
-            print(f"📸 原始图片尺寸: {img.shape[1]}x{img.shape[0]}")
-            
             # 保持原始尺寸（或调整到合适大小）
             # 投影仪通常是1920x1080，但我们可以保持原图比例
             self.original_image = img.copy()
             self.width = img.shape[1]
             self.height = img.shape[0]
+            self._bases.clear()
             
-            print(f"✅ 成功加载图片: {image_path}")
+            logger.debug('成功加载图片', extra={'image_path': image_path,
+                                              'width': self.width, 'height': self.height})
         except Exception as e:
-            print(f"❌ 加载图片失败: {e}")
+            logger.error('加载图片失败', extra={'image_path': image_path, 'error': str(e)})
             self.original_image = None
     
-    def highlight_book(self, position: Tuple[float, float, float, float], 
-                       book_name: str = "", points: list = None):
+    def output_dimensions(self, output_size=None):
+        """按比例缩小到不超过 output_size (宽, 高) 的尺寸（不放大）"""
+        if not output_size:
+            return self.width, self.height
+        max_width, max_height = output_size
+        ratio = min(1.0, (max_width or self.width) / self.width, (max_height or self.height) / self.height)
+        return max(1, round(self.width * ratio)), max(1, round(self.height * ratio))
+
+    def base_image(self, output_size=None):
         """
-        高亮显示书籍并保存图片
-        position: (x, y, width, height) 归一化坐标 (0-1) - 用于兼容性
-        book_name: 书籍名称
-        points: 四点定位数据 [(x1, y1), (x2, y2), (x3, y3), (x4, y4)] - 归一化坐标 (0-1)，如果提供则优先使用
+        指定输出尺寸的底图
+        缩小的底图从瓦片金字塔中不小于目标尺寸的层级缩放得到（不读取原图像素），按尺寸缓存
+        返回: (图片, 相对原图的缩放比例)
         """
-        import time
+        width, height = self.output_dimensions(output_size)
+        if (width, height) == (self.width, self.height):
+            return self.original_image, 1.0
         
-        if self.original_image is None:
-            print("❌ 图片未加载")
-            return
+        key = (width, height)
+        base = self._bases.get(key)
+        metrics.count_cache('scaled_base', base is not None)
+        if base is None:
+            with span('highlight.prescale'):
+                source_path, _ = tiles.level_image_path(self.image_path, width, height)
+                source = cv2.imread(source_path) if source_path != self.image_path else None
+                if source is None:
+                    source = self.original_image
+                base = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
+            self._bases[key] = base
+            while len(self._bases) > BASE_CACHE_SIZE:
+                self._bases.popitem(last=False)
+        else:
+            self._bases.move_to_end(key)
+        return base, width / self.width
+
+    def _book_geometry(self, position, points, width, height):
+        """
+        书籍在指定尺寸图片上的像素坐标
+        返回: (x, y, w, h, pixel_points)，没有四点数据时 pixel_points 为 None
+        """
+        # 坐标转换过程只在采样命中时输出
+        verbose = debug_sampled(logger)
         
         # 优先使用四点定位
         use_points = points is not None and len(points) == 4
         
         if use_points:
             # 使用四点定位
-            print(f"\n📍 使用四点定位:")
-            print(f"   四点数据: {points}")
-            
             # 转换为像素坐标
             pixel_points = []
             for p in points:
-                px = int(p[0] * self.width)
-                py = int(p[1] * self.height)
+                px = int(p[0] * width)
+                py = int(p[1] * height)
                 pixel_points.append([px, py])
             
             # 计算边界框（用于书名位置）
@@ -88,469 +128,466 @@ class ProjectorSimple:
             y_min, y_max = min(ys), max(ys)
             x, y, w, h = x_min, y_min, x_max - x_min, y_max - y_min
             
-            print(f"   图片尺寸: {self.width}x{self.height}")
-            print(f"   像素坐标: {pixel_points}")
-            print(f"   边界框: ({x}, {y}, {w}, {h})")
+            if verbose:
+                logger.debug('使用四点定位', extra={'points': points, 'pixel_points': pixel_points,
+                                                'image_size': (width, height),
+                                                'bbox': (x, y, w, h)})
         else:
             # 使用矩形定位（兼容旧格式）
             # 转换为像素坐标
             # 注意：position存储的是 (center_x, center_y, width, height) 归一化坐标
             # 需要转换为左上角坐标用于绘制
-            center_x = position[0] * self.width
-            center_y = position[1] * self.height
-            w = int(position[2] * self.width)
-            h = int(position[3] * self.height)
+            center_x = position[0] * width
+            center_y = position[1] * height
+            w = int(position[2] * width)
+            h = int(position[3] * height)
         
             # 计算左上角坐标
             x = int(center_x - w / 2)
             y = int(center_y - h / 2)
         
             # 调试信息
-            print(f"\n📍 使用矩形定位:")
-            print(f"   归一化坐标: {position}")
-            print(f"   图片尺寸: {self.width}x{self.height}")
-            print(f"   高亮区域: ({x}, {y}, {w}, {h})")
+            if verbose:
+                logger.debug('使用矩形定位', extra={'position': position,
+                                                'image_size': (width, height),
+                                                'bbox': (x, y, w, h)})
             pixel_points = None
         
         # 确保坐标在范围内
-        x = max(0, min(x, self.width - 1))
-        y = max(0, min(y, self.height - 1))
-        w = min(w, self.width - x)
-        h = min(h, self.height - y)
+        x = max(0, min(x, width - 1))
+        y = max(0, min(y, height - 1))
+        w = min(w, width - x)
+        h = min(h, height - y)
+        return x, y, w, h, pixel_points
+    
+    def _title_tile(self, book_name, render_scale):
+        """
+        书名框（黑色背景、白色文字，最多3行，按输出尺寸缩放）
+        返回: 书名框图片（与 cv2.rectangle 相同，包含右下边界，尺寸为 (box_height+1, box_width+1)）
+        """
+        # 固定背景框大小（所有书名都使用相同大小）
+        box_width = int(600 * render_scale)  # 固定宽度：600像素（按输出尺寸缩放）
+        box_height = int(180 * render_scale)  # 固定高度：足够3行显示
+        tile = np.zeros((box_height + 1, box_width + 1, 3), np.uint8)
         
-        # 创建显示图片
-        frame = self.original_image.copy()
+        # 固定字体大小
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = 1.5 * render_scale
+        thickness = max(1, round(3 * render_scale))
+        max_lines = 3
+        line_spacing = max(1, round(8 * render_scale))
+        padding = max(1, round(15 * render_scale))  # 内边距
         
-        # 将背景设为半透明黑色（60%透明度，可以看到书架）
-        # 60%透明度 = 40%不透明度，所以背景应该是原图的40%亮度
-        overlay = cv2.addWeighted(frame, 0.4, np.zeros_like(frame), 0.6, 0)
+        # 可用宽度和高度（固定背景框内的可用空间）
+        available_width = box_width - padding * 2
         
-        # 高亮区域填充白色（60%透明度，可以看到书架）
-        white_overlay = overlay.copy()
-        if use_points:
-            # 使用四点绘制多边形
-            pts = np.array(pixel_points, np.int32)
-            cv2.fillPoly(white_overlay, [pts], (255, 255, 255))
-        else:
-            # 使用矩形
-            cv2.rectangle(white_overlay, (x, y), (x + w, y + h), (255, 255, 255), -1)
+        # 分割长文本为多行（最多3行）
+        words = book_name.split()
+        lines = []
+        current_line = ""
         
-        # 将白色区域以60%透明度叠加（原图60% + 白色40%）
-        overlay = cv2.addWeighted(overlay, 0.6, white_overlay, 0.4, 0)
-        
-        # 显示书名（固定宽度400，最多3行）
-        if book_name:
-            # 固定背景框大小（所有书名都使用相同大小）
-            center_x = x + w // 2
-            box_width = 600  # 固定宽度：600像素
-            box_height = 180  # 固定高度：足够3行显示
-            box_x = center_x - box_width // 2
-            box_y = max(50, y - box_height - 60)  # 在白色块上方至少60像素
-            
-            # 确保不超出图片边界
-            box_x = max(10, min(box_x, self.width - box_width - 10))
-            box_y = max(10, min(box_y, self.height - box_height - 10))
+        for word in words:
+            test_line = current_line + " " + word if current_line else word
+            (text_width, _), _ = cv2.getTextSize(test_line, font, font_scale, thickness)
             
-            # 固定字体大小
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 1.5
-            thickness = 3
-            max_lines = 3
-            line_spacing = 8
-            padding = 15  # 内边距
-            
-            # 可用宽度和高度（固定背景框内的可用空间）
-            available_width = box_width - padding * 2
-            
-            # 分割长文本为多行（最多3行）
-            words = book_name.split()
-            lines = []
-            current_line = ""
-            
-            for word in words:
-                test_line = current_line + " " + word if current_line else word
-                (text_width, _), _ = cv2.getTextSize(test_line, font, font_scale, thickness)
+            if text_width <= available_width:
+                current_line = test_line
+            else:
+                if current_line:
+                    lines.append(current_line)
+                    if len(lines) >= max_lines:
+                        break
+                current_line = word
+        
+        if current_line and len(lines) < max_lines:
+            lines.append(current_line)
+        
+        # 如果超过3行，缩小字体以适应
+        if len(lines) > max_lines:
+            # 尝试缩小字体
+            for scale in [s * render_scale for s in (1.2, 1.0, 0.8, 0.6)]:
+                test_thickness = max(1, int(scale * 2))
+                test_lines = []
+                test_current_line = ""
                 
-                if text_width <= available_width:
-                    current_line = test_line
-                else:
-                    if current_line:
-                        lines.append(current_line)
-                        if len(lines) >= max_lines:
-                            break
-                    current_line = word
-            
-            if current_line and len(lines) < max_lines:
-                lines.append(current_line)
-            
-            # 如果超过3行，缩小字体以适应
-            if len(lines) > max_lines:
-                # 尝试缩小字体
-                for scale in [1.2, 1.0, 0.8, 0.6]:
-                    test_thickness = max(1, int(scale * 2))
-                    test_lines = []
-                    test_current_line = ""
-                    
-                    for word in words:
-                        test_line = test_current_line + " " + word if test_current_line else word
-                        (text_width, _), _ = cv2.getTextSize(test_line, font, scale, test_thickness)
-                        
-                        if text_width <= available_width:
-                            test_current_line = test_line
-                        else:
-                            if test_current_line:
-                                test_lines.append(test_current_line)
-                                if len(test_lines) >= max_lines:
-                                    break
-                            test_current_line = word
-                    
-                    if test_current_line and len(test_lines) < max_lines:
-                        test_lines.append(test_current_line)
+                for word in words:
+                    test_line = test_current_line + " " + word if test_current_line else word
+                    (text_width, _), _ = cv2.getTextSize(test_line, font, scale, test_thickness)
                     
-                    if len(test_lines) <= max_lines:
-                        lines = test_lines
-                        font_scale = scale
-                        thickness = test_thickness
-                        break
-            
-            # 只保留前3行
-            lines = lines[:max_lines]
-            
-            # 计算每行的高度
-            line_heights = []
-            for line in lines:
-                (_, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
-                line_heights.append(text_height + baseline)
-            
-            # 计算总高度
-            total_text_height = sum(line_heights) + line_spacing * (len(lines) - 1)
-            
-            # 绘制固定黑色矩形框背景
-            cv2.rectangle(
-                overlay,
-                (box_x, box_y),
-                (box_x + box_width, box_y + box_height),
-                (0, 0, 0),
-                -1
-            )
-            
-            # 计算垂直居中位置
-            start_y = box_y + padding + (box_height - padding * 2 - total_text_height) // 2
-            
-            # 绘制每一行文字（在矩形框内居中）
-            current_y = start_y
-            for i, line in enumerate(lines):
-                (text_width, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
-                text_x = box_x + box_width // 2 - text_width // 2  # 水平居中
+                    if text_width <= available_width:
+                        test_current_line = test_line
+                    else:
+                        if test_current_line:
+                            test_lines.append(test_current_line)
+                            if len(test_lines) >= max_lines:
+                                break
+                        test_current_line = word
                 
-                # 绘制文字（白色）
-                cv2.putText(
-                    overlay,
-                    line,
-                    (text_x, current_y + text_height),
-                    font,
-                    font_scale,
-                    (255, 255, 255),
-                    thickness,
-                    cv2.LINE_AA
-                )
+                if test_current_line and len(test_lines) < max_lines:
+                    test_lines.append(test_current_line)
                 
-                current_y += line_heights[i] + line_spacing
+                if len(test_lines) <= max_lines:
+                    lines = test_lines
+                    font_scale = scale
+                    thickness = test_thickness
+                    break
         
-        # 创建GIF动画帧（闪烁+光晕效果）
-        frames = []
-        num_frames = 10  # GIF帧数
-        base_output_path = os.path.join(self.output_dir, "highlight")
+        # 只保留前3行
+        lines = lines[:max_lines]
         
-        print(f"\n💾 正在创建GIF动画（{num_frames}帧，带光晕效果）...")
+        # 计算每行的高度
+        line_heights = []
+        for line in lines:
+            (_, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
+            line_heights.append(text_height + baseline)
         
-        # 创建多帧动画（闪烁+光晕效果）
-        for i in range(num_frames):
-            # 创建当前帧（从半透明背景开始，可以看到书架）
-            # 注意：overlay已经包含书名，所以需要从原始背景开始重新绘制
-            frame_with_glow = cv2.addWeighted(frame, 0.4, np.zeros_like(frame), 0.6, 0)
-            
-            # 计算闪烁强度（0.5到1.0之间循环）
-            cycle = (i / num_frames) * 2 * np.pi
-            intensity = 0.5 + 0.5 * np.sin(cycle)  # 0.5到1.0之间
-            
-            # 根据强度调整白色矩形的亮度
-            white_intensity = int(255 * intensity)
-            
-            # 创建光晕mask
-            glow_mask = np.zeros_like(frame_with_glow)
-            
-            # 绘制主区域（白色填充）
-            if use_points:
-                # 使用四点绘制多边形
-                pts = np.array(pixel_points, np.int32)
-                cv2.fillPoly(glow_mask, [pts], 
-                           (white_intensity, white_intensity, white_intensity))
-            else:
-                # 使用矩形
-                cv2.rectangle(glow_mask, (x, y), (x + w, y + h), 
-                            (white_intensity, white_intensity, white_intensity), -1)
-            
-            # 绘制多层光晕（外层逐渐变透明）
-            glow_size = int(30 * intensity)  # 光晕大小随强度变化
-            for j in range(1, glow_size + 1, 2):
-                # 计算当前层的透明度（外层更透明）
-                alpha = max(0.1, 0.6 * (1 - j / glow_size) * intensity)
-                glow_intensity = int(white_intensity * alpha)
-                
-                # 绘制外层光晕
-                if use_points:
-                    # 四点模式：沿着每条边向外扩展
-                    expanded_points = []
-                    num_points = len(pixel_points)
-                    
-                    for idx in range(num_points):
-                        # 当前点
-                        p1 = pixel_points[idx]
-                        # 下一个点
-                        p2 = pixel_points[(idx + 1) % num_points]
-                        # 前一个点
-                        p0 = pixel_points[(idx - 1) % num_points]
-                        
-                        # 计算两条边的方向向量
-                        edge1 = [p1[0] - p0[0], p1[1] - p0[1]]  # 从p0到p1
-                        edge2 = [p2[0] - p1[0], p2[1] - p1[1]]  # 从p1到p2
-                        
-                        # 归一化
-                        len1 = np.sqrt(edge1[0]**2 + edge1[1]**2) + 1e-6
-                        len2 = np.sqrt(edge2[0]**2 + edge2[1]**2) + 1e-6
-                        edge1_norm = [edge1[0] / len1, edge1[1] / len1]
-                        edge2_norm = [edge2[0] / len2, edge2[1] / len2]
-                        
-                        # 计算每条边的法向量（向外）
-                        # 对于edge1，法向量是旋转90度（顺时针）
-                        normal1 = [edge1_norm[1], -edge1_norm[0]]
-                        # 对于edge2，法向量是旋转90度（顺时针）
-                        normal2 = [edge2_norm[1], -edge2_norm[0]]
-                        
-                        # 使用两条法向量的平均方向
-                        avg_normal = [(normal1[0] + normal2[0]) / 2, (normal1[1] + normal2[1]) / 2]
-                        avg_len = np.sqrt(avg_normal[0]**2 + avg_normal[1]**2) + 1e-6
-                        avg_normal = [avg_normal[0] / avg_len, avg_normal[1] / avg_len]
-                        
-                        # 向外扩展
-                        expanded_x = int(p1[0] + avg_normal[0] * j)
-                        expanded_y = int(p1[1] + avg_normal[1] * j)
-                        expanded_points.append([expanded_x, expanded_y])
-                    
-                    # 绘制扩展后的多边形
-                    if len(expanded_points) >= 3:
-                        pts_expanded = np.array(expanded_points, np.int32)
-                        cv2.fillPoly(glow_mask, [pts_expanded], 
-                                   (glow_intensity, glow_intensity, glow_intensity))
-                else:
-                    # 矩形模式：直接扩展矩形
-                    cv2.rectangle(glow_mask, 
-                                 (x - j, y - j), 
-                                 (x + w + j, y + h + j), 
-                                 (glow_intensity, glow_intensity, glow_intensity), 
-                                 2)
-            
-            # 应用高斯模糊创建柔和的光晕效果
-            blur_size = int(15 * intensity)
-            if blur_size > 0:
-                blur_size = blur_size if blur_size % 2 == 1 else blur_size + 1  # 必须是奇数
-                glow_blur = cv2.GaussianBlur(glow_mask, (blur_size, blur_size), 
-                                             sigmaX=blur_size/3, sigmaY=blur_size/3)
-            else:
-                glow_blur = glow_mask
-            
-            # 将光晕效果叠加到背景上
-            frame_with_glow = cv2.addWeighted(frame_with_glow, 1.0, glow_blur, 0.8, 0)
-            
-            # 绘制主区域（60%透明度，可以看到书架）
-            white_overlay_frame = frame_with_glow.copy()
-            if use_points:
-                # 使用四点绘制多边形
-                pts = np.array(pixel_points, np.int32)
-                cv2.fillPoly(white_overlay_frame, [pts], 
-                           (white_intensity, white_intensity, white_intensity))
-            else:
-                # 使用矩形
-                cv2.rectangle(white_overlay_frame, (x, y), (x + w, y + h), 
-                             (white_intensity, white_intensity, white_intensity), -1)
-            # 将白色区域以60%透明度叠加（原图60% + 白色40%）
-            frame_with_glow = cv2.addWeighted(frame_with_glow, 0.6, white_overlay_frame, 0.4, 0)
+        # 计算总高度
+        total_text_height = sum(line_heights) + line_spacing * (len(lines) - 1)
+        
+        # 计算垂直居中位置
+        start_y = padding + (box_height - padding * 2 - total_text_height) // 2
+        
+        # 绘制每一行文字（在矩形框内居中）
+        current_y = start_y
+        for i, line in enumerate(lines):
+            (text_width, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
+            text_x = box_width // 2 - text_width // 2  # 水平居中
+            
+            # 绘制文字（白色）
+            cv2.putText(
+                tile,
+                line,
+                (text_x, current_y + text_height),
+                font,
+                font_scale,
+                (255, 255, 255),
+                thickness,
+                cv2.LINE_AA
+            )
             
-            # 重新绘制书名（固定宽度400，最多3行）
-            if book_name:
-                # 固定背景框大小（所有书名都使用相同大小）
-                center_x = x + w // 2
-                box_width = 600  # 固定宽度：600像素
-                box_height = 180  # 固定高度：足够3行显示（与第一次绘制保持一致）
-                box_x = center_x - box_width // 2
-                box_y = max(50, y - box_height - 60)  # 在白色块上方至少60像素
-                
-                # 确保不超出图片边界
-                box_x = max(10, min(box_x, self.width - box_width - 10))
-                box_y = max(10, min(box_y, self.height - box_height - 10))
-                
-                # 固定字体大小
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                font_scale = 1.5
-                thickness = 3
-                max_lines = 3
-                line_spacing = 8
-                padding = 15  # 内边距
+            current_y += line_heights[i] + line_spacing
+        return tile
+    
+    def _title_origin(self, x, y, w, width, height, tile, render_scale):
+        """书名框左上角位置（书籍上方，不超出图片边界）"""
+        box_height, box_width = tile.shape[0] - 1, tile.shape[1] - 1
+        # 书名框与图片边缘的最小距离
+        margin = max(1, int(10 * render_scale))
+        center_x = x + w // 2
+        box_x = center_x - box_width // 2
+        box_y = max(int(50 * render_scale), y - box_height - int(60 * render_scale))  # 在白色块上方至少60像素
+        
+        # 确保不超出图片边界
+        box_x = max(margin, min(box_x, width - box_width - margin))
+        box_y = max(margin, min(box_y, height - box_height - margin))
+        return box_x, box_y
+    
+    def build_assets(self, position, book_name="", points=None, output_size=None):
+        """
+        生成一本书的高亮素材（只与书籍位置、书名和输出尺寸有关，可以预先生成并保存，见 book_assets.py）:
+        - roi: 光晕影响的区域 (x0, y0, x1, y1)，每帧只有这个区域与变暗的底图不同
+        - mask: 区域内的书籍形状（白色块）
+        - glow: 区域内每一帧模糊后的光晕（灰度）
+        - title / title_origin: 书名框图片及其位置
+        - bbox: 书籍边界框 (x, y, w, h)
+        """
+        width, height = self.output_dimensions(output_size)
+        render_scale = width / self.width
+        x, y, w, h, pixel_points = self._book_geometry(position, points, width, height)
+        use_points = pixel_points is not None
+        
+        # 光晕区域: 书籍边界框 + 最大光晕宽度 + 模糊半径（区域外的光晕为 0）
+        if use_points:
+            xs = [p[0] for p in pixel_points]
+            ys = [p[1] for p in pixel_points]
+            shape_bounds = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            shape_bounds = (x, y, x + w, y + h)
+        reach = int(30 * render_scale) + int(15 * render_scale) // 2 + 4
+        x0 = max(0, shape_bounds[0] - reach)
+        y0 = max(0, shape_bounds[1] - reach)
+        x1 = min(width, shape_bounds[2] + reach + 1)
+        y1 = min(height, shape_bounds[3] + reach + 1)
+        roi_shape = (max(1, y1 - y0), max(1, x1 - x0))
+        offset = np.array([x0, y0], np.int32)
+        
+        # 书籍形状（白色块）
+        mask = np.zeros(roi_shape, np.uint8)
+        if use_points:
+            # 使用四点绘制多边形
+            pts = np.array(pixel_points, np.int32) - offset
+            cv2.fillPoly(mask, [pts], 255)
+        else:
+            # 使用矩形
+            cv2.rectangle(mask, (x - x0, y - y0), (x + w - x0, y + h - y0), 255, -1)
+        
+        glow_frames = []
+        for i in range(NUM_FRAMES):
+            with span('highlight.glow'):
+                # 计算闪烁强度（0.5到1.0之间循环）
+                cycle = (i / NUM_FRAMES) * 2 * np.pi
+                intensity = 0.5 + 0.5 * np.sin(cycle)  # 0.5到1.0之间
                 
-                # 可用宽度和高度（固定背景框内的可用空间）
-                available_width = box_width - padding * 2
+                # 根据强度调整白色矩形的亮度
+                white_intensity = int(255 * intensity)
                 
-                # 分割长文本为多行（最多3行）
-                words = book_name.split()
-                lines = []
-                current_line = ""
+                # 创建光晕mask（主区域白色填充）
+                glow_mask = np.where(mask > 0, white_intensity, 0).astype(np.uint8)
                 
-                for word in words:
-                    test_line = current_line + " " + word if current_line else word
-                    (text_width, _), _ = cv2.getTextSize(test_line, font, font_scale, thickness)
+                # 绘制多层光晕（外层逐渐变透明）
+                glow_size = int(30 * intensity * render_scale)  # 光晕大小随强度变化
+                for j in range(1, glow_size + 1, 2):
+                    # 计算当前层的透明度（外层更透明）
+                    alpha = max(0.1, 0.6 * (1 - j / glow_size) * intensity)
+                    glow_intensity = int(white_intensity * alpha)
                     
-                    if text_width <= available_width:
-                        current_line = test_line
-                    else:
-                        if current_line:
-                            lines.append(current_line)
-                            if len(lines) >= max_lines:
-                                break
-                        current_line = word
-                
-                if current_line and len(lines) < max_lines:
-                    lines.append(current_line)
-                
-                # 如果超过3行，缩小字体以适应
-                if len(lines) > max_lines:
-                    # 尝试缩小字体
-                    for scale in [1.2, 1.0, 0.8, 0.6]:
-                        test_thickness = max(1, int(scale * 2))
-                        test_lines = []
-                        test_current_line = ""
+                    # 绘制外层光晕
+                    if use_points:
+                        # 四点模式：沿着每条边向外扩展
+                        expanded_points = []
+                        num_points = len(pixel_points)
                         
-                        for word in words:
-                            test_line = test_current_line + " " + word if test_current_line else word
-                            (text_width, _), _ = cv2.getTextSize(test_line, font, scale, test_thickness)
+                        for idx in range(num_points):
+                            # 当前点
+                            p1 = pixel_points[idx]
+                            # 下一个点
+                            p2 = pixel_points[(idx + 1) % num_points]
+                            # 前一个点
+                            p0 = pixel_points[(idx - 1) % num_points]
                             
-                            if text_width <= available_width:
-                                test_current_line = test_line
-                            else:
-                                if test_current_line:
-                                    test_lines.append(test_current_line)
-                                    if len(test_lines) >= max_lines:
-                                        break
-                                test_current_line = word
-                        
-                        if test_current_line and len(test_lines) < max_lines:
-                            test_lines.append(test_current_line)
+                            # 计算两条边的方向向量
+                            edge1 = [p1[0] - p0[0], p1[1] - p0[1]]  # 从p0到p1
+                            edge2 = [p2[0] - p1[0], p2[1] - p1[1]]  # 从p1到p2
+                            
+                            # 归一化
+                            len1 = np.sqrt(edge1[0]**2 + edge1[1]**2) + 1e-6
+                            len2 = np.sqrt(edge2[0]**2 + edge2[1]**2) + 1e-6
+                            edge1_norm = [edge1[0] / len1, edge1[1] / len1]
+                            edge2_norm = [edge2[0] / len2, edge2[1] / len2]
+                            
+                            # 计算每条边的法向量（向外）
+                            # 对于edge1，法向量是旋转90度（顺时针）
+                            normal1 = [edge1_norm[1], -edge1_norm[0]]
+                            # 对于edge2，法向量是旋转90度（顺时针）
+                            normal2 = [edge2_norm[1], -edge2_norm[0]]
+                            
+                            # 使用两条法向量的平均方向
+                            avg_normal = [(normal1[0] + normal2[0]) / 2, (normal1[1] + normal2[1]) / 2]
+                            avg_len = np.sqrt(avg_normal[0]**2 + avg_normal[1]**2) + 1e-6
+                            avg_normal = [avg_normal[0] / avg_len, avg_normal[1] / avg_len]
+                            
+                            # 向外扩展
+                            expanded_x = int(p1[0] + avg_normal[0] * j)
+                            expanded_y = int(p1[1] + avg_normal[1] * j)
+                            expanded_points.append([expanded_x, expanded_y])
                         
-                        if len(test_lines) <= max_lines:
-                            lines = test_lines
-                            font_scale = scale
-                            thickness = test_thickness
-                            break
-                
-                # 只保留前3行
-                lines = lines[:max_lines]
-                
-                # 计算每行的高度
-                line_heights = []
-                for line in lines:
-                    (_, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
-                    line_heights.append(text_height + baseline)
-                
-                # 计算总高度
-                total_text_height = sum(line_heights) + line_spacing * (len(lines) - 1)
-                
-                # 绘制固定黑色矩形框背景
-                cv2.rectangle(
-                    frame_with_glow,
-                    (box_x, box_y),
-                    (box_x + box_width, box_y + box_height),
-                    (0, 0, 0),
-                    -1
-                )
-                
-                # 计算垂直居中位置
-                start_y = box_y + padding + (box_height - padding * 2 - total_text_height) // 2
+                        # 绘制扩展后的多边形
+                        if len(expanded_points) >= 3:
+                            pts_expanded = np.array(expanded_points, np.int32) - offset
+                            cv2.fillPoly(glow_mask, [pts_expanded], glow_intensity)
+                    else:
+                        # 矩形模式：直接扩展矩形
+                        cv2.rectangle(glow_mask, 
+                                     (x - j - x0, y - j - y0), 
+                                     (x + w + j - x0, y + h + j - y0), 
+                                     glow_intensity, 
+                                     2)
                 
-                # 绘制每一行文字（在矩形框内居中）
-                current_y = start_y
-                for i, line in enumerate(lines):
-                    (text_width, text_height), baseline = cv2.getTextSize(line, font, font_scale, thickness)
-                    text_x = box_x + box_width // 2 - text_width // 2  # 水平居中
-                    
-                    # 绘制文字（白色）
-                    cv2.putText(
-                        frame_with_glow,
-                        line,
-                        (text_x, current_y + text_height),
-                        font,
-                        font_scale,
-                (255, 255, 255),
-                        thickness,
-                cv2.LINE_AA
-                    )
-                    
-                    current_y += line_heights[i] + line_spacing
-            
-            # 转换为RGB格式（PIL需要）
-            frame_rgb = cv2.cvtColor(frame_with_glow, cv2.COLOR_BGR2RGB)
-            frames.append(frame_rgb)
+                # 应用高斯模糊创建柔和的光晕效果
+                blur_size = int(15 * intensity * render_scale)
+                if blur_size > 0:
+                    blur_size = blur_size if blur_size % 2 == 1 else blur_size + 1  # 必须是奇数
+                    glow_blur = cv2.GaussianBlur(glow_mask, (blur_size, blur_size), 
+                                                 sigmaX=blur_size/3, sigmaY=blur_size/3)
+                else:
+                    glow_blur = glow_mask
+                glow_frames.append(glow_blur)
         
-        # 保存静态图片（第一帧）
-        static_output_path = base_output_path + ".jpg"
-        success_static = cv2.imwrite(static_output_path, overlay)
+        assets = {
+            'size': (width, height),
+            'bbox': (x, y, w, h),
+            'four_point': use_points,
+            'roi': (x0, y0, x0 + roi_shape[1], y0 + roi_shape[0]),
+            'mask': mask,
+            'glow': np.stack(glow_frames),
+            'title': None,
+            'title_origin': None
+        }
+        # 书名框（固定宽度600，最多3行）
+        if book_name:
+            with span('highlight.text'):
+                tile = self._title_tile(book_name, render_scale)
+                assets['title'] = tile
+                assets['title_origin'] = self._title_origin(x, y, w, width, height, tile, render_scale)
+        return assets
+    
+    @staticmethod
+    def _paste_title(image, assets):
+        """把书名框贴到图片上（超出图片的部分裁掉）"""
+        tile = assets['title']
+        if tile is None:
+            return
+        box_x, box_y = assets['title_origin']
+        height, width = image.shape[:2]
+        tx0, ty0 = max(0, -box_x), max(0, -box_y)
+        x0, y0 = box_x + tx0, box_y + ty0
+        x1 = min(width, box_x + tile.shape[1])
+        y1 = min(height, box_y + tile.shape[0])
+        if x1 > x0 and y1 > y0:
+            image[y0:y1, x0:x1] = tile[ty0:ty0 + (y1 - y0), tx0:tx0 + (x1 - x0)]
+    
+    @staticmethod
+    def _white_block(roi, mask, value):
+        """书籍区域叠加白色（原图60% + 白色40%），value 为白色的亮度"""
+        white_overlay = roi.copy()
+        white_overlay[mask > 0] = value
+        return cv2.addWeighted(roi, 0.6, white_overlay, 0.4, 0)
+    
+    def compose(self, assets, output_size=None):
+        """
+        用高亮素材合成静态图片和动画帧
+        返回: (静态图片 BGR, [动画帧 RGB, ...])
+        """
+        base, _ = self.base_image(output_size)
+        x0, y0, x1, y1 = assets['roi']
+        mask = assets['mask']
         
-        # 创建GIF动画
-        gif_output_path = base_output_path + ".gif"
-        saved_files = []
+        # 将背景设为半透明黑色（60%透明度，可以看到书架）
+        # 60%透明度 = 40%不透明度，所以背景应该是原图的40%亮度
+        dimmed = cv2.addWeighted(base, 0.4, np.zeros_like(base), 0.6, 0)
         
-        try:
-            from PIL import Image
-            
+        # 静态图片: 高亮区域填充白色（60%透明度，可以看到书架）
+        overlay = dimmed.copy()
+        overlay[y0:y1, x0:x1] = self._white_block(overlay[y0:y1, x0:x1], mask, 255)
+        self._paste_title(overlay, assets)
+        
+        # 创建多帧动画（闪烁+光晕效果），只有光晕区域需要逐帧计算
+        frames = []
+        for i, glow in enumerate(assets['glow']):
+            with span('highlight.frame'):
+                cycle = (i / len(assets['glow'])) * 2 * np.pi
+                white_intensity = int(255 * (0.5 + 0.5 * np.sin(cycle)))
+                
+                frame_with_glow = dimmed.copy()
+                roi = frame_with_glow[y0:y1, x0:x1]
+                # 将光晕效果叠加到背景上
+                roi = cv2.addWeighted(roi, 1.0, cv2.cvtColor(glow, cv2.COLOR_GRAY2BGR), 0.8, 0)
+                # 绘制主区域（60%透明度，可以看到书架）
+                frame_with_glow[y0:y1, x0:x1] = self._white_block(roi, mask, white_intensity)
+                self._paste_title(frame_with_glow, assets)
+                
+                # 转换为RGB格式（PIL需要）
+                frames.append(cv2.cvtColor(frame_with_glow, cv2.COLOR_BGR2RGB))
+        return overlay, frames
+    
+    def book_assets(self, position, book_name="", points=None, output_size=None):
+        """书籍素材（位置和书名没有变化时使用预先生成的素材，只需合成和编码）"""
+        size = self.output_dimensions(output_size)
+        key = book_assets.asset_key(self.image_path, size, position, book_name, points)
+        assets = book_assets.load(key)
+        if assets is None:
+            assets = self.build_assets(position, book_name, points, output_size)
+            book_assets.save(key, assets)
+        return assets
+    
+    @staticmethod
+    def _save_gif(frames, path):
+        """保存GIF动画（需要 Pillow，未安装时抛出 ImportError）"""
+        from PIL import Image
+        
+        with span('highlight.encode'):
             # 将numpy数组转换为PIL Image
             pil_frames = [Image.fromarray(f) for f in frames]
             
             # 保存为GIF（循环播放，每帧100ms）
             pil_frames[0].save(
-                gif_output_path,
+                path,
+                format='GIF',
                 save_all=True,
                 append_images=pil_frames[1:],
                 duration=100,  # 每帧100毫秒
                 loop=0,  # 无限循环
                 optimize=True
             )
+    
+    @span('highlight.animation')
+    def render_gif(self, path, position, book_name="", points=None, output_size=None):
+        """
+        只生成GIF动画并保存到 path（不写静态图片和查看页面，用于缓存预览，见 preview_cache.py）
+        先写临时文件再改名，读取方不会看到写到一半的文件
+        返回: 是否成功（Pillow 未安装或图片未加载时为 False）
+        """
+        if self.original_image is None:
+            return False
+        assets = self.book_assets(position, book_name, points, output_size)
+        _, frames = self.compose(assets, output_size)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            self._save_gif(frames, tmp_path)
+            os.replace(tmp_path, path)
+        except ImportError:
+            logger.warning('Pillow未安装，无法创建GIF动画（安装命令: pip install Pillow）')
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+    
+    @span('highlight')
+    def highlight_book(self, position: Tuple[float, float, float, float], 
+                       book_name: str = "", points: list = None, output_size=None):
+        """
+        高亮显示书籍并保存图片
+        position: (x, y, width, height) 归一化坐标 (0-1) - 用于兼容性
+        book_name: 书籍名称
+        points: 四点定位数据 [(x1, y1), (x2, y2), (x3, y3), (x4, y4)] - 归一化坐标 (0-1)，如果提供则优先使用
+        output_size: 输出尺寸上限 (宽, 高)，如手机预览 (1280, 720)、投影仪 (1920, 1080)；
+                     图片按比例缩小到不超过该尺寸后再渲染，书名框、字体、光晕按同一比例缩放。None 表示原图尺寸
+        """
+        import time
+        
+        if self.original_image is None:
+            logger.error('图片未加载', extra={'image_path': self.image_path})
+            return
+        
+        assets = self.book_assets(position, book_name, points, output_size)
+        x, y, w, h = assets['bbox']
+        use_points = assets['four_point']
+        
+        overlay, frames = self.compose(assets, output_size)
+        base_output_path = os.path.join(self.output_dir, "highlight")
+        
+        # 保存静态图片（第一帧）
+        static_output_path = base_output_path + ".jpg"
+        with span('highlight.write'):
+            success_static = cv2.imwrite(static_output_path, overlay)
+        
+        # 创建GIF动画
+        gif_output_path = base_output_path + ".gif"
+        saved_files = []
+        
+        try:
+            self._save_gif(frames, gif_output_path)
             
             gif_size = os.path.getsize(gif_output_path)
-            print(f"✅ GIF动画已保存: {gif_output_path} ({gif_size} 字节)")
+            logger.debug('GIF动画已保存', extra={'path': gif_output_path, 'size': gif_size})
             saved_files.append(gif_output_path)
             
         except ImportError:
-            print("⚠️  Pillow未安装，无法创建GIF动画")
-            print("   安装命令: pip install Pillow")
+            logger.warning('Pillow未安装，无法创建GIF动画（安装命令: pip install Pillow）')
             if success_static:
                 saved_files.append(static_output_path)
         except Exception as e:
-            print(f"⚠️  创建GIF失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('创建GIF失败', extra={'path': gif_output_path})
             if success_static:
                 saved_files.append(static_output_path)
         
         if success_static:
             static_size = os.path.getsize(static_output_path)
-            print(f"✅ 静态图片已保存: {static_output_path} ({static_size} 字节)")
+            logger.debug('静态图片已保存', extra={'path': static_output_path, 'size': static_size})
         
-        print(f"\n{'='*60}")
-        print(f"📚 找到书籍: {book_name}")
-        if saved_files:
-            print(f"✨ GIF动画已保存: {saved_files[0]}")
-        print(f"   高亮区域: ({x}, {y}) 尺寸: {w}x{h}")
-        print(f"   闪烁效果: 白色矩形闪烁动画")
-        print(f"{'='*60}\n")
+        logger.info('高亮已生成', extra={'book_name': book_name, 'bbox': (x, y, w, h),
+                                      'files': saved_files, 'four_point': use_points})
         
         # 尝试自动打开GIF（使用浏览器HTML页面，确保自动播放）
         if saved_files and os.path.exists(saved_files[0]):
@@ -597,14 +634,12 @@ class ProjectorSimple:
 </html>"""
                     
                     # 保存HTML文件
-                    with open(html_path, 'w', encoding='utf-8') as f:
+                    with span('highlight.write'), open(html_path, 'w', encoding='utf-8') as f:
                         f.write(html_content)
                     
                     html_abs_path = os.path.abspath(html_path)
                     html_url = f"file://{html_abs_path}"
                     
-                    print(f"   正在用浏览器打开GIF动画...")
-                    
                     # 先关闭可能已打开的浏览器窗口（可选）
                     try:
                         subprocess.run(['killall', 'Preview'], check=False, capture_output=True, timeout=1)
@@ -615,7 +650,7 @@ class ProjectorSimple:
                     # 尝试使用默认浏览器打开HTML
                     result = subprocess.run(['open', html_url], check=False, capture_output=True)
                     if result.returncode == 0:
-                        print("   ✅ 已用浏览器打开GIF动画（自动播放）")
+                        logger.debug('已用浏览器打开GIF动画', extra={'path': html_path})
                     else:
                         # 如果失败，尝试指定浏览器
                         browsers = ['Safari', 'Google Chrome', 'Firefox', 'Microsoft Edge', 'Chromium']
@@ -625,29 +660,22 @@ class ProjectorSimple:
                                 result = subprocess.run(['open', '-a', browser, html_url], 
                                                       check=False, capture_output=True, timeout=2)
                                 if result.returncode == 0:
-                                    print(f"   ✅ 已用 {browser} 打开GIF动画（自动播放）")
+                                    logger.debug('已用浏览器打开GIF动画', extra={'path': html_path, 'browser': browser})
                                     opened = True
                                     break
                             except:
                                 continue
                         
                         if not opened:
-                            print(f"   ⚠️  无法用浏览器打开，请手动打开: {html_path}")
-                            print(f"   或者直接打开GIF文件: {open_path}")
+                            logger.info('无法用浏览器打开，请手动打开', extra={'path': html_path, 'gif': open_path})
                 else:
                     # 静态图片，使用Preview打开
-                    print(f"   正在打开图片...")
                     result = subprocess.run(['open', '-a', 'Preview', open_path], check=False, capture_output=True)
-                    if result.returncode == 0:
-                        print("   ✅ 已打开图片")
-                    else:
-                        result = subprocess.run(['open', open_path], check=False, capture_output=True)
-                        if result.returncode == 0:
-                            print("   ✅ 已打开图片")
+                    if result.returncode != 0:
+                        subprocess.run(['open', open_path], check=False, capture_output=True)
             except Exception as e:
-                print(f"   ⚠️  打开GIF时出错: {e}")
-                import traceback
-                traceback.print_exc()
+                # 服务器上没有 open 命令，属于正常情况
+                logger.debug('打开GIF时出错', extra={'error': str(e)})
         
         success = len(saved_files) > 0
         
@@ -663,7 +691,7 @@ class ProjectorSimple:
         if self.original_image is not None:
             output_path = os.path.join(self.output_dir, "highlight.jpg")
             cv2.imwrite(output_path, self.original_image)
-            print("📸 已恢复原图")
+            logger.debug('已恢复原图', extra={'path': output_path})
         self.current_highlight = None
     
     def run(self, stop_event=None):
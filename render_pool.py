@@ -0,0 +1,245 @@
+"""
+渲染进程池
+把耗时的高亮动画渲染（OpenCV + GIF 编码）放到独立的进程池中执行，
+Web 线程只负责排队和等待，搜索、书籍列表等轻量请求不会被渲染阻塞
+
+- 进程池大小有上限（RENDER_WORKERS）
+- 排队数量有上限（RENDER_QUEUE_SIZE），队列满时直接拒绝（503）
+- 每个渲染任务有超时（RENDER_TIMEOUT），超时返回 504
+"""
+
+import collections
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import profiling
+from logs import get_logger
+
+# 进程池大小（每个 gunicorn worker 一个进程池）
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# 同时允许的渲染任务数（执行中 + 排队中）
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', RENDER_WORKERS * 4))
+# 单个渲染任务的超时时间（秒）
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 30))
+# 执行方式: process（默认）/ thread（无法创建子进程的环境，如 Serverless）
+RENDER_POOL_MODE = os.environ.get('RENDER_POOL_MODE', 'process')
+# 每个渲染进程缓存多少张已解码的书架底图（多书架时每个书架一张）
+RENDER_FRAME_CACHE = int(os.environ.get('RENDER_FRAME_CACHE', 4))
+# worker 启动后在后台预先启动渲染进程（导入 OpenCV 等），第一次预览不需要等待进程启动
+RENDER_PREWARM = os.environ.get('RENDER_PREWARM', '1').lower() not in ('0', 'false', 'no')
+
+
+class RenderPoolBusy(Exception):
+    """渲染队列已满"""
+
+
+class RenderTimeout(Exception):
+    """渲染超时"""
+
+
+logger = get_logger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# 当前执行中 + 排队中的任务数
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _warm_up():
+    """子进程启动时预先导入 OpenCV/NumPy/PIL，避免第一次渲染时才加载"""
+    import projector_simple  # noqa: F401
+
+
+def _get_executor():
+    """延迟创建进程池（在 gunicorn worker 进程内首次使用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if RENDER_POOL_MODE == 'thread':
+                _executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+            else:
+                try:
+                    # 使用 spawn：gunicorn 线程 worker 中 fork 不安全
+                    context = multiprocessing.get_context('spawn')
+                    _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                                    mp_context=context,
+                                                    initializer=_warm_up)
+                except (OSError, ImportError, NotImplementedError) as e:
+                    logger.warning('无法创建渲染进程池，改用线程池', extra={'error': str(e)})
+                    _executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+        return _executor
+
+
+# 渲染进程内的底图缓存: (图片路径, 修改时间, 输出目录) -> ProjectorSimple，按最近使用排序
+_projectors = collections.OrderedDict()
+_projectors_lock = threading.Lock()
+
+
+def _projector_for(image_path, output_dir):
+    """
+    获取已加载底图的 ProjectorSimple（图片文件变化后重新加载）
+    不同书架的图片分别缓存，超过 RENDER_FRAME_CACHE 张时丢弃最久未使用的
+    """
+    from projector_simple import ProjectorSimple
+
+    key = (os.path.abspath(image_path), os.stat(image_path).st_mtime_ns, output_dir)
+    with _projectors_lock:
+        projector = _projectors.get(key)
+        metrics.count_cache('base_frame', projector is not None)
+        if projector is not None:
+            _projectors.move_to_end(key)
+            return projector
+    projector = ProjectorSimple(image_path=image_path, output_dir=output_dir)
+    with _projectors_lock:
+        _projectors[key] = projector
+        while len(_projectors) > max(1, RENDER_FRAME_CACHE):
+            _projectors.popitem(last=False)
+    return projector
+
+
+def render_highlight(image_path, output_dir, position, book_name, points=None, output_size=None):
+    """
+    在渲染进程中执行：生成高亮图片和GIF动画
+    output_size: 输出尺寸上限 (宽, 高)，None 表示原图尺寸
+    返回: 输出目录中生成的文件名列表
+    """
+    projector = _projector_for(image_path, output_dir)
+    if points and len(points) == 4:
+        # 使用四点定位
+        projector.highlight_book(position, book_name, points=points, output_size=output_size)
+    else:
+        # 使用矩形定位（兼容旧格式）
+        projector.highlight_book(position, book_name, output_size=output_size)
+    return sorted(os.listdir(output_dir))
+
+
+def render_preview(image_path, output_dir, key, position, book_name, points=None, output_size=None):
+    """
+    在渲染进程中执行：只生成高亮GIF动画，按内容哈希放入预览缓存（见 preview_cache.py）
+    key: 预览的渲染哈希（preview_cache.cache_key）
+    返回: 预览文件名，无法生成GIF时返回 None
+    """
+    import preview_cache
+
+    projector = _projector_for(image_path, output_dir)
+    staging = preview_cache.staging_path(key)
+    os.makedirs(os.path.dirname(staging), exist_ok=True)
+    if not projector.render_gif(staging, position, book_name, points=points, output_size=output_size):
+        return None
+    return preview_cache.publish(key, staging)
+
+
+def precompile_assets(image_path, output_dir, books):
+    """
+    在渲染进程中执行：生成书籍的高亮素材（见 book_assets.py）
+    返回: 新生成的素材数
+    """
+    import book_assets
+
+    projector = _projector_for(image_path, output_dir)
+    return book_assets.precompile(image_path, books, projector=projector)
+
+
+def _release(_future=None):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+    metrics.RENDER_IN_FLIGHT.dec()
+
+
+def run(func, *args, timeout=None, **kwargs):
+    """
+    提交渲染任务并等待结果
+    队列已满时抛出 RenderPoolBusy，超时抛出 RenderTimeout
+    """
+    global _in_flight, _executor
+    with _in_flight_lock:
+        if _in_flight >= RENDER_QUEUE_SIZE:
+            raise RenderPoolBusy(f"渲染队列已满（{RENDER_QUEUE_SIZE}）")
+        _in_flight += 1
+    metrics.RENDER_IN_FLIGHT.inc()
+
+    # 当前请求正在剖析时，渲染任务也在剖析下执行，结果合并到请求的剖析中
+    profile = profiling.current()
+    try:
+        if profile is not None:
+            future = _get_executor().submit(profiling.run_profiled, func, args, kwargs)
+        else:
+            future = _get_executor().submit(func, *args, **kwargs)
+    except BrokenProcessPool:
+        # 渲染进程异常退出后重建进程池
+        _release()
+        with _executor_lock:
+            _executor = None
+        raise
+    except Exception:
+        _release()
+        raise
+    # 任务结束（包括超时后才结束）时才释放名额
+    future.add_done_callback(_release)
+
+    timeout = timeout or RENDER_TIMEOUT
+    try:
+        result = future.result(timeout=timeout)
+    except TimeoutError:
+        # 还在排队的任务可以取消；已经开始执行的会在后台完成
+        future.cancel()
+        raise RenderTimeout(f"渲染超过 {timeout} 秒")
+    except BrokenProcessPool:
+        with _executor_lock:
+            _executor = None
+        raise
+    if profile is not None:
+        result, counts = result
+        profile.merge(counts, 'render_process')
+    return result
+
+
+def prewarm():
+    """
+    在后台线程中创建进程池并让每个渲染进程完成启动（不阻塞调用方，不计入渲染队列）
+    在 gunicorn worker 启动后调用；RENDER_PREWARM=0 或线程模式时不执行
+    """
+    if not RENDER_PREWARM or RENDER_POOL_MODE == 'thread':
+        return None
+
+    def warm():
+        try:
+            with metrics.span('render.prewarm'):
+                executor = _get_executor()
+                # 进程池按需启动进程: 同时提交 RENDER_WORKERS 个任务，每个进程都执行一次 initializer
+                futures = [executor.submit(_warm_up) for _ in range(RENDER_WORKERS)]
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            logger.warning('渲染进程预热失败，第一次渲染时再启动', extra={'error': str(e)})
+
+    thread = threading.Thread(target=warm, name='render-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+
+def in_flight():
+    """执行中和排队中的渲染任务数"""
+    return _in_flight
+
+
+def in_flight_all():
+    """所有 gunicorn worker 中执行中和排队中的渲染任务数（单进程运行时等于 in_flight()）"""
+    total = metrics.render_in_flight_total()
+    return _in_flight if total is None else max(total, _in_flight)
+
+
+def stats():
+    """当前渲染队列状态"""
+    return {
+        'workers': RENDER_WORKERS,
+        'queue_size': RENDER_QUEUE_SIZE,
+        'in_flight': _in_flight,
+        'mode': RENDER_POOL_MODE
+    }
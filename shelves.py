@@ -0,0 +1,273 @@
+"""
+多书架模块
+一个书架 = 一张书架照片 + 一个书籍数据库文件（格式与 book_database.py 相同），
+每个书架有自己的书籍、空间索引和渲染用的底图缓存（见 render_pool.py）
+
+书架列表在 shelves.json 中配置（SHELVES_FILE 可指定其他文件）:
+    {
+      "shelves": [
+        {"id": "main", "name": "一楼 A 架", "image": "bookshelf.jpg", "database": "book_database.py"},
+        {"id": "a2", "name": "一楼 B 架", "image": "shelves/a2.jpg", "database": "shelves/a2_books.py"}
+      ]
+    }
+没有配置文件时只有一个书架 main（BOOK_DATABASE_FILE + BOOKSHELF_IMAGE），与单书架时的行为相同
+
+- 书架在第一次使用时才加载，数据库文件变化时自动重新加载
+- 已加载的书架数超过 SHELF_CACHE_SIZE，或已加载书架的估算内存（书籍数据 + 空间索引）之和
+  超过 SHELF_MEMORY_MB 时，卸载最久未使用的书架（按估算值判断: 卸载后进程内存不会立即下降）
+- 搜索会依次查询所有书架，按匹配等级（BookDatabase.rank_book）合并结果
+- 每个书架的空间索引（spatial_index.py）在第一次按位置查找时建立，book_database.py 本身不依赖其他模块
+- 数据库文件与 BOOK_DATABASE_FILE 相同的书架（主书架）通过 catalogue 加载，支持版本号和在线编辑；
+  其他书架只读，修改时用 BOOK_DATABASE_FILE 指向该书架的数据库文件启动编辑器
+"""
+
+import collections
+import itertools
+import json
+import os
+import sys
+import threading
+import weakref
+
+import metrics
+from catalogue import DB_FILE, load_catalogue, load_database
+from logs import get_logger
+from spatial_index import SpatialIndex, book_polygon
+
+SHELVES_FILE = os.environ.get('SHELVES_FILE', 'shelves.json')
+# 同时保留在内存中的书架数（不含主书架）
+SHELF_CACHE_SIZE = int(os.environ.get('SHELF_CACHE_SIZE', 8))
+# 已加载书架（不含主书架）的估算内存上限（MB），超过时卸载书架；0 表示不限制
+SHELF_MEMORY_MB = float(os.environ.get('SHELF_MEMORY_MB', 0))
+# 估算书籍数据大小时抽样的书籍数
+SIZE_SAMPLE_BOOKS = 200
+# 没有配置文件时默认书架的 ID
+DEFAULT_SHELF_ID = 'main'
+
+logger = get_logger(__name__)
+
+
+# 已建立的空间索引: BookDatabase 实例 -> SpatialIndex（书架卸载后随之释放）
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def spatial_index(db):
+    """书籍形状的空间索引（首次使用时建立，books 被替换或增删书籍后自动重建）"""
+    with _indexes_lock:
+        index = _indexes.get(db)
+    if index is None or index.source is not db.books or index.count != len(db.books):
+        index = SpatialIndex(db.books)
+        with _indexes_lock:
+            _indexes[db] = index
+    return index
+
+
+def overlapping_books(db, key):
+    """与指定书籍形状重叠的其他书籍（用于校准时检查位置冲突）"""
+    return spatial_index(db).overlapping(book_polygon(db.books[key]), exclude=key)
+
+
+def _deep_size(value):
+    """对象及其包含的字典、列表、元组、字符串的大小（字节）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+
+def estimate_size_mb(db):
+    """
+    书架在内存中的估算大小（MB）: 书籍数据 + 空间索引
+    按抽样书籍的平均大小推算；空间索引保存每本书的形状、外接矩形和网格位置，按与书籍数据相同估算
+    """
+    books = db.books
+    if not books:
+        return 0.0
+    sample = list(itertools.islice(books.items(), SIZE_SAMPLE_BOOKS))
+    per_book = sum(_deep_size(key) + _deep_size(info) for key, info in sample) / len(sample)
+    catalogue_bytes = sys.getsizeof(books) + per_book * len(books)
+    return catalogue_bytes * 2 / (1024 * 1024)
+
+
+def _rss_mb():
+    """当前进程的常驻内存（MB），无法获取时返回 None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Shelf:
+    """一个书架的配置"""
+    def __init__(self, shelf_id, name, image, database):
+        self.id = shelf_id
+        self.name = name or shelf_id
+        self.image = image
+        self.database = database
+
+    @property
+    def primary(self):
+        """是否为主书架（通过 catalogue 加载，可在线编辑）"""
+        return os.path.abspath(self.database) == os.path.abspath(DB_FILE)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'image_url': f"/api/shelves/{self.id}/image",
+            'tiles_url': f"/api/shelves/{self.id}/tiles",
+            'editable': self.primary
+        }
+
+
+class ShelfRegistry:
+    """书架列表和已加载书架的缓存"""
+    def __init__(self, path=SHELVES_FILE):
+        self.path = path
+        self._shelves = collections.OrderedDict()
+        self._config_fingerprint = False
+        # 已加载的非主书架: shelf_id -> (数据库文件指纹, BookDatabase, 估算大小 MB)，按最近使用排序
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def _read_config(self):
+        """配置文件变化时重新读取书架列表"""
+        try:
+            st = os.stat(self.path)
+            fingerprint = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            fingerprint = None
+        if fingerprint == self._config_fingerprint:
+            return
+
+        shelves = collections.OrderedDict()
+        if fingerprint is None:
+            shelves[DEFAULT_SHELF_ID] = Shelf(DEFAULT_SHELF_ID, None,
+                                              os.environ.get('BOOKSHELF_IMAGE', 'bookshelf.jpg'), DB_FILE)
+        else:
+            base_dir = os.path.dirname(os.path.abspath(self.path))
+            with open(self.path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            for entry in config.get('shelves', []):
+                # 相对路径以配置文件所在目录为准
+                shelves[entry['id']] = Shelf(
+                    entry['id'], entry.get('name'),
+                    os.path.join(base_dir, entry['image']),
+                    os.path.join(base_dir, entry['database']))
+        self._shelves = shelves
+        self._config_fingerprint = fingerprint
+        # 已删除的书架不再保留
+        for shelf_id in list(self._loaded):
+            if shelf_id not in shelves:
+                del self._loaded[shelf_id]
+
+    def shelves(self):
+        """所有书架（配置文件中的顺序）"""
+        with self._lock:
+            self._read_config()
+            return list(self._shelves.values())
+
+    def get(self, shelf_id):
+        """按 ID 获取书架，不存在时返回 None"""
+        with self._lock:
+            self._read_config()
+            return self._shelves.get(shelf_id)
+
+    def default(self):
+        """默认书架（主书架，没有时为第一个书架）"""
+        shelves = self.shelves()
+        for shelf in shelves:
+            if shelf.primary:
+                return shelf
+        return shelves[0] if shelves else None
+
+    def load(self, shelf):
+        """
+        加载书架的书籍数据库（已加载且文件未变化时直接返回缓存）
+        返回: (BookDatabase 实例, 目录版本号)，非主书架没有版本号（None）
+        """
+        if shelf.primary:
+            db, state = load_catalogue()
+            return db, state['version']
+
+        st = os.stat(shelf.database)
+        fingerprint = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._loaded.get(shelf.id)
+            hit = cached is not None and cached[0] == fingerprint
+            metrics.count_cache('shelf', hit)
+            if hit:
+                self._loaded.move_to_end(shelf.id)
+                return cached[1], None
+
+        with metrics.span('shelf.load'):
+            db = load_database(shelf.database)
+            size_mb = estimate_size_mb(db) if SHELF_MEMORY_MB > 0 else 0.0
+        logger.info('书架已加载', extra={'shelf_id': shelf.id, 'books': len(db.books),
+                                       'size_mb': round(size_mb, 1)})
+        with self._lock:
+            self._loaded[shelf.id] = (fingerprint, db, size_mb)
+            self._loaded.move_to_end(shelf.id)
+            self._evict(keep=shelf.id)
+        return db, None
+
+    def _loaded_mb(self):
+        return sum(entry[2] for entry in self._loaded.values())
+
+    def _evict(self, keep):
+        """
+        书架数或估算内存超过上限时卸载最久未使用的书架（调用方持有锁）
+        刚加载的书架（keep）不卸载，即使它本身超过内存上限
+        """
+        while len(self._loaded) > max(1, SHELF_CACHE_SIZE):
+            self._unload(next(iter(self._loaded)))
+        if SHELF_MEMORY_MB > 0:
+            while len(self._loaded) > 1 and self._loaded_mb() > SHELF_MEMORY_MB:
+                shelf_id = next(iter(self._loaded))
+                if shelf_id == keep:
+                    break
+                self._unload(shelf_id)
+
+    def _unload(self, shelf_id):
+        del self._loaded[shelf_id]
+        logger.info('书架已卸载', extra={'shelf_id': shelf_id, 'loaded': len(self._loaded)})
+
+    def search(self, query, limit=5):
+        """
+        在所有书架中搜索，按匹配等级合并（等级相同时按书架顺序）
+        返回: [{'tier', 'shelf', 'book_key', 'book'}, ...]，最多 limit 条
+        """
+        results = []
+        with metrics.span('search.fanout'):
+            for order, shelf in enumerate(self.shelves()):
+                try:
+                    db, _ = self.load(shelf)
+                except (OSError, SyntaxError, KeyError, ValueError) as e:
+                    logger.warning('书架加载失败', extra={'shelf_id': shelf.id, 'error': str(e)})
+                    continue
+                with metrics.span('search'):
+                    tier, key, info = db.rank_book(query)
+                if key is not None:
+                    results.append((tier, order, shelf, key, info))
+        results.sort(key=lambda item: (item[0], item[1]))
+        return [{'tier': tier, 'shelf': shelf, 'book_key': key, 'book': info}
+                for tier, _, shelf, key, info in results[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'shelves': len(self._shelves),
+                'loaded': list(self._loaded),
+                'cache_size': SHELF_CACHE_SIZE,
+                'memory_limit_mb': SHELF_MEMORY_MB,
+                'loaded_mb': round(self._loaded_mb(), 1),
+                'rss_mb': _rss_mb()
+            }
+
+
+registry = ShelfRegistry()
@@ -0,0 +1,178 @@
+"""
+空间索引模块
+在归一化坐标 (0-1) 上建立均匀网格索引，回答"某个点上是哪本书"和"哪些书与某个区域重叠"
+
+- 每本书的形状: 有四点数据时使用四边形（书脊多边形），否则使用 position 矩形（中心点+宽高）
+- 网格只用于筛选候选书籍，最终结果经过精确判断（点在多边形内、多边形与矩形/多边形相交）
+- 只共享一条边的书（相邻的书脊）不算重叠，点在两本书的公共边上时也不算命中
+- 网格大小随书籍数量自动调整，平均每个格子只有少量书籍
+"""
+
+import math
+
+# 网格每边最多的格子数
+MAX_GRID_SIZE = 512
+# 坐标比较的容差（归一化坐标），重叠部分小于该值视为只是相接
+EPSILON = 1e-9
+
+
+def book_polygon(info):
+    """书籍的形状（归一化坐标的顶点列表）"""
+    points = info.get('points')
+    if points and len(points) >= 3:
+        return [(float(x), float(y)) for x, y in points]
+    cx, cy, w, h = info['position']
+    return [(cx - w / 2, cy - h / 2), (cx + w / 2, cy - h / 2),
+            (cx + w / 2, cy + h / 2), (cx - w / 2, cy + h / 2)]
+
+
+def polygon_bounds(polygon):
+    xs = [p[0] for p in polygon]
+    ys = [p[1] for p in polygon]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def polygon_area(polygon):
+    area = 0.0
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % len(polygon)]
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2
+
+
+def point_in_polygon(x, y, polygon, boundary=True):
+    """
+    射线法判断点是否在多边形内
+    boundary: 边界上的点是否视为在内
+    """
+    inside = False
+    n = len(polygon)
+    for i in range(n):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % n]
+        # 在边上
+        if (min(x1, x2) - EPSILON <= x <= max(x1, x2) + EPSILON
+                and min(y1, y2) - EPSILON <= y <= max(y1, y2) + EPSILON
+                and abs((x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)) < 1e-12):
+            return boundary
+        if (y1 > y) != (y2 > y):
+            cross_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            if x < cross_x:
+                inside = not inside
+    return inside
+
+
+def _project(polygon, axis):
+    values = [px * axis[0] + py * axis[1] for px, py in polygon]
+    return min(values), max(values)
+
+
+def polygons_intersect(a, b):
+    """
+    两个凸多边形的内部是否重叠（包括一个完全包含另一个）
+    分离轴判断: 在任意一条边的法线上投影的重叠长度不超过 EPSILON 时不重叠，
+    因此只共享一条边或一个顶点的多边形不算重叠
+    """
+    for polygon in (a, b):
+        for i in range(len(polygon)):
+            x1, y1 = polygon[i]
+            x2, y2 = polygon[(i + 1) % len(polygon)]
+            length = math.hypot(x2 - x1, y2 - y1)
+            if length < EPSILON:
+                continue
+            axis = ((y1 - y2) / length, (x2 - x1) / length)
+            a_min, a_max = _project(a, axis)
+            b_min, b_max = _project(b, axis)
+            if min(a_max, b_max) - max(a_min, b_min) <= EPSILON:
+                return False
+    return True
+
+
+def rect_polygon(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+class SpatialIndex:
+    """
+    书籍形状的均匀网格索引
+    books: BookDatabase.books 格式的字典（按书架建立和缓存见 shelves.spatial_index）
+    """
+    def __init__(self, books):
+        self.source = books
+        self.count = len(books)
+        self.shapes = {}
+        count = max(1, len(books))
+        self.size = max(1, min(MAX_GRID_SIZE, int(math.sqrt(count))))
+        self.cells = {}
+        for key, info in books.items():
+            try:
+                polygon = book_polygon(info)
+            except (KeyError, TypeError, ValueError):
+                continue
+            bounds = polygon_bounds(polygon)
+            self.shapes[key] = (polygon, bounds)
+            for cell in self._cells_for(bounds):
+                self.cells.setdefault(cell, []).append(key)
+
+    def _cell(self, value):
+        return min(self.size - 1, max(0, int(value * self.size)))
+
+    def _cells_for(self, bounds):
+        x0, y0, x1, y1 = bounds
+        for cx in range(self._cell(x0), self._cell(x1) + 1):
+            for cy in range(self._cell(y0), self._cell(y1) + 1):
+                yield cx, cy
+
+    def _candidates(self, bounds):
+        seen = set()
+        for cell in self._cells_for(bounds):
+            for key in self.cells.get(cell, ()):
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    @staticmethod
+    def _bounds_overlap(a, b):
+        """外接矩形是否重叠（只相接不算）"""
+        return (a[0] + EPSILON < b[2] and b[0] + EPSILON < a[2]
+                and a[1] + EPSILON < b[3] and b[1] + EPSILON < a[3])
+
+    def _by_area(self, keys):
+        return sorted(keys, key=lambda key: polygon_area(self.shapes[key][0]))
+
+    def at(self, x, y):
+        """包含点 (x, y) 的书籍（面积小的在前，即最贴合的书排在第一位）"""
+        found = []
+        for key in self.cells.get((self._cell(x), self._cell(y)), ()):
+            polygon, bounds = self.shapes[key]
+            if (bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]
+                    and point_in_polygon(x, y, polygon, boundary=False)):
+                found.append(key)
+        return self._by_area(found)
+
+    def region(self, x0, y0, x1, y1, contains=False):
+        """
+        与矩形区域相交的书籍
+        contains: 为 True 时只返回完全位于区域内的书籍
+        """
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        return self.overlapping(rect_polygon(x0, y0, x1, y1), contains=contains)
+
+    def overlapping(self, polygon, contains=False, exclude=None):
+        """与任意多边形相交（或被其完全包含）的书籍"""
+        query_bounds = polygon_bounds(polygon)
+        found = []
+        for key in self._candidates(query_bounds):
+            if key == exclude:
+                continue
+            shape, bounds = self.shapes[key]
+            if not self._bounds_overlap(bounds, query_bounds):
+                continue
+            if contains:
+                if all(point_in_polygon(px, py, polygon) for px, py in shape):
+                    found.append(key)
+            elif polygons_intersect(shape, polygon):
+                found.append(key)
+        return found
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+书脊自动检测工具
+在书架照片上自动找出书脊的四边形，按顺序匹配到目录中的书籍，批量校准位置，
+人工只需要检查生成的标注图，再用 calibrate_positions.py 修正个别错误
+
+检测流程（每一层书架）:
+1. 层的范围: 该层书籍现有位置的外接范围（可用 --bands 手动指定）
+2. Canny 边缘 + 概率 Hough 直线，只保留接近竖直的长线段
+3. 按水平位置聚类得到书脊分界线（允许倾斜），相邻分界线之间为一本书
+4. 在每本书的中间列上找最强的水平边缘，确定书脊的上下边界
+5. 与该层的书籍按从左到右的顺序做序列对齐（动态规划），
+   代价为位置和宽度与现有数据的差异，允许漏检和多检
+
+用法:
+    python3 spine_detection.py bookshelf.jpg                     # 只生成标注图和检测结果
+    python3 spine_detection.py bookshelf.jpg --shelf 1           # 只检测下排
+    python3 spine_detection.py bookshelf.jpg --match order       # 忽略现有位置，只按顺序匹配
+    python3 spine_detection.py bookshelf.jpg --bands 0.2:0.48,0.55:0.83
+    python3 spine_detection.py bookshelf.jpg --apply             # 写入数据库（四点数据）
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from catalogue import DB_FILE, apply_book_update, catalogue_transaction, load_catalogue
+from spatial_index import book_polygon
+
+# 检测时图片长边缩放到的最大尺寸（像素）
+WORK_SIZE = 1600
+# 竖直线允许的最大倾斜角（度）
+MAX_LEAN_DEGREES = 25
+# 书脊宽度范围（相对于层高）
+MIN_SPINE_RATIO = 0.04
+MAX_SPINE_RATIO = 0.6
+# 层范围向上下扩展的比例（相对于层高）
+BAND_MARGIN = 0.08
+# 序列对齐时跳过一个检测结果 / 一本书的代价
+SKIP_PROPOSAL_COST = 0.15
+SKIP_BOOK_COST = 0.35
+
+
+def shelf_bands(books):
+    """
+    按 shelf 字段分组，每层的范围为书籍现有位置的外接矩形（上下各扩展 BAND_MARGIN）
+    返回: {层号: (x0, y0, x1, y1)}（归一化坐标）
+    """
+    bands = {}
+    for info in books.values():
+        quad = np.array(book_polygon(info), dtype=float)
+        x0, y0 = quad.min(axis=0)
+        x1, y1 = quad.max(axis=0)
+        shelf = info.get('shelf', 0)
+        if shelf in bands:
+            bx0, by0, bx1, by1 = bands[shelf]
+            bands[shelf] = (min(bx0, x0), min(by0, y0), max(bx1, x1), max(by1, y1))
+        else:
+            bands[shelf] = (x0, y0, x1, y1)
+    for shelf, (x0, y0, x1, y1) in bands.items():
+        margin = (y1 - y0) * BAND_MARGIN
+        bands[shelf] = (max(0.0, x0 - 0.02), max(0.0, y0 - margin),
+                        min(1.0, x1 + 0.02), min(1.0, y1 + margin))
+    return bands
+
+
+def _boundaries(edges, max_lean):
+    """
+    竖直分界线: Hough 线段 -> 在层的上沿和下沿处的 x 坐标，按位置聚类
+    返回: (x_top, x_bottom, support) 三个数组，按从左到右排序；support 为线段总长 / 层高
+    """
+    h = edges.shape[0]
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=max(10, int(h * 0.15)),
+                            minLineLength=max(10, int(h * 0.3)), maxLineGap=max(3, int(h * 0.05)))
+    if lines is None:
+        return np.empty(0), np.empty(0), np.empty(0)
+
+    x1, y1, x2, y2 = lines.reshape(-1, 4).astype(float).T
+    dx, dy = x2 - x1, y2 - y1
+    vertical = np.abs(dy) > 0
+    lean = np.degrees(np.arctan2(np.abs(dx), np.abs(dy)))
+    keep = vertical & (lean <= max_lean)
+    if not keep.any():
+        return np.empty(0), np.empty(0), np.empty(0)
+    x1, y1, dx, dy = x1[keep], y1[keep], dx[keep], dy[keep]
+
+    slope = dx / dy
+    x_top = x1 - y1 * slope
+    x_bottom = x1 + (h - y1) * slope
+    length = np.hypot(dx, dy)
+
+    # 按中点位置排序，相距很近的线段属于同一条分界线
+    mid = (x_top + x_bottom) / 2
+    order = np.argsort(mid)
+    mid, x_top, x_bottom, length = mid[order], x_top[order], x_bottom[order], length[order]
+    merge = max(2.0, h * MIN_SPINE_RATIO / 2)
+    cluster = np.concatenate([[0], np.cumsum(np.diff(mid) > merge)])
+    weight = np.bincount(cluster, weights=length)
+    top = np.bincount(cluster, weights=x_top * length) / weight
+    bottom = np.bincount(cluster, weights=x_bottom * length) / weight
+    return top, bottom, weight / h
+
+
+def _prune_boundaries(top, bottom, support, min_width):
+    """相邻分界线太近时去掉支持度较低的一条（书脊上的文字、花纹等）"""
+    top, bottom, support = list(top), list(bottom), list(support)
+    i = 0
+    while i < len(top) - 1:
+        width = (top[i + 1] + bottom[i + 1] - top[i] - bottom[i]) / 2
+        if width < min_width:
+            drop = i if support[i] < support[i + 1] else i + 1
+            del top[drop], bottom[drop], support[drop]
+            i = max(0, i - 1)
+        else:
+            i += 1
+    return np.array(top), np.array(bottom), np.array(support)
+
+
+def _vertical_extent(grad_y, row_mean, left_top, left_bottom, right_top, right_bottom):
+    """
+    书脊的上下边界: 沿书脊中间的一列（随倾斜移动）求每行的水平边缘强度，
+    上半部分中第一个明显的边缘为顶部（减去整行的平均强度，排除横贯整层的隔板边缘），
+    下部最强的边缘为底部（书底和隔板重合，不需要排除）
+    """
+    h, w = grad_y.shape
+    rows = np.arange(h)
+    t = rows / max(1, h - 1)
+    left = left_top + (left_bottom - left_top) * t
+    right = right_top + (right_bottom - right_top) * t
+    quarter = (right - left) / 4
+    lo = np.clip((left + quarter).astype(int), 0, w - 1)
+    hi = np.clip((right - quarter).astype(int), 0, w - 1)
+    hi = np.maximum(hi, lo + 1)
+
+    integral = np.concatenate([np.zeros((h, 1)), np.cumsum(grad_y, axis=1)], axis=1)
+    profile = (integral[rows, np.minimum(hi, w)] - integral[rows, lo]) / (hi - lo)
+    profile = np.convolve(profile, np.ones(3) / 3, mode='same')
+
+    upper = np.clip(profile - row_mean, 0, None)[:int(h * 0.65)]
+    if upper.size and upper.max() > 0:
+        top = int(np.argmax(upper >= upper.max() * 0.5))
+    else:
+        top = 0
+    start = int(h * 0.7)
+    lower = profile[start:]
+    bottom = start + int(np.argmax(lower)) if lower.size and lower.max() > 0 else h - 1
+    return top, bottom
+
+
+def detect_spines(image, band, max_lean=MAX_LEAN_DEGREES):
+    """
+    在一层书架中检测书脊
+    image: BGR 图片; band: (x0, y0, x1, y1) 归一化坐标
+    返回: [{'points': [左上, 右上, 右下, 左下], 'support': 分界线支持度}]，从左到右
+    """
+    height, width = image.shape[:2]
+    x0, y0, x1, y1 = band
+    px0, py0 = int(x0 * width), int(y0 * height)
+    px1, py1 = int(x1 * width), int(y1 * height)
+    crop = image[py0:py1, px0:px1]
+    if crop.size == 0:
+        return []
+    band_h = crop.shape[0]
+
+    # 相邻两本书亮度接近但颜色不同时灰度图上没有边缘，所以按通道分别检测再合并
+    blurred = cv2.GaussianBlur(crop, (5, 5), 0)
+    edges = np.zeros(crop.shape[:2], np.uint8)
+    for channel in cv2.split(blurred):
+        median = float(np.median(channel))
+        edges |= cv2.Canny(channel, int(max(10, 0.66 * median)), int(min(255, 1.33 * median + 30)))
+    grad_y = np.abs(cv2.Sobel(blurred, cv2.CV_32F, 0, 1, ksize=3)).max(axis=2)
+    row_mean = np.convolve(grad_y.mean(axis=1), np.ones(3) / 3, mode='same')
+
+    top, bottom, support = _boundaries(edges, max_lean)
+    top, bottom, support = _prune_boundaries(top, bottom, support, band_h * MIN_SPINE_RATIO)
+
+    spines = []
+    for i in range(len(top) - 1):
+        width_px = (top[i + 1] + bottom[i + 1] - top[i] - bottom[i]) / 2
+        if width_px > band_h * MAX_SPINE_RATIO:
+            # 间隔太宽：空位、书立或横放的书
+            continue
+        row_top, row_bottom = _vertical_extent(grad_y, row_mean, top[i], bottom[i], top[i + 1], bottom[i + 1])
+        if row_bottom - row_top < band_h * 0.3:
+            continue
+
+        def x_at(x_t, x_b, row):
+            return x_t + (x_b - x_t) * row / max(1, band_h - 1)
+
+        quad = [
+            (x_at(top[i], bottom[i], row_top), row_top),
+            (x_at(top[i + 1], bottom[i + 1], row_top), row_top),
+            (x_at(top[i + 1], bottom[i + 1], row_bottom), row_bottom),
+            (x_at(top[i], bottom[i], row_bottom), row_bottom)
+        ]
+        spines.append({
+            'points': [(round(float(px0 + qx) / width, 4), round(float(py0 + qy) / height, 4))
+                       for qx, qy in quad],
+            'support': round(float(min(support[i], support[i + 1])), 3)
+        })
+    return spines
+
+
+def _quad_center_width(quad):
+    xs = [p[0] for p in quad]
+    return sum(xs) / 4, (quad[1][0] + quad[2][0] - quad[0][0] - quad[3][0]) / 2
+
+
+def match_spines(book_keys, books, spines, band, mode='position'):
+    """
+    按从左到右的顺序把检测结果对齐到书籍（动态规划，允许跳过）
+    mode: position（参考现有位置和宽度）/ order（只按顺序，书籍在层内均匀分布）
+    返回: [(book_key, spine 或 None, 代价)]
+    """
+    band_w = max(1e-6, band[2] - band[0])
+    expected = []
+    for i, key in enumerate(book_keys):
+        if mode == 'position':
+            center, width = _quad_center_width(book_polygon(books[key]))
+        else:
+            center, width = band[0] + band_w * (i + 0.5) / len(book_keys), None
+        expected.append((center, width))
+    found = [_quad_center_width(spine['points']) for spine in spines]
+
+    def cost(i, j):
+        center, width = expected[i]
+        value = abs(center - found[j][0]) / band_w * 4
+        if width and width > 0 and found[j][1] > 0:
+            value += 0.3 * abs(math.log(width / found[j][1]))
+        return value
+
+    n, m = len(book_keys), len(spines)
+    # total[i][j]: 前 i 本书和前 j 个检测结果对齐的最小代价
+    total = np.full((n + 1, m + 1), np.inf)
+    step = np.zeros((n + 1, m + 1), dtype=np.int8)
+    total[0, :] = np.arange(m + 1) * SKIP_PROPOSAL_COST
+    total[:, 0] = np.arange(n + 1) * SKIP_BOOK_COST
+    step[0, 1:] = 2
+    step[1:, 0] = 1
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            options = (total[i - 1, j - 1] + cost(i - 1, j - 1),
+                       total[i - 1, j] + SKIP_BOOK_COST,
+                       total[i, j - 1] + SKIP_PROPOSAL_COST)
+            best = int(np.argmin(options))
+            total[i, j] = options[best]
+            step[i, j] = best
+
+    matches = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and step[i, j] == 0:
+            matches.append((book_keys[i - 1], spines[j - 1], cost(i - 1, j - 1)))
+            i, j = i - 1, j - 1
+        elif i > 0 and (j == 0 or step[i, j] == 1):
+            matches.append((book_keys[i - 1], None, SKIP_BOOK_COST))
+            i -= 1
+        else:
+            j -= 1
+    matches.reverse()
+    return matches
+
+
+def _confidence(spine, match_cost):
+    """0-1 的置信度: 分界线越清晰、与现有数据越接近越高"""
+    return round(max(0.0, min(1.0, spine['support'])) * max(0.0, 1 - match_cost), 3)
+
+
+def run_detection(image, books, bands, mode='position'):
+    """
+    检测所有层并匹配
+    返回: {'proposals': {book_key: {...}}, 'unmatched_books': [...], 'extra_spines': [...],
+           'shelves': {层号: {'books': 书籍数, 'spines': 检测到的书脊数}}}
+    """
+    proposals = {}
+    unmatched = []
+    extra = []
+    counts = {}
+    for shelf, band in sorted(bands.items()):
+        book_keys = [key for key, info in books.items() if info.get('shelf', 0) == shelf]
+        # 现有位置从左到右（没有位置的书保持数据库中的顺序）
+        book_keys.sort(key=lambda key: _quad_center_width(book_polygon(books[key]))[0]
+                       if mode == 'position' else 0)
+        spines = detect_spines(image, band)
+        counts[shelf] = {'books': len(book_keys), 'spines': len(spines)}
+        matched_ids = set()
+        for key, spine, match_cost in match_spines(book_keys, books, spines, band, mode):
+            if spine is None:
+                unmatched.append(key)
+                continue
+            matched_ids.add(id(spine))
+            proposals[key] = {
+                'shelf': shelf,
+                'points': spine['points'],
+                'confidence': _confidence(spine, match_cost)
+            }
+        extra.extend(dict(spine, shelf=shelf) for spine in spines if id(spine) not in matched_ids)
+    return {'proposals': proposals, 'unmatched_books': unmatched, 'extra_spines': extra, 'shelves': counts}
+
+
+def draw_review(image, result, path, min_confidence):
+    """标注图: 绿色=将写入, 橙色=置信度低, 红色=未匹配到书籍的检测结果"""
+    review = image.copy()
+    height, width = review.shape[:2]
+    scale = max(0.35, width / 3000)
+
+    def to_pixels(points):
+        return np.array([(int(x * width), int(y * height)) for x, y in points], np.int32)
+
+    for spine in result['extra_spines']:
+        cv2.polylines(review, [to_pixels(spine['points'])], True, (0, 0, 255), 2)
+    for index, (key, proposal) in enumerate(result['proposals'].items(), 1):
+        pts = to_pixels(proposal['points'])
+        color = (0, 200, 0) if proposal['confidence'] >= min_confidence else (0, 165, 255)
+        cv2.polylines(review, [pts], True, color, 2)
+        # 书名竖着写不下，只标序号，对应关系见检测结果 JSON / 终端输出
+        cv2.putText(review, str(index), (int(pts[:, 0].min()), int(pts[:, 1].min()) - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, color, max(1, int(scale * 2)))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    cv2.imwrite(path, review)
+
+
+def apply_proposals(proposals, min_confidence):
+    """把置信度足够的检测结果写入数据库（一次事务，写入前自动备份）"""
+    with catalogue_transaction() as txn:
+        content = txn.content
+        applied = 0
+        for key, proposal in proposals.items():
+            if proposal['confidence'] < min_confidence:
+                continue
+            content, flags = apply_book_update(content, key, {'points': proposal['points']})
+            if flags['points_found'] or flags['position_found']:
+                applied += 1
+        if applied == 0:
+            return 0, txn.version
+        _, version = txn.commit(content)
+    return applied, version
+
+
+def _parse_bands(text):
+    """"0.2:0.48,0.55:0.83" -> {0: (0, 0.2, 1, 0.48), 1: (0, 0.55, 1, 0.83)}"""
+    bands = {}
+    for shelf, part in enumerate(p for p in text.split(',') if p.strip()):
+        y0, y1 = (float(v) for v in part.split(':'))
+        bands[shelf] = (0.0, min(y0, y1), 1.0, max(y0, y1))
+    return bands
+
+
+def main():
+    parser = argparse.ArgumentParser(description='书脊自动检测，批量校准书籍位置')
+    parser.add_argument('image', help='书架照片路径')
+    parser.add_argument('--shelf', type=int, help='只检测指定的层（shelf 字段）')
+    parser.add_argument('--bands', help='手动指定每层的上下范围（归一化），如 0.2:0.48,0.55:0.83')
+    parser.add_argument('--match', choices=['position', 'order'], default='position',
+                        help='position: 参考现有位置（默认）; order: 只按从左到右的顺序')
+    parser.add_argument('--review', default=os.path.join('projector_output', 'spine_review.jpg'),
+                        help='标注图保存路径')
+    parser.add_argument('--output', help='检测结果 JSON 保存路径')
+    parser.add_argument('--min-confidence', type=float, default=0.3,
+                        help='写入数据库的最低置信度（默认 0.3）')
+    parser.add_argument('--apply', action='store_true', help='把检测结果写入数据库（四点数据）')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"❌ 无法加载图片: {args.image}")
+        sys.exit(1)
+    # 大图缩小后检测（坐标是归一化的，不受影响）
+    scale = WORK_SIZE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    db, _ = load_catalogue()
+    books = db.books
+    bands = _parse_bands(args.bands) if args.bands else shelf_bands(books)
+    if args.shelf is not None:
+        bands = {shelf: band for shelf, band in bands.items() if shelf == args.shelf}
+        if not bands:
+            print(f"❌ 没有第 {args.shelf} 层的书籍")
+            sys.exit(1)
+
+    print(f"📸 图片: {args.image}（检测尺寸 {image.shape[1]}x{image.shape[0]}）")
+    print(f"📚 数据库: {DB_FILE}，共 {len(books)} 本书，检测 {len(bands)} 层")
+
+    result = run_detection(image, books, bands, args.match)
+    proposals = result['proposals']
+    for shelf, count in sorted(result['shelves'].items()):
+        print(f"   第 {shelf} 层: 检测到 {count['spines']} 个书脊 / {count['books']} 本书")
+        if args.match == 'order' and count['spines'] != count['books']:
+            print("   ⚠️  数量不一致，只按顺序匹配时漏检之后的书会错位，建议先检查标注图")
+    confident = sum(1 for p in proposals.values() if p['confidence'] >= args.min_confidence)
+
+    print(f"\n🔍 匹配到 {len(proposals)} 本书（置信度 ≥ {args.min_confidence}: {confident} 本）")
+    for index, (key, proposal) in enumerate(proposals.items(), 1):
+        mark = '✅' if proposal['confidence'] >= args.min_confidence else '⚠️ '
+        print(f"   {mark} {index:3d}. [{proposal['shelf']}] {key}  置信度 {proposal['confidence']:.2f}")
+    if result['unmatched_books']:
+        print(f"\n❓ 未检测到 {len(result['unmatched_books'])} 本书（需要手动校准）:")
+        for key in result['unmatched_books']:
+            print(f"   - {key}")
+    if result['extra_spines']:
+        print(f"\nℹ️  {len(result['extra_spines'])} 个检测结果没有对应的书籍（标注图中红色）")
+
+    draw_review(image, result, args.review, args.min_confidence)
+    print(f"\n🖼  标注图: {args.review}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 检测结果: {args.output}")
+
+    if args.apply:
+        applied, version = apply_proposals(proposals, args.min_confidence)
+        if applied:
+            print(f"\n✅ 已写入 {applied} 本书籍的四点位置到 {DB_FILE} (版本 {version})")
+            print("   请检查标注图，个别错误用 calibrate_positions.py 修正")
+        else:
+            print("\n⚠️  没有写入任何书籍位置")
+    else:
+        print("\n💡 确认标注图无误后，加 --apply 写入数据库")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,20 +8,42 @@ let selectedRect = null;
 let editMode = 'points'; // 只使用四点模式
 let points = [null, null, null, null]; // 四个角点
 let currentPointIndex = 0; // 当前正在编辑的点
+let catalogueVersion = null; // 已加载的目录版本号（用于增量加载）
+let remoteEditPending = false; // 当前编辑的书籍被其他人修改（等待下次完整同步）
+
+// 分层绘制: 未选中的书籍预先画到离屏画布（静态层），只在书籍数据、选中书籍或画布大小变化时重画；
+// 鼠标移动时只重画选中的书籍和四个编辑点，并合并到下一帧（requestAnimationFrame）
+let staticLayer = null;
+let staticLayerDirty = true;
+let staticLayerBook = null; // 构建静态层时排除的书籍（当前选中的书籍）
+let renderScheduled = false;
+
+// 书架图片瓦片（见 tiles.py）: 按画布显示尺寸选择层级，只加载可见范围内的瓦片
+let tileManifest = null;
+let tileLevel = null;       // 当前绘制的层级
+const drawnTiles = new Set(); // 当前层级已绘制的瓦片
+const tileImages = new Map(); // 瓦片地址 -> Image（加载中或已加载）
+
+// 点击检测用的网格索引（画布坐标），目录整体替换或画布大小变化时重建，单本书变化时只更新该书
+let hitGrid = null;
 
 // DOM元素
 const bookshelfImage = document.getElementById('bookshelfImage');
 const overlayCanvas = document.getElementById('overlayCanvas');
 const ctx = overlayCanvas.getContext('2d');
+const tileCanvas = document.getElementById('tileCanvas');
+const tileCtx = tileCanvas.getContext('2d');
 const bookList = document.getElementById('bookList');
 const bookEditor = document.getElementById('bookEditor');
 const imageUpload = document.getElementById('imageUpload');
 
 // 初始化
 async function init() {
+    loadShelfTiles();
     await loadBooks();
     await loadSettings();
     setupEventListeners();
+    subscribeCatalogueEvents();
     
     // 等待图片加载完成后再绘制
     if (bookshelfImage.complete) {
@@ -39,16 +61,115 @@ async function init() {
     }
 }
 
+// 加载书架图片的瓦片清单；不可用时直接加载原图
+async function loadShelfTiles() {
+    try {
+        const response = await fetch('/api/tiles', { cache: 'no-cache' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        tileManifest = await response.json();
+        // 图片元素只显示最小的一层（用于页面布局），清晰的画面由瓦片画布绘制
+        const smallest = tileManifest.levels[tileManifest.levels.length - 1];
+        bookshelfImage.src = tileManifest.level_url.replace('{level}', smallest.level);
+    } catch (error) {
+        console.warn('瓦片不可用，加载原图:', error);
+        tileManifest = null;
+        bookshelfImage.src = '/bookshelf.jpg';
+    }
+}
+
+// 绘制画布显示尺寸所需层级的可见瓦片（已绘制的瓦片不重复绘制）
+function drawTiles() {
+    if (!tileManifest) return;
+    const rect = bookshelfImage.getBoundingClientRect();
+    if (rect.width === 0 || rect.height === 0) return;
+    
+    const dpr = window.devicePixelRatio || 1;
+    const width = Math.round(rect.width * dpr);
+    const height = Math.round(rect.height * dpr);
+    if (tileCanvas.width !== width || tileCanvas.height !== height) {
+        tileCanvas.width = width;
+        tileCanvas.height = height;
+        tileLevel = null;
+    }
+    
+    // 宽度不小于画布像素宽度的最小层级
+    let level = tileManifest.levels[0];
+    for (const candidate of tileManifest.levels) {
+        if (candidate.width < width) break;
+        level = candidate;
+    }
+    if (tileLevel !== level.level) {
+        tileLevel = level.level;
+        drawnTiles.clear();
+    }
+    
+    const scale = width / level.width;
+    const tileSize = tileManifest.tile_size * scale;
+    // 可见范围（画布像素）
+    const x0 = Math.max(0, -rect.left) * dpr;
+    const y0 = Math.max(0, -rect.top) * dpr;
+    const x1 = Math.min(rect.width, window.innerWidth - rect.left) * dpr;
+    const y1 = Math.min(rect.height, window.innerHeight - rect.top) * dpr;
+    if (x1 <= x0 || y1 <= y0) return;
+    
+    const c0 = Math.floor(x0 / tileSize), c1 = Math.min(level.cols - 1, Math.floor(x1 / tileSize));
+    const r0 = Math.floor(y0 / tileSize), r1 = Math.min(level.rows - 1, Math.floor(y1 / tileSize));
+    for (let row = r0; row <= r1; row++) {
+        for (let col = c0; col <= c1; col++) {
+            const key = `${col}_${row}`;
+            if (drawnTiles.has(key)) continue;
+            drawnTiles.add(key);
+            const url = tileManifest.tile_url.replace('{level}', level.level)
+                .replace('{col}', col).replace('{row}', row);
+            let image = tileImages.get(url);
+            if (!image) {
+                image = new Image();
+                image.src = url;
+                tileImages.set(url, image);
+            }
+            const draw = () => {
+                if (tileLevel !== level.level) return;  // 已切换到其他层级
+                const x = Math.floor(col * tileSize);
+                const y = Math.floor(row * tileSize);
+                tileCtx.drawImage(image, x, y,
+                                  Math.ceil(col * tileSize + image.naturalWidth * scale) - x,
+                                  Math.ceil(row * tileSize + image.naturalHeight * scale) - y);
+            };
+            if (image.complete && image.naturalWidth > 0) {
+                draw();
+            } else {
+                image.addEventListener('load', draw, { once: true });
+                image.addEventListener('error', () => drawnTiles.delete(key), { once: true });
+            }
+        }
+    }
+}
+
 // 加载书籍数据
 async function loadBooks() {
     try {
-        // 添加时间戳防止缓存
-        const response = await fetch(`/api/books?t=${Date.now()}`);
-        const newBooks = await response.json();
-        console.log('加载书籍数据:', newBooks);
+        // 首次加载获取完整目录，之后只请求上次版本之后的增量
+        // cache: 'no-cache' 让浏览器带上 If-None-Match，目录未变化时服务器返回304
+        const url = catalogueVersion === null ? '/api/books' : `/api/books?since=${catalogueVersion}`;
+        const response = await fetch(url, { cache: 'no-cache' });
+        const data = await response.json();
         
         // 更新书籍数据
-        books = newBooks;
+        if (catalogueVersion === null) {
+            books = data;
+            invalidateHitGrid();
+        } else if (data.full) {
+            books = data.books;
+            invalidateHitGrid();
+        } else {
+            Object.assign(books, data.books);
+            (data.deleted || []).forEach(key => delete books[key]);
+            Object.keys(data.books).concat(data.deleted || []).forEach(updateHitGrid);
+        }
+        const version = parseInt(response.headers.get('X-Catalogue-Version'));
+        catalogueVersion = Number.isNaN(version) ? null : version;
+        remoteEditPending = false;
+        console.log('加载书籍数据:', Object.keys(books).length, '本, 版本:', catalogueVersion);
         renderBookList();
         
         // 如果当前有选中的书籍，更新编辑面板
@@ -80,6 +201,91 @@ async function loadBooks() {
     }
 }
 
+// 订阅目录变化事件（其他编辑器或校准工具保存后增量更新）
+// 优先使用服务器推送（EventSource）；服务器推送连接数已满或浏览器不支持时改为轮询 /api/events
+function subscribeCatalogueEvents() {
+    let after = null;
+    
+    const applyChange = (change) => {
+        if (catalogueVersion === null || change.version <= catalogueVersion) return;
+        
+        if ((change.truncated || change.version > catalogueVersion + 1) && !remoteEditPending) {
+            // 变化太大（事件中只有书籍关键词）或漏掉了中间的版本，改为拉取增量
+            loadBooks();
+            return;
+        }
+        if (change.truncated) return;
+        
+        Object.entries(change.books).forEach(([key, book]) => {
+            if (key === currentBook) {
+                // 不覆盖正在编辑的书籍；保存时服务器会返回冲突
+                console.warn('正在编辑的书籍已被其他人修改:', key);
+                remoteEditPending = true;
+                return;
+            }
+            books[key] = book;
+            updateHitGrid(key);
+        });
+        change.deleted.forEach(key => {
+            if (key !== currentBook) {
+                delete books[key];
+                updateHitGrid(key);
+            }
+        });
+        if (!remoteEditPending) {
+            catalogueVersion = change.version;
+        }
+        
+        renderBookList();
+        if (currentBook) {
+            document.querySelectorAll('.book-item').forEach(item => {
+                item.classList.toggle('active', item.dataset.key === currentBook);
+            });
+        }
+        drawBooks();
+    };
+    
+    const poll = async () => {
+        let delay = 2000;
+        try {
+            const url = after === null ? '/api/events?types=catalogue'
+                                       : `/api/events?types=catalogue&after=${after}`;
+            const response = await fetch(url, { cache: 'no-store' });
+            const data = await response.json();
+            delay = data.poll_ms || delay;
+            if (data.missed && !remoteEditPending) {
+                // 事件已丢失（服务器日志已截断），改为拉取增量
+                loadBooks();
+            } else {
+                data.events.forEach(event => applyChange(event.data));
+            }
+            after = data.last_id;
+        } catch (error) {
+            console.warn('获取目录事件失败:', error);
+            delay *= 2;
+        }
+        setTimeout(poll, document.hidden ? delay * 2 : delay);
+    };
+    
+    if (!('EventSource' in window)) {
+        poll();
+        return;
+    }
+    const source = new EventSource('/api/events?types=catalogue');
+    source.addEventListener('catalogue', (e) => applyChange(JSON.parse(e.data)));
+    source.addEventListener('missed', () => {
+        // 事件已丢失（服务器日志已截断），改为拉取增量
+        if (!remoteEditPending) loadBooks();
+    });
+    source.onerror = () => {
+        // 连接中断时浏览器会自动重连；服务器拒绝推送（连接数已满）时不再重连，改为轮询
+        if (source.readyState !== EventSource.CLOSED) return;
+        console.warn('目录事件推送不可用，改为轮询');
+        if (!remoteEditPending) loadBooks();
+        poll();
+    };
+}
+
 // 加载设置
 async function loadSettings() {
     try {
@@ -146,8 +352,6 @@ function updateEditorUI() {
     if (!currentBook || !books[currentBook]) return;
     
     const book = books[currentBook];
-    console.log('updateEditorUI - 当前书籍:', currentBook);
-    console.log('updateEditorUI - 书籍数据:', JSON.stringify(book, null, 2));
     
     document.getElementById('bookKey').value = currentBook;
     document.getElementById('bookName').value = book.full_name;
@@ -164,7 +368,6 @@ function updateEditorUI() {
                 return [Number(p[0]), Number(p[1])];
             }
         });
-        console.log('✅ updateEditorUI - 从 book.points 加载四点:', points);
     } else if (book.position && Array.isArray(book.position) && book.position.length === 4) {
         // 从矩形位置计算四个角点
         const [x, y, w, h] = book.position;
@@ -180,15 +383,13 @@ function updateEditorUI() {
             [xMax, yMax], // 右下
             [xMin, yMax]  // 左下
         ];
-        console.log('⚠️  updateEditorUI - 从 book.position 计算四点:', points);
     } else {
         console.warn('❌ updateEditorUI - 书籍没有有效的 points 或 position 数据');
     }
     
     currentPointIndex = 0;
     updatePointsUI();
-    console.log('updateEditorUI - 更新后的 points:', points);
-    drawBooks(); // 重新绘制
+    drawSelection(); // 重新绘制选中的书籍
 }
 
 // 更新设置UI
@@ -220,6 +421,8 @@ function setupEventListeners() {
     
     // 窗口大小改变
     window.addEventListener('resize', resizeCanvas);
+    // 滚动后加载新露出的瓦片
+    window.addEventListener('scroll', drawTiles, { passive: true });
     
     // 图片上传
     imageUpload.addEventListener('change', (e) => {
@@ -227,6 +430,9 @@ function setupEventListeners() {
         if (file) {
             const reader = new FileReader();
             reader.onload = (event) => {
+                // 本地图片没有瓦片，直接显示
+                tileManifest = null;
+                tileCanvas.style.display = 'none';
                 bookshelfImage.src = event.target.result;
             };
             reader.readAsDataURL(file);
@@ -278,35 +484,85 @@ function resizeCanvas() {
     overlayCanvas.style.width = rect.width + 'px';
     overlayCanvas.style.height = rect.height + 'px';
     
+    drawTiles();
     drawBooks();
 }
 
-// 绘制所有书籍
+// 重新绘制所有书籍（书籍数据变化后调用，静态层在下一帧重建）
 function drawBooks() {
-    if (!imageLoaded) return;
+    staticLayerDirty = true;
+    scheduleRender();
+}
+
+// 只重新绘制选中的书籍和编辑点（编辑四点、拖动时调用）
+function drawSelection() {
+    scheduleRender();
+}
+
+// 同一帧内的多次重绘请求合并为一次
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(renderFrame);
+}
+
+function renderFrame() {
+    renderScheduled = false;
+    if (!imageLoaded || overlayCanvas.width === 0 || overlayCanvas.height === 0) return;
+    
+    if (staticLayerDirty || staticLayerBook !== currentBook ||
+        !staticLayer || staticLayer.width !== overlayCanvas.width || staticLayer.height !== overlayCanvas.height) {
+        buildStaticLayer();
+    }
     
     ctx.clearRect(0, 0, overlayCanvas.width, overlayCanvas.height);
+    ctx.drawImage(staticLayer, 0, 0);
+    
+    // 选中的书籍和四个编辑点
+    if (currentBook && books[currentBook]) {
+        drawBook(ctx, books[currentBook], true);
+        drawPoints();
+    }
+}
+
+// 把所有未选中的书籍画到离屏画布
+function buildStaticLayer() {
+    const width = overlayCanvas.width;
+    const height = overlayCanvas.height;
+    if (!staticLayer || staticLayer.width !== width || staticLayer.height !== height) {
+        if (typeof OffscreenCanvas !== 'undefined') {
+            staticLayer = new OffscreenCanvas(width, height);
+        } else {
+            staticLayer = document.createElement('canvas');
+            staticLayer.width = width;
+            staticLayer.height = height;
+        }
+    }
+    const layerCtx = staticLayer.getContext('2d');
+    layerCtx.clearRect(0, 0, width, height);
     
     Object.keys(books).forEach(key => {
-        const book = books[key];
-        const isSelected = key === currentBook;
-        
-        // 优先使用四点数据绘制多边形，否则使用矩形位置
-        if (book.points && Array.isArray(book.points) && book.points.length === 4) {
-            drawBookPolygon(book.points, isSelected, book.full_name);
-        } else if (book.position && Array.isArray(book.position) && book.position.length === 4) {
-            drawBookRect(book.position, isSelected, book.full_name);
+        if (key !== currentBook) {
+            drawBook(layerCtx, books[key], false);
         }
     });
     
-    // 如果当前选中了书籍且有四点数据，绘制四个编辑点
-    if (currentBook && books[currentBook] && points && points.length === 4) {
-        drawPoints();
+    staticLayerDirty = false;
+    staticLayerBook = currentBook;
+}
+
+// 绘制一本书（优先使用四点数据绘制多边形，否则使用矩形位置）
+function drawBook(target, book, isSelected) {
+    if (!book) return;
+    if (book.points && Array.isArray(book.points) && book.points.length === 4) {
+        drawBookPolygon(target, book.points, isSelected, book.full_name);
+    } else if (book.position && Array.isArray(book.position) && book.position.length === 4) {
+        drawBookRect(target, book.position, isSelected, book.full_name);
     }
 }
 
 // 绘制书籍矩形（兼容旧格式）
-function drawBookRect(position, isSelected, bookName) {
+function drawBookRect(target, position, isSelected, bookName) {
     if (!position || position.length !== 4) return;
     
     const [x, y, w, h] = position;
@@ -321,25 +577,25 @@ function drawBookRect(position, isSelected, bookName) {
     const rectY = py - ph / 2;
     
     // 绘制矩形
-    ctx.strokeStyle = isSelected ? '#2196f3' : '#4caf50';
-    ctx.lineWidth = isSelected ? 3 : 2;
-    ctx.strokeRect(rectX, rectY, pw, ph);
+    target.strokeStyle = isSelected ? '#2196f3' : '#4caf50';
+    target.lineWidth = isSelected ? 3 : 2;
+    target.strokeRect(rectX, rectY, pw, ph);
     
     // 绘制书名
     if (isSelected && bookName) {
-        ctx.fillStyle = 'rgba(33, 150, 243, 0.2)';
-        ctx.fillRect(rectX, rectY, pw, ph);
+        target.fillStyle = 'rgba(33, 150, 243, 0.2)';
+        target.fillRect(rectX, rectY, pw, ph);
         
-        ctx.fillStyle = '#2196f3';
-        ctx.font = 'bold 14px sans-serif';
-        ctx.textAlign = 'center';
-        ctx.textBaseline = 'middle';
-        ctx.fillText(bookName.substring(0, 30), px, py);
+        target.fillStyle = '#2196f3';
+        target.font = 'bold 14px sans-serif';
+        target.textAlign = 'center';
+        target.textBaseline = 'middle';
+        target.fillText(bookName.substring(0, 30), px, py);
     }
 }
 
 // 绘制书籍多边形（四点模式）
-function drawBookPolygon(points, isSelected, bookName) {
+function drawBookPolygon(target, points, isSelected, bookName) {
     if (!points || points.length !== 4) return;
     
     // 转换为画布坐标
@@ -349,31 +605,31 @@ function drawBookPolygon(points, isSelected, bookName) {
     ]);
     
     // 绘制多边形
-    ctx.beginPath();
-    ctx.moveTo(canvasPoints[0][0], canvasPoints[0][1]);
+    target.beginPath();
+    target.moveTo(canvasPoints[0][0], canvasPoints[0][1]);
     for (let i = 1; i < 4; i++) {
-        ctx.lineTo(canvasPoints[i][0], canvasPoints[i][1]);
+        target.lineTo(canvasPoints[i][0], canvasPoints[i][1]);
     }
-    ctx.closePath();
+    target.closePath();
     
-    ctx.strokeStyle = isSelected ? '#2196f3' : '#4caf50';
-    ctx.lineWidth = isSelected ? 3 : 2;
-    ctx.stroke();
+    target.strokeStyle = isSelected ? '#2196f3' : '#4caf50';
+    target.lineWidth = isSelected ? 3 : 2;
+    target.stroke();
     
     // 绘制书名
     if (isSelected && bookName) {
-        ctx.fillStyle = 'rgba(33, 150, 243, 0.2)';
-        ctx.fill();
+        target.fillStyle = 'rgba(33, 150, 243, 0.2)';
+        target.fill();
         
         // 计算中心点
         const centerX = canvasPoints.reduce((sum, p) => sum + p[0], 0) / 4;
         const centerY = canvasPoints.reduce((sum, p) => sum + p[1], 0) / 4;
         
-        ctx.fillStyle = '#2196f3';
-        ctx.font = 'bold 14px sans-serif';
-        ctx.textAlign = 'center';
-        ctx.textBaseline = 'middle';
-        ctx.fillText(bookName.substring(0, 30), centerX, centerY);
+        target.fillStyle = '#2196f3';
+        target.font = 'bold 14px sans-serif';
+        target.textAlign = 'center';
+        target.textBaseline = 'middle';
+        target.fillText(bookName.substring(0, 30), centerX, centerY);
     }
 }
 
@@ -411,7 +667,7 @@ function startDrag(e) {
         if (clickedPointIndex >= 0) {
             currentPointIndex = clickedPointIndex;
             updatePointsUI();
-            drawBooks();
+            drawSelection();
             return;
         }
         
@@ -444,9 +700,9 @@ function onDrag(e) {
         pos[2],
         pos[3]
     ];
+    updateHitGrid(currentBook);
     
     updateEditorUI();
-    drawBooks();
     
     dragStart = { x, y };
 }
@@ -462,29 +718,7 @@ function findBookAtPosition(x, y) {
         return null;
     }
     
-    const normalizedX = x / overlayCanvas.width;
-    const normalizedY = y / overlayCanvas.height;
-    
-    // 优先检查四点数据
-    for (const [key, book] of Object.entries(books)) {
-        if (book.points && Array.isArray(book.points) && book.points.length === 4) {
-            // 使用四点数据判断点击是否在多边形内
-            if (isPointInPolygon(normalizedX, normalizedY, book.points)) {
-                return key;
-            }
-        } else if (book.position && Array.isArray(book.position) && book.position.length === 4) {
-            // 使用矩形位置判断
-            const [bx, by, bw, bh] = book.position;
-            const rectX = bx - bw / 2;
-            const rectY = by - bh / 2;
-            
-            if (normalizedX >= rectX && normalizedX <= rectX + bw &&
-                normalizedY >= rectY && normalizedY <= rectY + bh) {
-                return key;
-            }
-        }
-    }
-    return null;
+    return hitTestBook(x, y);
 }
 
 // 判断点是否在多边形内（使用射线法）
@@ -501,6 +735,116 @@ function isPointInPolygon(x, y, polygon) {
     return inside;
 }
 
+// 书籍在画布上的形状（四点多边形，没有四点时为矩形）
+function bookCanvasPolygon(book) {
+    const width = overlayCanvas.width;
+    const height = overlayCanvas.height;
+    if (book.points && Array.isArray(book.points) && book.points.length === 4) {
+        return book.points.map(p => [p[0] * width, p[1] * height]);
+    }
+    if (book.position && Array.isArray(book.position) && book.position.length === 4) {
+        const [bx, by, bw, bh] = book.position;
+        const x0 = (bx - bw / 2) * width, x1 = (bx + bw / 2) * width;
+        const y0 = (by - bh / 2) * height, y1 = (by + bh / 2) * height;
+        return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]];
+    }
+    return null;
+}
+
+function invalidateHitGrid() {
+    hitGrid = null;
+}
+
+// 建立网格索引: 每边约 sqrt(书籍数) 个格子，每本书登记到其外接矩形覆盖的格子中
+function buildHitGrid() {
+    const keys = Object.keys(books);
+    const size = Math.max(1, Math.min(256, Math.floor(Math.sqrt(keys.length))));
+    hitGrid = {
+        width: overlayCanvas.width,
+        height: overlayCanvas.height,
+        cols: size,
+        rows: size,
+        cellWidth: overlayCanvas.width / size,
+        cellHeight: overlayCanvas.height / size,
+        cells: new Map(),   // 格子编号 -> [书籍关键词]
+        entries: new Map()  // 书籍关键词 -> { polygon, bounds, area, cells }
+    };
+    keys.forEach(key => addToHitGrid(key));
+}
+
+function hitGridCell(value, cellSize, count) {
+    return Math.min(count - 1, Math.max(0, Math.floor(value / cellSize)));
+}
+
+function addToHitGrid(key) {
+    const polygon = bookCanvasPolygon(books[key]);
+    if (!polygon) return;
+    const xs = polygon.map(p => p[0]);
+    const ys = polygon.map(p => p[1]);
+    const bounds = [Math.min(...xs), Math.min(...ys), Math.max(...xs), Math.max(...ys)];
+    let area = 0;
+    for (let i = 0, j = polygon.length - 1; i < polygon.length; j = i++) {
+        area += polygon[j][0] * polygon[i][1] - polygon[i][0] * polygon[j][1];
+    }
+    
+    const cells = [];
+    const c0 = hitGridCell(bounds[0], hitGrid.cellWidth, hitGrid.cols);
+    const c1 = hitGridCell(bounds[2], hitGrid.cellWidth, hitGrid.cols);
+    const r0 = hitGridCell(bounds[1], hitGrid.cellHeight, hitGrid.rows);
+    const r1 = hitGridCell(bounds[3], hitGrid.cellHeight, hitGrid.rows);
+    for (let c = c0; c <= c1; c++) {
+        for (let r = r0; r <= r1; r++) {
+            const cell = r * hitGrid.cols + c;
+            if (!hitGrid.cells.has(cell)) hitGrid.cells.set(cell, []);
+            hitGrid.cells.get(cell).push(key);
+            cells.push(cell);
+        }
+    }
+    hitGrid.entries.set(key, { polygon, bounds, area: Math.abs(area) / 2, cells });
+}
+
+function removeFromHitGrid(key) {
+    const entry = hitGrid.entries.get(key);
+    if (!entry) return;
+    entry.cells.forEach(cell => {
+        const keys = hitGrid.cells.get(cell).filter(k => k !== key);
+        if (keys.length) {
+            hitGrid.cells.set(cell, keys);
+        } else {
+            hitGrid.cells.delete(cell);
+        }
+    });
+    hitGrid.entries.delete(key);
+}
+
+// 单本书新增、修改或删除后只更新这本书的格子（索引尚未建立时无需处理）
+function updateHitGrid(key) {
+    if (!hitGrid) return;
+    removeFromHitGrid(key);
+    if (books[key]) addToHitGrid(key);
+}
+
+// 画布坐标 (x, y) 上的书籍；多本书重叠时返回面积最小（最贴合）的一本
+function hitTestBook(x, y) {
+    if (!hitGrid || hitGrid.width !== overlayCanvas.width || hitGrid.height !== overlayCanvas.height) {
+        buildHitGrid();
+    }
+    const cell = hitGridCell(y, hitGrid.cellHeight, hitGrid.rows) * hitGrid.cols +
+                 hitGridCell(x, hitGrid.cellWidth, hitGrid.cols);
+    let found = null;
+    let foundArea = Infinity;
+    (hitGrid.cells.get(cell) || []).forEach(key => {
+        const entry = hitGrid.entries.get(key);
+        const [x0, y0, x1, y1] = entry.bounds;
+        if (x < x0 || x > x1 || y < y0 || y > y1 || entry.area >= foundArea) return;
+        if (isPointInPolygon(x, y, entry.polygon)) {
+            found = key;
+            foundArea = entry.area;
+        }
+    });
+    return found;
+}
+
 // 从输入框更新位置（已移除矩形模式）
 
 // 更新设置
@@ -557,10 +901,16 @@ async function updateBook() {
             },
             body: JSON.stringify({
                 points: points,  // 保存四个点
-                full_name: book.full_name
+                full_name: book.full_name,
+                base_version: catalogueVersion  // 乐观并发控制：其他人已修改时服务器返回409
             })
         });
         
+        if (response.status === 409) {
+            await handleConflict(await response.json());
+            return;
+        }
+        
         // 检查响应类型
         const contentType = response.headers.get('content-type');
         if (!contentType || !contentType.includes('application/json')) {
@@ -581,7 +931,7 @@ async function updateBook() {
             // 等待一小段时间确保文件已写入
             await new Promise(resolve => setTimeout(resolve, 300));
             
-            // 重新加载书籍列表以获取最新数据（添加缓存破坏参数确保获取最新数据）
+            // 重新加载书籍列表以获取最新数据（只拉取增量）
             await loadBooks();
             
             // 恢复选中的书籍并更新显示
@@ -647,6 +997,18 @@ async function updateBook() {
     }
 }
 
+// 处理版本冲突（书籍在本地加载之后已被其他人修改）
+async function handleConflict(result) {
+    console.warn('版本冲突:', result);
+    alert(`书籍 "${result.book_key}" 已被其他人修改，将加载最新数据。\n请检查后重新修改。`);
+    await loadBooks();
+    if (currentBook && books[currentBook]) {
+        updateEditorUI();
+    } else {
+        cancelEdit();
+    }
+}
+
 // 取消编辑
 function cancelEdit() {
     bookEditor.style.display = 'none';
@@ -657,33 +1019,47 @@ function cancelEdit() {
     drawBooks();
 }
 
-// 保存所有更改
+// 保存所有更改（一次批量请求，服务器只写一次文件）
 async function saveAll() {
-    let saved = 0;
-    let failed = 0;
+    const changes = Object.entries(books).map(([key, book]) => ({
+        key: key,
+        position: book.position,
+        full_name: book.full_name
+    }));
     
-    for (const [key, book] of Object.entries(books)) {
-        try {
-            const response = await fetch(`/api/books/${key}`, {
-                method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    position: book.position,
-                    full_name: book.full_name
-                })
-            });
-            
-            if (response.ok) {
-                saved++;
-            } else {
-                failed++;
-            }
-        } catch (error) {
-            failed++;
+    try {
+        const response = await fetch('/api/books', {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ changes: changes, base_version: catalogueVersion })
+        });
+        const result = await response.json();
+        
+        if (!result.results) {
+            alert('保存失败: ' + (result.error || '未知错误'));
+            return;
         }
+        
+        const saved = result.results.filter(r => r.success).length;
+        const failed = result.results.length - saved;
+        result.results.filter(r => !r.success).forEach(r => {
+            console.error('保存失败:', r.key, r.error);
+        });
+        
+        const conflicts = result.results.filter(r => r.conflict).length;
+        
+        // 拉取最新数据和版本号（包括其他人的修改）
+        await loadBooks();
+        
+        if (conflicts > 0) {
+            alert(`保存完成！成功: ${saved}, 失败: ${failed}\n其中 ${conflicts} 本书已被其他人修改，已加载最新数据，请检查后重新保存`);
+        } else {
+            alert(`保存完成！成功: ${saved}, 失败: ${failed}`);
+        }
+    } catch (error) {
+        console.error('批量保存失败:', error);
+        alert('保存失败: ' + error.message);
     }
-    
-    alert(`保存完成！成功: ${saved}, 失败: ${failed}`);
 }
 
 // 预览效果（打开语音交互预览页面）
@@ -728,7 +1104,7 @@ function handleCanvasClick(e) {
     // 移动到下一个点
     currentPointIndex = (currentPointIndex + 1) % 4;
     
-    drawBooks();
+    drawSelection();
 }
 
 // 更新四点UI
@@ -750,7 +1126,7 @@ function updatePointFromInput(index) {
     const x = parseFloat(document.getElementById(`point${index + 1}X`).value) || 0;
     const y = parseFloat(document.getElementById(`point${index + 1}Y`).value) || 0;
     points[index] = [x, y];
-    drawBooks();
+    drawSelection();
 }
 
 // 将四点转换为矩形（已移除，只使用四点模式）
@@ -764,13 +1140,18 @@ async function deleteBook() {
     }
     
     try {
-        const response = await fetch(`/api/books/${currentBook}`, {
-            method: 'DELETE'
+        const response = await fetch(`/api/books/${encodeURIComponent(currentBook)}`, {
+            method: 'DELETE',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ base_version: catalogueVersion })
         });
         
-        if (response.ok) {
+        if (response.status === 409) {
+            await handleConflict(await response.json());
+        } else if (response.ok) {
             // 从本地数据中删除
             delete books[currentBook];
+            updateHitGrid(currentBook);
             renderBookList();
             cancelEdit();
             alert('书籍删除成功！');
@@ -783,47 +1164,6 @@ async function deleteBook() {
     }
 }
 
-// 绘制所有书籍
-function drawBooks() {
-    if (!imageLoaded || overlayCanvas.width === 0 || overlayCanvas.height === 0) {
-        console.log('画布未准备好:', { imageLoaded, width: overlayCanvas.width, height: overlayCanvas.height });
-        return;
-    }
-    
-    // 清除画布
-    ctx.clearRect(0, 0, overlayCanvas.width, overlayCanvas.height);
-    
-    // 绘制所有书籍（使用四点或矩形）
-    Object.keys(books).forEach(key => {
-        const book = books[key];
-        if (book && book.position) {
-            const isSelected = key === currentBook;
-            // 如果有四点数据，使用四点绘制；否则使用矩形
-            if (book.points && Array.isArray(book.points) && book.points.length === 4) {
-                // 确保points格式正确
-                const normalizedPoints = book.points.map(p => {
-                    if (Array.isArray(p)) {
-                        return [p[0], p[1]];
-                    } else {
-                        return [p[0], p[1]];
-                    }
-                });
-                drawBookPolygon(normalizedPoints, isSelected, book.full_name);
-            } else {
-                drawBookRect(book.position, isSelected, book.full_name);
-            }
-        }
-    });
-    
-    // 如果选中了书籍，绘制四个编辑点
-    if (currentBook) {
-        drawPoints();
-    }
-    
-    console.log('绘制完成，当前书籍:', currentBook, '书籍数量:', Object.keys(books).length);
-    console.log('书籍数据示例:', books[Object.keys(books)[0]]);
-}
-
 // 绘制四个点
 function drawPoints() {
     const pointRadius = 4; // 缩小点的半径（从8改为4）
@@ -0,0 +1,371 @@
+// 浏览器端书籍高亮动画渲染器
+// 效果与 projector_simple.py 的 ProjectorSimple.highlight_book 相同（背景变暗、白色光晕闪烁、书名框），
+// 服务器只需要返回书籍坐标（/api/search 的 position / points），不再为每次搜索生成 GIF
+//
+// 同一个文件有两种用法:
+// - 作为 Web Worker 脚本: 页面把 <canvas> 通过 transferControlToOffscreen 交给 Worker，在 OffscreenCanvas 上渲染
+// - 作为普通脚本: 浏览器不支持 OffscreenCanvas 时在主线程用 Canvas2D 渲染（HighlightAnimator）
+//
+// 每帧只有书籍周围的区域在变化: 整张图（变暗的背景+书名框）只画一次，
+// 10 帧光晕区域预先渲染成小图，播放时只重绘这一块
+
+const HIGHLIGHT_FRAMES = 10;        // 动画帧数（与 GIF 相同）
+const HIGHLIGHT_FRAME_MS = 100;     // 每帧时长（毫秒）
+const HIGHLIGHT_MAX_GLOW = 30;      // 光晕最大宽度（像素）
+const HIGHLIGHT_MAX_BLUR = 15;      // 光晕模糊核最大尺寸（像素）
+// OpenCV FONT_HERSHEY_SIMPLEX 在 font_scale=1 时的字高和基线（像素），用于换算 Canvas 字号
+const HERSHEY_TEXT_HEIGHT = 22;
+const HERSHEY_BASELINE = 10;
+
+const DEFAULT_HIGHLIGHT_SETTINGS = {
+    box_width: 600,
+    box_height: 180,
+    font_scale: 1.5,
+    font_thickness: 3,
+    max_lines: 3,
+    line_spacing: 8,
+    padding: 15
+};
+
+// 创建离屏绘图表面（优先 OffscreenCanvas，主线程中没有时使用普通 canvas）
+function createSurface(width, height) {
+    if (typeof OffscreenCanvas !== 'undefined') {
+        return new OffscreenCanvas(width, height);
+    }
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    return canvas;
+}
+
+// 加载书架图片；返回 { bitmap, etag }，图片未变化（ETag 相同）时沿用已解码的图片
+async function loadShelfImage(url, cached) {
+    const response = await fetch(url, { cache: 'no-cache' });
+    if (!response.ok) {
+        throw new Error(`加载书架图片失败: ${response.status}`);
+    }
+    const etag = response.headers.get('ETag') || response.headers.get('Last-Modified');
+    if (cached && cached.url === url && etag && cached.etag === etag) {
+        return cached;
+    }
+    const blob = await response.blob();
+    let bitmap;
+    if (typeof createImageBitmap !== 'undefined') {
+        bitmap = await createImageBitmap(blob);
+    } else {
+        bitmap = await new Promise((resolve, reject) => {
+            const img = new Image();
+            img.onload = () => resolve(img);
+            img.onerror = () => reject(new Error('书架图片解码失败'));
+            img.src = URL.createObjectURL(blob);
+        });
+    }
+    return { url, etag, bitmap };
+}
+
+// 书籍在图片上的像素坐标（与 ProjectorSimple.highlight_book 的换算方式相同）
+function highlightGeometry(book, width, height) {
+    let x, y, w, h;
+    let polygon = null;
+    if (book.points && book.points.length === 4) {
+        polygon = book.points.map(p => [Math.trunc(p[0] * width), Math.trunc(p[1] * height)]);
+        const xs = polygon.map(p => p[0]);
+        const ys = polygon.map(p => p[1]);
+        x = Math.min(...xs);
+        y = Math.min(...ys);
+        w = Math.max(...xs) - x;
+        h = Math.max(...ys) - y;
+    } else {
+        const [cx, cy, pw, ph] = book.position;
+        w = Math.trunc(pw * width);
+        h = Math.trunc(ph * height);
+        x = Math.trunc(cx * width - w / 2);
+        y = Math.trunc(cy * height - h / 2);
+    }
+    x = Math.max(0, Math.min(x, width - 1));
+    y = Math.max(0, Math.min(y, height - 1));
+    w = Math.min(w, width - x);
+    h = Math.min(h, height - y);
+    return { x, y, w, h, polygon };
+}
+
+// 多边形每个顶点沿两条相邻边法向量的平均方向向外扩展 distance 像素
+function expandPolygon(polygon, distance) {
+    const n = polygon.length;
+    return polygon.map((p1, idx) => {
+        const p0 = polygon[(idx - 1 + n) % n];
+        const p2 = polygon[(idx + 1) % n];
+        const len1 = Math.hypot(p1[0] - p0[0], p1[1] - p0[1]) + 1e-6;
+        const len2 = Math.hypot(p2[0] - p1[0], p2[1] - p1[1]) + 1e-6;
+        const n1 = [(p1[1] - p0[1]) / len1, -(p1[0] - p0[0]) / len1];
+        const n2 = [(p2[1] - p1[1]) / len2, -(p2[0] - p1[0]) / len2];
+        const avg = [(n1[0] + n2[0]) / 2, (n1[1] + n2[1]) / 2];
+        const avgLen = Math.hypot(avg[0], avg[1]) + 1e-6;
+        return [Math.trunc(p1[0] + avg[0] / avgLen * distance),
+                Math.trunc(p1[1] + avg[1] / avgLen * distance)];
+    });
+}
+
+function fillPolygon(ctx, polygon) {
+    ctx.beginPath();
+    ctx.moveTo(polygon[0][0], polygon[0][1]);
+    for (let i = 1; i < polygon.length; i++) {
+        ctx.lineTo(polygon[i][0], polygon[i][1]);
+    }
+    ctx.closePath();
+    ctx.fill();
+}
+
+function grey(value) {
+    const v = Math.max(0, Math.min(255, Math.round(value)));
+    return `rgb(${v}, ${v}, ${v})`;
+}
+
+// 书名分行（按单词换行，最多 max_lines 行；放不下时依次缩小字号）
+function layoutTitle(ctx, name, settings) {
+    const available = settings.box_width - settings.padding * 2;
+    const words = name.split(/\s+/).filter(Boolean);
+    const scales = [settings.font_scale, 1.2, 1.0, 0.8, 0.6].filter(s => s <= settings.font_scale);
+    let layout = null;
+    for (const scale of scales) {
+        const thickness = scale === settings.font_scale ? settings.font_thickness : Math.max(1, Math.trunc(scale * 2));
+        ctx.font = titleFont(scale, thickness);
+        const lines = [];
+        let current = '';
+        let used = 0;
+        for (const word of words) {
+            const test = current ? `${current} ${word}` : word;
+            if (ctx.measureText(test).width <= available) {
+                current = test;
+            } else {
+                if (current) {
+                    lines.push(current);
+                    if (lines.length >= settings.max_lines) break;
+                }
+                current = word;
+            }
+            used++;
+        }
+        if (current && lines.length < settings.max_lines) {
+            lines.push(current);
+        }
+        layout = { lines: lines.slice(0, settings.max_lines), scale, thickness };
+        if (used === words.length && lines.length <= settings.max_lines) break;
+    }
+    return layout;
+}
+
+function titleFont(scale, thickness) {
+    // Hershey 字体的字高约为 0.72 个字号
+    const size = Math.round(HERSHEY_TEXT_HEIGHT * scale / 0.72);
+    return `${thickness >= 2 ? 'bold ' : ''}${size}px "Helvetica Neue", Arial, sans-serif`;
+}
+
+// 书名框位置（在书籍上方至少 60 像素，不超出图片边界）
+function titleBox(geometry, settings, width, height) {
+    const centerX = geometry.x + Math.floor(geometry.w / 2);
+    let boxX = centerX - Math.floor(settings.box_width / 2);
+    let boxY = Math.max(50, geometry.y - settings.box_height - 60);
+    boxX = Math.max(10, Math.min(boxX, width - settings.box_width - 10));
+    boxY = Math.max(10, Math.min(boxY, height - settings.box_height - 10));
+    return { x: boxX, y: boxY, w: settings.box_width, h: settings.box_height };
+}
+
+function drawTitle(ctx, name, box, settings) {
+    if (!name) return;
+    ctx.fillStyle = '#000';
+    ctx.fillRect(box.x, box.y, box.w, box.h);
+
+    const layout = layoutTitle(ctx, name, settings);
+    const textHeight = Math.round(HERSHEY_TEXT_HEIGHT * layout.scale);
+    const lineHeight = textHeight + Math.round(HERSHEY_BASELINE * layout.scale);
+    const total = lineHeight * layout.lines.length + settings.line_spacing * (layout.lines.length - 1);
+    let currentY = box.y + settings.padding + Math.floor((box.h - settings.padding * 2 - total) / 2);
+
+    ctx.font = titleFont(layout.scale, layout.thickness);
+    ctx.fillStyle = '#fff';
+    ctx.textAlign = 'center';
+    ctx.textBaseline = 'alphabetic';
+    for (const line of layout.lines) {
+        ctx.fillText(line, box.x + Math.floor(box.w / 2), currentY + textHeight);
+        currentY += lineHeight + settings.line_spacing;
+    }
+}
+
+// 把 source 模糊后叠加到 ctx（不支持 ctx.filter 时用缩小再放大近似）
+function drawBlurred(ctx, source, sigma) {
+    if (sigma <= 0) {
+        ctx.drawImage(source, 0, 0);
+    } else if ('filter' in ctx) {
+        ctx.filter = `blur(${sigma}px)`;
+        ctx.drawImage(source, 0, 0);
+        ctx.filter = 'none';
+    } else {
+        const factor = Math.max(1, sigma);
+        const small = createSurface(Math.max(1, Math.round(source.width / factor)),
+                                    Math.max(1, Math.round(source.height / factor)));
+        const smallCtx = small.getContext('2d');
+        smallCtx.imageSmoothingEnabled = true;
+        smallCtx.drawImage(source, 0, 0, small.width, small.height);
+        ctx.imageSmoothingEnabled = true;
+        ctx.drawImage(small, 0, 0, source.width, source.height);
+    }
+}
+
+// 渲染第 index 帧的光晕区域（patch: 图片上的矩形区域）
+function renderGlowFrame(index, base, geometry, patch, title, settings, name) {
+    const frame = createSurface(patch.w, patch.h);
+    const ctx = frame.getContext('2d');
+    ctx.drawImage(base, patch.x, patch.y, patch.w, patch.h, 0, 0, patch.w, patch.h);
+    ctx.translate(-patch.x, -patch.y);
+
+    // 闪烁强度（正弦变化）
+    const intensity = 0.5 + 0.5 * Math.sin(index / HIGHLIGHT_FRAMES * 2 * Math.PI);
+    const white = Math.trunc(255 * intensity);
+
+    // 光晕 mask: 主区域白色填充，外层逐渐变暗（后画的外层覆盖内层，与 cv2.fillPoly 相同）
+    const mask = createSurface(patch.w, patch.h);
+    const maskCtx = mask.getContext('2d');
+    maskCtx.fillStyle = '#000';
+    maskCtx.fillRect(0, 0, patch.w, patch.h);
+    maskCtx.translate(-patch.x, -patch.y);
+    maskCtx.fillStyle = grey(white);
+    if (geometry.polygon) {
+        fillPolygon(maskCtx, geometry.polygon);
+    } else {
+        maskCtx.fillRect(geometry.x, geometry.y, geometry.w, geometry.h);
+    }
+    const glowSize = Math.trunc(HIGHLIGHT_MAX_GLOW * intensity);
+    maskCtx.lineWidth = 2;
+    for (let j = 1; j <= glowSize; j += 2) {
+        const alpha = Math.max(0.1, 0.6 * (1 - j / glowSize) * intensity);
+        const color = grey(Math.trunc(white * alpha));
+        if (geometry.polygon) {
+            maskCtx.fillStyle = color;
+            fillPolygon(maskCtx, expandPolygon(geometry.polygon, j));
+        } else {
+            maskCtx.strokeStyle = color;
+            maskCtx.strokeRect(geometry.x - j, geometry.y - j, geometry.w + 2 * j, geometry.h + 2 * j);
+        }
+    }
+
+    // 模糊后以 0.8 的权重叠加（lighter = 相加并截断到 255，与 cv2.addWeighted 相同）
+    let blurSize = Math.trunc(HIGHLIGHT_MAX_BLUR * intensity);
+    if (blurSize > 0 && blurSize % 2 === 0) blurSize += 1;
+    ctx.save();
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    ctx.globalCompositeOperation = 'lighter';
+    ctx.globalAlpha = 0.8;
+    drawBlurred(ctx, mask, blurSize / 3);
+    ctx.restore();
+
+    // 主区域以 40% 的白色叠加
+    ctx.globalAlpha = 0.4;
+    ctx.fillStyle = grey(white);
+    if (geometry.polygon) {
+        fillPolygon(ctx, geometry.polygon);
+    } else {
+        ctx.fillRect(geometry.x, geometry.y, geometry.w, geometry.h);
+    }
+    ctx.globalAlpha = 1;
+
+    drawTitle(ctx, name, title, settings);
+    return frame;
+}
+
+// 在 canvas（HTMLCanvasElement 或 OffscreenCanvas）上播放高亮动画
+class HighlightAnimator {
+    constructor(canvas) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.image = null;
+        this.timer = null;
+        this.generation = 0;
+    }
+
+    // request: { image_url, book_name, position, points, settings }
+    async show(request) {
+        const generation = ++this.generation;
+        this.stop();
+        this.image = await loadShelfImage(request.image_url, this.image);
+        if (generation !== this.generation) return false;  // 已有更新的请求
+
+        const bitmap = this.image.bitmap;
+        const width = bitmap.width;
+        const height = bitmap.height;
+        const settings = Object.assign({}, DEFAULT_HIGHLIGHT_SETTINGS, request.settings || {});
+        const geometry = highlightGeometry(request, width, height);
+        const title = titleBox(geometry, settings, width, height);
+
+        // 变暗的背景（原图 40% 亮度）
+        const base = createSurface(width, height);
+        const baseCtx = base.getContext('2d');
+        baseCtx.drawImage(bitmap, 0, 0);
+        baseCtx.fillStyle = 'rgba(0, 0, 0, 0.6)';
+        baseCtx.fillRect(0, 0, width, height);
+
+        // 每帧变化的区域: 书籍外扩光晕和模糊的范围
+        const margin = HIGHLIGHT_MAX_GLOW + HIGHLIGHT_MAX_BLUR + 2;
+        const bounds = geometry.polygon ? {
+            x0: Math.min(...geometry.polygon.map(p => p[0])), y0: Math.min(...geometry.polygon.map(p => p[1])),
+            x1: Math.max(...geometry.polygon.map(p => p[0])), y1: Math.max(...geometry.polygon.map(p => p[1]))
+        } : { x0: geometry.x, y0: geometry.y, x1: geometry.x + geometry.w, y1: geometry.y + geometry.h };
+        const px0 = Math.max(0, bounds.x0 - margin);
+        const py0 = Math.max(0, bounds.y0 - margin);
+        const px1 = Math.min(width, bounds.x1 + margin);
+        const py1 = Math.min(height, bounds.y1 + margin);
+        const patch = { x: px0, y: py0, w: Math.max(1, px1 - px0), h: Math.max(1, py1 - py0) };
+
+        const frames = [];
+        for (let i = 0; i < HIGHLIGHT_FRAMES; i++) {
+            frames.push(renderGlowFrame(i, base, geometry, patch, title, settings, request.book_name));
+        }
+
+        this.canvas.width = width;
+        this.canvas.height = height;
+        this.ctx.drawImage(base, 0, 0);
+        drawTitle(this.ctx, request.book_name, title, settings);
+
+        let index = 0;
+        const tick = () => {
+            this.ctx.drawImage(frames[index], patch.x, patch.y);
+            index = (index + 1) % HIGHLIGHT_FRAMES;
+            this.timer = setTimeout(tick, HIGHLIGHT_FRAME_MS);
+        };
+        tick();
+        return true;
+    }
+
+    // 停止播放并放弃尚未完成的 show
+    clear() {
+        this.generation++;
+        this.stop();
+    }
+
+    stop() {
+        if (this.timer !== null) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+    }
+}
+
+// Worker 模式: 接收页面转交的 OffscreenCanvas 和高亮请求
+if (typeof WorkerGlobalScope !== 'undefined' && self instanceof WorkerGlobalScope) {
+    let animator = null;
+    self.onmessage = async (e) => {
+        const message = e.data;
+        if (message.type === 'init') {
+            animator = new HighlightAnimator(message.canvas);
+        } else if (message.type === 'show') {
+            try {
+                const shown = await animator.show(message.request);
+                self.postMessage({ type: 'shown', id: message.id, superseded: !shown });
+            } catch (error) {
+                self.postMessage({ type: 'error', id: message.id, error: String(error && error.message || error) });
+            }
+        } else if (message.type === 'clear' && animator) {
+            animator.clear();
+        }
+    };
+}
@@ -0,0 +1,188 @@
+"""
+静态文件指纹与预压缩
+把 static/ 下的文件复制到 STATIC_BUILD_DIR，文件名加上内容哈希（js/app.js -> js/app.<哈希>.js），
+并预先生成 .gz（以及安装了 brotli 时的 .br）压缩版本
+
+- 模板中用 {{ asset_url('js/app.js') }} 引用静态文件，得到 /assets/js/app.<哈希>.js；
+  文件内容变化后地址随之变化，因此可以设置一年有效期（Cache-Control: immutable）
+- /assets/ 按浏览器的 Accept-Encoding 直接发送预先压缩好的文件，请求时不需要压缩
+- 第一次请求时自动构建，源文件变化后（开发时）自动重新构建；部署时也可以预先构建:
+    python static_assets.py
+
+目录结构:
+    STATIC_BUILD_DIR/manifest.json          （源文件名 -> 带哈希的文件名）
+    STATIC_BUILD_DIR/js/app.<哈希>.js
+    STATIC_BUILD_DIR/js/app.<哈希>.js.gz
+    STATIC_BUILD_DIR/js/app.<哈希>.js.br
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+
+from werkzeug.security import safe_join
+
+import compression
+import metrics
+from logs import get_logger
+
+STATIC_DIR = os.environ.get('STATIC_DIR', 'static')
+STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR', 'static_build')
+# 需要预先压缩的文件类型（图片等已压缩的格式不再压缩）
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.svg', '.json', '.txt', '.map'}
+# 检查源文件是否变化的最短间隔（秒）
+CHECK_INTERVAL = 2.0
+
+_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[A-Za-z0-9]+$')
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+# (源文件指纹, 清单, 带哈希的文件名集合)
+_state = (None, {}, frozenset())
+_last_check = 0.0
+
+
+def _source_files(static_dir):
+    """static/ 下的所有文件（相对路径，使用 / 分隔）"""
+    files = []
+    for root, _, names in os.walk(static_dir):
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            files.append(os.path.relpath(path, static_dir).replace(os.sep, '/'))
+    return sorted(files)
+
+
+def _fingerprint(static_dir):
+    entries = []
+    for rel in _source_files(static_dir):
+        st = os.stat(os.path.join(static_dir, rel))
+        entries.append((rel, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def _hashed_name(rel, data):
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(path, data):
+    """先写临时文件再改名（多个进程同时构建时不会读到写到一半的文件）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.static-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build(static_dir=STATIC_DIR, build_dir=STATIC_BUILD_DIR):
+    """
+    构建带哈希的静态文件和压缩版本（已存在的文件跳过）
+    返回: 清单 {源文件名: 带哈希的文件名}
+    """
+    manifest = {}
+    with metrics.span('static.build'):
+        for rel in _source_files(static_dir):
+            with open(os.path.join(static_dir, rel), 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(rel, data)
+            manifest[rel] = hashed
+            target = os.path.join(build_dir, hashed)
+            if not os.path.exists(target):
+                _write(target, data)
+            if os.path.splitext(rel)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                if encoding not in compression.available_encodings() or os.path.exists(target + suffix):
+                    continue
+                body = compression.compress(data, encoding, best=True)
+                if len(body) < len(data):
+                    _write(target + suffix, body)
+        _write(os.path.join(build_dir, 'manifest.json'),
+               json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return manifest
+
+
+def _current():
+    """当前清单（源文件变化时重新构建）"""
+    global _state, _last_check
+    now = time.monotonic()
+    if _state[0] is not None and now - _last_check < CHECK_INTERVAL:
+        return _state
+    with _lock:
+        if _state[0] is not None and time.monotonic() - _last_check < CHECK_INTERVAL:
+            return _state
+        fingerprint = _fingerprint(STATIC_DIR)
+        if fingerprint != _state[0]:
+            try:
+                manifest = build()
+                logger.info('静态文件已构建', extra={'files': len(manifest), 'build_dir': STATIC_BUILD_DIR,
+                                                'encodings': list(compression.available_encodings())})
+            except OSError as e:
+                # 只读文件系统（如 Serverless）: 使用普通的 /static/ 地址，源文件变化前不再重试
+                logger.warning('静态文件构建失败，使用原始地址', extra={'build_dir': STATIC_BUILD_DIR,
+                                                          'error': str(e)})
+                manifest = {}
+            _state = (fingerprint, manifest, frozenset(manifest.values()))
+        _last_check = time.monotonic()
+        return _state
+
+
+def asset_url(filename):
+    """静态文件的带哈希地址（模板中使用）；文件不存在时返回普通的 /static/ 地址"""
+    try:
+        hashed = _current()[1].get(filename)
+    except OSError:
+        hashed = None
+    if hashed is None:
+        return f"/static/{filename}"
+    return f"/assets/{hashed}"
+
+
+def resolve(name, accept_encoding):
+    """
+    带哈希的文件名对应的文件
+    返回: (文件路径, 编码或 None, MIME 类型)；文件不存在时返回 None
+    """
+    try:
+        _, _, hashed_names = _current()
+    except OSError:
+        hashed_names = frozenset()
+    path = safe_join(STATIC_BUILD_DIR, name)
+    if path is None:
+        return None
+    if name not in hashed_names:
+        # 旧版本的文件（部署前打开的页面仍然引用）: 文件名带哈希且文件仍在时继续提供
+        if not _HASHED_NAME.search(name) or not os.path.isfile(path):
+            return None
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    available = [encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                 if os.path.exists(path + suffix)]
+    encoding = compression.choose_encoding(accept_encoding, available) if available else None
+    if encoding is not None:
+        path += '.br' if encoding == 'br' else '.gz'
+    return path, encoding, mimetype
+
+
+def main():
+    manifest = build()
+    print(f"✅ 已构建 {len(manifest)} 个静态文件 -> {STATIC_BUILD_DIR}"
+          f"（压缩: {', '.join(compression.available_encodings())}）")
+    for rel, hashed in manifest.items():
+        print(f"   {rel} -> {hashed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+合成数据生成器
+生成大规模书籍目录和对应的书架图片，用于离线运行基准测试和压力测试
+
+- 书籍目录写成与 book_database.py 相同的格式（BookDatabase 子类），
+  通过 BOOK_DATABASE_FILE 环境变量即可让 app.py / catalogue.py 直接使用
+- 每本书都有四点定位（略微倾斜的书脊多边形）和对应的矩形 position
+- 书名由模板和词表组合；按 collision_rate 生成同名的其他版本/分卷（关键词加后缀区分），
+  并有部分书名全小写，与其他书的关键词相同，模拟真实数据中的关键词冲突
+- 书架图片按目录中的四点位置绘制书脊和隔板，分辨率可配置（最高 8K）
+
+用法:
+    python synthetic_data.py --books 10000 --output synthetic/book_database.py \\
+        --image synthetic/bookshelf.jpg --resolution 3840x2160
+
+    BOOK_DATABASE_FILE=synthetic/book_database.py BOOKSHELF_IMAGE=synthetic/bookshelf.jpg \\
+        gunicorn -c gunicorn_config.py app:app
+"""
+
+import argparse
+import math
+import os
+import random
+import string
+
+# 最大分辨率（8K）
+MAX_RESOLUTION = (7680, 4320)
+
+ADJECTIVES = [
+    'social', 'digital', 'lean', 'good', 'human', 'open', 'hidden', 'invisible', 'radical', 'quiet',
+    'convivial', 'critical', 'speculative', 'urban', 'visual', 'sustainable', 'inclusive', 'new',
+    'everyday', 'collective', 'practical', 'essential', 'complete', 'modern', 'public'
+]
+NOUNS = [
+    'design', 'users', 'information', 'impact', 'toolbox', 'justice', 'systems', 'cities', 'data',
+    'interaction', 'futures', 'objects', 'services', 'research', 'thinking', 'innovation', 'media',
+    'communities', 'machines', 'interfaces', 'patterns', 'stories', 'materials', 'spaces', 'maps',
+    'networks', 'ethics', 'typography', 'photography', 'architecture', 'products', 'games'
+]
+VERBS = ['rethinking', 'designing', 'making', 'building', 'seeing', 'mapping', 'understanding',
+         'changing', 'measuring', 'prototyping']
+SUBTITLES = [
+    'A Practical Guide', 'The Design Guide to {noun}', 'How Designers Can Change the World',
+    'Community-Led Practices', 'An Introduction', 'Principles and Methods', 'A Field Guide',
+    'Notes on {noun} and {noun2}', 'Case Studies in {noun}', 'What Everyone Should Know'
+]
+TEMPLATES = [
+    '{adj} {noun}', 'the {adj} life of {noun}', '{verb} {noun}', '{noun} by design',
+    'the {noun} of {noun2}', '{adj} {noun} and {noun2}', 'do {adj} {noun}', '{noun} {noun2}'
+]
+# 同名书籍的区分后缀（不同版本、分卷）
+EDITION_SUFFIXES = ['2', 'vol 2', 'workbook', 'second edition', 'revised', 'reader', 'companion']
+STOP_WORDS = ['the', 'a', 'find', 'book', 'of', 'for', 'search']
+
+
+def _make_title(rng):
+    """生成一个书名，返回 (关键词, 完整书名)"""
+    parts = {
+        'adj': rng.choice(ADJECTIVES),
+        'noun': rng.choice(NOUNS),
+        'noun2': rng.choice(NOUNS),
+        'verb': rng.choice(VERBS)
+    }
+    key = rng.choice(TEMPLATES).format(**parts)
+    full_name = key
+    if rng.random() < 0.5:
+        subtitle = rng.choice(SUBTITLES).format(noun=parts['noun'].title(), noun2=parts['noun2'].title())
+        full_name = f"{key}: {subtitle}"
+    style = rng.random()
+    if style < 0.5:
+        full_name = full_name.upper()
+    elif style < 0.9:
+        full_name = string.capwords(full_name)
+    # 其余保持小写（与关键词完全相同，用于测试关键词冲突）
+    return key, full_name
+
+
+def _make_titles(count, rng, collision_rate):
+    """生成 count 个互不相同的关键词和书名"""
+    titles = {}
+    keys = []
+    while len(titles) < count:
+        if keys and rng.random() < collision_rate:
+            # 已有书籍的其他版本：同样的书名，关键词加后缀区分
+            base_key = rng.choice(keys)
+            suffix = rng.choice(EDITION_SUFFIXES)
+            key = f"{base_key} {suffix}"
+            full_name = f"{titles[base_key]} ({suffix.title()})"
+        else:
+            key, full_name = _make_title(rng)
+        if key in titles:
+            # 模板组合重复时加编号
+            key = f"{key} {len(titles)}"
+        titles[key] = full_name
+        keys.append(key)
+    return titles
+
+
+def _round_point(x, y):
+    return (round(min(max(x, 0.0), 1.0), 4), round(min(max(y, 0.0), 1.0), 4))
+
+
+def generate_catalogue(count, seed=42, shelves=None, collision_rate=0.05):
+    """
+    生成合成书籍目录（与 BookDatabase.books 格式相同）
+    count: 书籍数量
+    shelves: 书架层数（默认按数量自动计算）
+    collision_rate: 生成同名书籍（其他版本/分卷）的比例
+    返回: {关键词: {"position", "points", "shelf", "full_name"}}
+    """
+    rng = random.Random(seed)
+    titles = _make_titles(count, rng, collision_rate)
+    # 书架上的顺序与书名无关
+    keys = list(titles)
+    rng.shuffle(keys)
+
+    shelves = shelves or max(2, round(math.sqrt(count / 10)))
+    per_shelf = math.ceil(count / shelves)
+    margin_x, margin_y = 0.02, 0.03
+    shelf_height = (1 - margin_y * 2) / shelves
+
+    books = {}
+    for shelf in range(shelves):
+        row = keys[shelf * per_shelf:(shelf + 1) * per_shelf]
+        if not row:
+            break
+        # 书脊宽度按随机权重分配整层宽度，书与书之间留少量空隙
+        weights = [rng.uniform(0.6, 1.6) for _ in row]
+        scale = (1 - margin_x * 2) / sum(weights)
+        bottom = margin_y + (shelf + 1) * shelf_height - shelf_height * 0.05
+        x = margin_x
+        for key, weight in zip(row, weights):
+            slot = weight * scale
+            w = slot * 0.9
+            h = shelf_height * rng.uniform(0.6, 0.88)
+            top = bottom - h
+            # 书脊略微倾斜：上边相对下边水平偏移
+            lean = rng.uniform(-0.25, 0.25) * w
+            points = [
+                _round_point(x + lean, top),
+                _round_point(x + w + lean, top),
+                _round_point(x + w, bottom),
+                _round_point(x, bottom)
+            ]
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            x_min, x_max, y_min, y_max = min(xs), max(xs), min(ys), max(ys)
+            books[key] = {
+                "position": (round((x_min + x_max) / 2, 4), round((y_min + y_max) / 2, 4),
+                             round(x_max - x_min, 4), round(y_max - y_min, 4)),
+                "points": points,
+                "shelf": shelf,
+                "full_name": titles[key]
+            }
+            x += slot
+    return books
+
+
+def generate_queries(books, count=200, seed=7):
+    """
+    生成带噪声的查询，模拟语音识别结果
+    类型: exact / stop_words / upper / typo / missing_word / unrelated
+    返回: [(类型, 查询字符串), ...]
+    """
+    rng = random.Random(seed)
+    keys = list(books.keys())
+    queries = []
+    for i in range(count):
+        key = rng.choice(keys)
+        words = key.split()
+        kind = ['exact', 'stop_words', 'upper', 'typo', 'missing_word', 'unrelated'][i % 6]
+        if kind == 'exact':
+            query = key
+        elif kind == 'stop_words':
+            query = f"find the {key} book"
+        elif kind == 'upper':
+            query = key.upper()
+        elif kind == 'typo':
+            word = max(words, key=len)
+            pos = rng.randrange(len(word))
+            typo = word[:pos] + rng.choice(string.ascii_lowercase) + word[pos + 1:]
+            query = key.replace(word, typo, 1)
+        elif kind == 'missing_word':
+            query = ' '.join(words[:-1]) if len(words) > 2 else words[0]
+        else:
+            query = ' '.join(rng.choice(STOP_WORDS) for _ in range(2)) + ' zzqx'
+        queries.append((kind, query))
+    return queries
+
+
+def generate_shelf_image(path, width, height, books, seed=3):
+    """
+    按目录中的四点位置绘制书架图片（书脊多边形 + 每层隔板）
+    width / height: 图片分辨率，最大 7680x4320
+    """
+    import cv2
+    import numpy as np
+
+    if width * height > MAX_RESOLUTION[0] * MAX_RESOLUTION[1]:
+        raise ValueError(f"分辨率过大: {width}x{height}（最大 {MAX_RESOLUTION[0]}x{MAX_RESOLUTION[1]}）")
+
+    rng = np.random.default_rng(seed)
+    # 木纹背景
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = (40, 62, 92)
+    grain = rng.integers(-12, 12, (height, 1, 1), dtype=np.int16)
+    image = np.clip(image.astype(np.int16) + grain, 0, 255).astype(np.uint8)
+
+    shelf_bottoms = {}
+    colors = rng.integers(35, 225, (len(books), 3))
+    for (key, info), color in zip(books.items(), colors):
+        points = info.get('points')
+        if not points:
+            cx, cy, w, h = info['position']
+            points = [(cx - w / 2, cy - h / 2), (cx + w / 2, cy - h / 2),
+                      (cx + w / 2, cy + h / 2), (cx - w / 2, cy + h / 2)]
+        pts = np.array([(int(px * width), int(py * height)) for px, py in points], np.int32)
+        color = tuple(int(c) for c in color)
+        cv2.fillPoly(image, [pts], color)
+        # 书脊上的书名标签区域（浅色横条）
+        top_y, bottom_y = int(pts[:, 1].min()), int(pts[:, 1].max())
+        label_y = top_y + (bottom_y - top_y) // 4
+        label_h = max(1, (bottom_y - top_y) // 8)
+        cv2.fillPoly(image, [np.array([
+            (pts[0][0], label_y), (pts[1][0], label_y),
+            (pts[1][0], label_y + label_h), (pts[0][0], label_y + label_h)
+        ], np.int32)], tuple(min(255, c + 60) for c in color))
+        shelf_bottoms[info['shelf']] = max(shelf_bottoms.get(info['shelf'], 0), bottom_y)
+
+    # 隔板
+    board = max(2, height // 150)
+    for bottom_y in shelf_bottoms.values():
+        cv2.rectangle(image, (0, bottom_y), (width, bottom_y + board), (25, 40, 60), -1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if not cv2.imwrite(path, image):
+        raise IOError(f"无法保存图片: {path}")
+
+
+def write_database(path, books):
+    """
+    写出 book_database.py 格式的数据库文件
+    生成的 BookDatabase 继承项目中的 BookDatabase（复用搜索等方法），只替换书籍数据
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('"""\n合成书籍数据库（由 synthetic_data.py 生成）\n'
+                f'共 {len(books)} 本书\n"""\n\n'
+                'from book_database import BookDatabase as _BookDatabase\n\n'
+                'class BookDatabase(_BookDatabase):\n'
+                '    def __init__(self):\n'
+                '        super().__init__()\n'
+                '        self.books = {\n')
+        for key, info in books.items():
+            points = ', '.join(f"({x:.4f}, {y:.4f})" for x, y in info['points'])
+            f.write(f'            "{key}": {{\n'
+                    f'                "position": ({", ".join(f"{v:.4f}" for v in info["position"])}),\n'
+                    f'                "points": [{points}],\n'
+                    f'                "shelf": {info["shelf"]},\n'
+                    f'                "full_name": "{info["full_name"]}"\n'
+                    '            },\n')
+        f.write('        }\n')
+
+
+def parse_resolution(text):
+    """解析 1920x1080 形式的分辨率"""
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分辨率格式错误: {text}（示例: 3840x2160）")
+    if width <= 0 or height <= 0 or width * height > MAX_RESOLUTION[0] * MAX_RESOLUTION[1]:
+        raise argparse.ArgumentTypeError(f"分辨率超出范围: {text}（最大 {MAX_RESOLUTION[0]}x{MAX_RESOLUTION[1]}）")
+    return width, height
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成书籍目录和书架图片')
+    parser.add_argument('--books', type=int, default=10000, help='书籍数量（默认 10000）')
+    parser.add_argument('--output', default='synthetic/book_database.py', help='数据库文件路径')
+    parser.add_argument('--image', default='synthetic/bookshelf.jpg', help='书架图片路径（设为空则不生成）')
+    parser.add_argument('--resolution', type=parse_resolution, default=(3840, 2160),
+                        help='书架图片分辨率（默认 3840x2160，最大 7680x4320）')
+    parser.add_argument('--shelves', type=int, help='书架层数（默认按书籍数量计算）')
+    parser.add_argument('--collision-rate', type=float, default=0.05, help='同名书籍比例（默认 0.05）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    books = generate_catalogue(args.books, seed=args.seed, shelves=args.shelves,
+                               collision_rate=args.collision_rate)
+    write_database(args.output, books)
+    print(f"✅ 数据库已生成: {args.output} ({len(books)} 本书, {os.path.getsize(args.output)} 字节)")
+
+    if args.image:
+        width, height = args.resolution
+        generate_shelf_image(args.image, width, height, books, seed=args.seed)
+        print(f"✅ 书架图片已生成: {args.image} ({width}x{height})")
+
+    print(f"\n使用合成数据启动服务器:")
+    print(f"   BOOK_DATABASE_FILE={args.output} BOOKSHELF_IMAGE={args.image} "
+          f"gunicorn -c gunicorn_config.py app:app")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+坐标参数测试: nan、inf 等非有限值返回 400（不进入空间索引）
+运行: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 测试时不启动后台预取
+os.environ.setdefault('PREFETCH', '0')
+
+from app import app  # noqa: E402
+
+
+@pytest.mark.parametrize('x, y', [('nan', '0.5'), ('0.5', 'inf'), ('-inf', '0.5'), ('abc', '0.5')])
+def test_books_at_rejects_non_finite_coordinates(x, y):
+    response = app.test_client().get(f'/api/books/at?x={x}&y={y}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
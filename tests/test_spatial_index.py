@@ -0,0 +1,56 @@
+"""
+空间索引测试: 相邻书籍（共享一条边）不算重叠，公共边上的点不算命中
+运行: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial_index import SpatialIndex, book_polygon, polygons_intersect  # noqa: E402
+
+# 两本相邻的书: 左边的书右边缘 x=0.5 与右边的书左边缘重合
+ADJACENT_BOOKS = {
+    "left": {"position": (0.45, 0.5, 0.1, 0.4), "shelf": 0, "full_name": "LEFT"},
+    "right": {"position": (0.55, 0.5, 0.1, 0.4), "shelf": 0, "full_name": "RIGHT"},
+}
+
+
+def test_adjacent_books_do_not_overlap():
+    index = SpatialIndex(ADJACENT_BOOKS)
+    assert index.overlapping(book_polygon(ADJACENT_BOOKS["left"]), exclude="left") == []
+    assert index.overlapping(book_polygon(ADJACENT_BOOKS["right"]), exclude="right") == []
+
+
+def test_adjacent_four_point_books_do_not_overlap():
+    # 倾斜的书脊共享一条斜边
+    books = {
+        "a": {"position": (0.45, 0.5, 0.1, 0.4), "points": [(0.4, 0.3), (0.5, 0.3), (0.52, 0.7), (0.42, 0.7)],
+              "shelf": 0, "full_name": "A"},
+        "b": {"position": (0.55, 0.5, 0.1, 0.4), "points": [(0.5, 0.3), (0.6, 0.3), (0.62, 0.7), (0.52, 0.7)],
+              "shelf": 0, "full_name": "B"},
+    }
+    assert not polygons_intersect(book_polygon(books["a"]), book_polygon(books["b"]))
+    assert SpatialIndex(books).overlapping(book_polygon(books["a"]), exclude="a") == []
+
+
+def test_point_on_shared_edge_hits_neither_book():
+    index = SpatialIndex(ADJACENT_BOOKS)
+    assert index.at(0.5, 0.5) == []
+    assert index.at(0.49, 0.5) == ["left"]
+    assert index.at(0.51, 0.5) == ["right"]
+
+
+def test_overlapping_books_are_still_found():
+    books = dict(ADJACENT_BOOKS, middle={"position": (0.5, 0.5, 0.04, 0.2), "shelf": 0, "full_name": "MIDDLE"})
+    index = SpatialIndex(books)
+    assert sorted(index.overlapping(book_polygon(books["middle"]), exclude="middle")) == ["left", "right"]
+    # 完全相同的形状也算重叠
+    assert polygons_intersect(book_polygon(books["left"]), book_polygon(books["left"]))
+
+
+def test_region_touching_a_book_edge_does_not_select_it():
+    index = SpatialIndex(ADJACENT_BOOKS)
+    assert index.region(0.5, 0.3, 0.7, 0.7) == ["right"]
+    assert sorted(index.region(0.3, 0.3, 0.7, 0.7, contains=True)) == ["left", "right"]
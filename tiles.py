@@ -0,0 +1,210 @@
+"""
+书架图片瓦片金字塔
+把书架照片预先缩小成多个层级，每层切成固定大小的瓦片保存在磁盘上，
+编辑器和预览只下载当前显示尺寸需要的层级和瓦片，不必每次加载原图
+
+- 第 0 层是原图，第 n 层宽高为原图的 1/2^n，直到整张图能放进一个瓦片为止
+- 每层保存瓦片（<列>_<行>.jpg）和整张缩小图（level.jpg，渲染预览时使用）
+- 目录以图片内容的哈希命名（内容寻址），图片不变时地址不变，可以长期缓存；
+  图片替换后生成新目录，旧目录可以直接删除
+- 第一次请求时自动生成（多个进程同时生成时只保留一份），也可以用命令行预先生成:
+    python tiles.py bookshelf.jpg shelves/a2.jpg
+
+目录结构:
+    TILE_DIR/<图片哈希>/manifest.json
+    TILE_DIR/<图片哈希>/<层级>/level.jpg
+    TILE_DIR/<图片哈希>/<层级>/<列>_<行>.jpg
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import metrics
+from logs import get_logger
+
+TILE_DIR = os.environ.get('TILE_DIR', 'tile_cache')
+# 瓦片边长（像素）
+TILE_SIZE = int(os.environ.get('TILE_SIZE', 256))
+TILE_QUALITY = 85
+# 清单格式版本（格式变化时递增，旧目录不再使用）
+MANIFEST_VERSION = 1
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+# 图片路径 -> ((mtime_ns, size), 清单)，避免每次请求都重新计算图片哈希
+_manifests = {}
+
+
+def image_fingerprint(image_path):
+    """图片内容哈希（瓦片目录名）"""
+    digest = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(f"v{MANIFEST_VERSION}-{TILE_SIZE}".encode('ascii'))
+    return digest.hexdigest()[:20]
+
+
+def _level_sizes(width, height):
+    sizes = [(width, height)]
+    while sizes[-1][0] > TILE_SIZE or sizes[-1][1] > TILE_SIZE:
+        w, h = sizes[-1]
+        sizes.append((max(1, (w + 1) // 2), max(1, (h + 1) // 2)))
+    return sizes
+
+
+def _write_pyramid(image_path, target):
+    """生成金字塔到 target 目录，返回清单"""
+    import cv2
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"无法读取图片: {image_path}")
+    height, width = image.shape[:2]
+    params = [cv2.IMWRITE_JPEG_QUALITY, TILE_QUALITY]
+
+    levels = []
+    level_image = image
+    for level, (w, h) in enumerate(_level_sizes(width, height)):
+        if level > 0:
+            level_image = cv2.resize(level_image, (w, h), interpolation=cv2.INTER_AREA)
+        level_dir = os.path.join(target, str(level))
+        os.makedirs(level_dir)
+        cols = (w + TILE_SIZE - 1) // TILE_SIZE
+        rows = (h + TILE_SIZE - 1) // TILE_SIZE
+        for row in range(rows):
+            for col in range(cols):
+                tile = level_image[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE]
+                cv2.imwrite(os.path.join(level_dir, f"{col}_{row}.jpg"), tile, params)
+        cv2.imwrite(os.path.join(level_dir, 'level.jpg'), level_image, params)
+        levels.append({'level': level, 'width': w, 'height': h, 'cols': cols, 'rows': rows,
+                       'scale': w / width})
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'width': width,
+        'height': height,
+        'tile_size': TILE_SIZE,
+        'levels': levels
+    }
+    with open(os.path.join(target, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def ensure_pyramid(image_path):
+    """
+    返回图片的瓦片清单（没有时先生成）
+    清单额外包含 id（图片哈希，即瓦片目录名）
+    """
+    st = os.stat(image_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    key = os.path.abspath(image_path)
+    cached = _manifests.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _lock:
+        cached = _manifests.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        fingerprint = image_fingerprint(image_path)
+        directory = os.path.join(TILE_DIR, fingerprint)
+        manifest_path = os.path.join(directory, 'manifest.json')
+        hit = os.path.exists(manifest_path)
+        metrics.count_cache('tile_pyramid', hit)
+        if hit:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            os.makedirs(TILE_DIR, exist_ok=True)
+            # 先生成到临时目录再改名，其他进程不会看到生成到一半的目录
+            staging = tempfile.mkdtemp(prefix=f".{fingerprint}-", dir=TILE_DIR)
+            try:
+                with metrics.span('tiles.build'):
+                    manifest = _write_pyramid(image_path, staging)
+                try:
+                    os.rename(staging, directory)
+                except OSError:
+                    # 其他进程已经生成
+                    shutil.rmtree(staging, ignore_errors=True)
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            logger.info('瓦片金字塔已生成', extra={'image': image_path, 'id': fingerprint,
+                                            'levels': len(manifest['levels'])})
+
+        manifest = dict(manifest, id=fingerprint)
+        _manifests[key] = (stamp, manifest)
+        return manifest
+
+
+def tile_path(pyramid_id, level, name):
+    """瓦片（或 level.jpg）的文件路径；参数不合法或文件不存在时返回 None"""
+    if not (len(pyramid_id) == 20 and all(c in '0123456789abcdef' for c in pyramid_id)):
+        return None
+    if not str(level).isdigit():
+        return None
+    path = os.path.join(TILE_DIR, pyramid_id, str(int(level)), name)
+    return path if os.path.isfile(path) else None
+
+
+def choose_level(manifest, max_width=None, max_height=None):
+    """
+    满足目标尺寸的最小层级（宽高都不小于目标尺寸；没有目标尺寸时为原图）
+    返回清单中该层的信息
+    """
+    chosen = manifest['levels'][0]
+    for level in manifest['levels']:
+        if (max_width is not None and level['width'] < max_width) or \
+                (max_height is not None and level['height'] < max_height):
+            break
+        chosen = level
+    return chosen
+
+
+def level_image_path(image_path, max_width=None, max_height=None):
+    """
+    适合目标尺寸的缩小图路径（不需要缩小或无法生成金字塔时返回原图路径）
+    返回: (图片路径, 相对原图的缩放比例)
+    """
+    if max_width is None and max_height is None:
+        return image_path, 1.0
+    try:
+        manifest = ensure_pyramid(image_path)
+    except (OSError, ValueError) as e:
+        logger.warning('瓦片金字塔不可用，使用原图', extra={'image': image_path, 'error': str(e)})
+        return image_path, 1.0
+    level = choose_level(manifest, max_width, max_height)
+    if level['level'] == 0:
+        return image_path, 1.0
+    path = tile_path(manifest['id'], level['level'], 'level.jpg')
+    if path is None:
+        return image_path, 1.0
+    return path, level['scale']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成书架图片的瓦片金字塔')
+    parser.add_argument('images', nargs='+', help='书架图片路径')
+    args = parser.parse_args()
+
+    for image_path in args.images:
+        if not os.path.exists(image_path):
+            print(f"❌ 图片不存在: {image_path}")
+            continue
+        manifest = ensure_pyramid(image_path)
+        tiles = sum(level['cols'] * level['rows'] for level in manifest['levels'])
+        print(f"✅ {image_path}: {manifest['width']}x{manifest['height']}，"
+              f"{len(manifest['levels'])} 层，{tiles} 个瓦片 -> {os.path.join(TILE_DIR, manifest['id'])}")
+
+
+if __name__ == '__main__':
+    main()
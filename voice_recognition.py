@@ -3,19 +3,19 @@
 使用麦克风接收语音输入并转换为文本
 """
 
-import speech_recognition as sr
 import threading
 import subprocess
 import platform
 import sys
 
-# 尝试导入 pyttsx3，如果失败则使用系统命令
-try:
-    import pyttsx3
-    TTS_AVAILABLE = True
-except Exception as e:
-    TTS_AVAILABLE = False
-    print(f"注意: pyttsx3 不可用，将使用系统 say 命令: {e}")
+# speech_recognition（及 pyaudio）导入较慢，麦克风校准需要 1 秒:
+# 在第一次监听时才导入和校准，只需要语音输出（文字输入模式）时不打开麦克风
+
+
+def _speech_recognition():
+    """导入 speech_recognition（第一次调用时导入）"""
+    import speech_recognition
+    return speech_recognition
 
 class VoiceRecognizer:
     def __init__(self, language='en-US'):
@@ -23,8 +23,9 @@ class VoiceRecognizer:
         初始化语音识别器
         language: 语言代码，'zh-CN' 为中文，'en-US' 为英文
         """
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+        # 识别器和麦克风在第一次监听时创建并校准
+        self.recognizer = None
+        self.microphone = None
         self.language = language
         self.tts_engine = None
         self.use_system_say = False
@@ -33,7 +34,13 @@ class VoiceRecognizer:
         lang_name = "英文" if language == 'en-US' else "中文"
         print(f"语音识别语言: {lang_name} ({language})")
         
-        # 尝试初始化 TTS 引擎
+        # 尝试初始化 TTS 引擎（pyttsx3 不可用时使用系统命令）
+        try:
+            import pyttsx3
+            TTS_AVAILABLE = True
+        except Exception as e:
+            TTS_AVAILABLE = False
+            print(f"注意: pyttsx3 不可用，将使用系统 say 命令: {e}")
         if TTS_AVAILABLE:
             try:
                 self.tts_engine = pyttsx3.init()
@@ -56,12 +63,20 @@ class VoiceRecognizer:
                 print("将使用 macOS say 命令进行语音输出")
             else:
                 print("警告: 当前系统不支持语音输出")
-        
+    
+    def _ensure_microphone(self):
+        """创建识别器和麦克风，并校准环境噪音（第一次监听时调用）"""
+        if self.microphone is not None:
+            return
+        sr = _speech_recognition()
+        self.recognizer = sr.Recognizer()
+        microphone = sr.Microphone()
         # 调整环境噪音
         print("正在校准麦克风，请保持安静...")
-        with self.microphone as source:
+        with microphone as source:
             self.recognizer.adjust_for_ambient_noise(source, duration=1)
         print("校准完成！")
+        self.microphone = microphone
     
     def listen(self, timeout=5, phrase_time_limit=5):
         """
@@ -70,7 +85,9 @@ class VoiceRecognizer:
         phrase_time_limit: 短语最大长度（秒）
         返回: 识别的文本或 None
         """
+        sr = _speech_recognition()
         try:
+            self._ensure_microphone()
             with self.microphone as source:
                 print(f"🎤 正在监听...（{timeout}秒超时，请说话）")
                 audio = self.recognizer.listen(